@@ -1,13 +1,26 @@
 # -*- coding: utf-8 -*-
 """High level api functions for reading and writing blockchain data."""
+import csv
+import io
+import json
 import logging
+import os
+import time
 import ubjson
 from binascii import hexlify, unhexlify
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
 from typing import Optional, NewType, List
 
+import requests
+from mcrpc.exceptions import RpcError
+
 import app
 from app.backend.rpc import get_active_rpc_client
-from app.exceptions import RpcResponseError
+from app.exceptions import RpcResponseError, WalletExportError
+from app.tools.hashing import FileHasher
 
 log = logging.getLogger(__name__)
 
@@ -34,18 +47,18 @@ Form = NewType('Form', dict)
 # timestamp api
 
 
+def timestamp_data_hex(comment: str='') -> str:
+    if not comment:
+        return ''
+    return hexlify(ubjson.dumpb(dict(comment=comment))).decode('utf-8')
+
+
 def put_timestamp(hexhash: str, comment: str='', stream=app.STREAM_TIMESTAMP) -> Optional[TxId]:
 
     client = get_active_rpc_client()
 
     try:
-        if comment:
-            data = dict(comment=comment)
-            serialized = ubjson.dumpb(data)
-            data_hex = hexlify(serialized).decode('utf-8')
-            response = client.publish(stream, hexhash, data_hex)
-        else:
-            response = client.publish(stream, hexhash, "")
+        response = client.publish(stream, hexhash, timestamp_data_hex(comment))
         return TxId(response)
 
     except Exception as e:
@@ -53,6 +66,384 @@ def put_timestamp(hexhash: str, comment: str='', stream=app.STREAM_TIMESTAMP) ->
         raise RpcResponseError(str(e))
 
 
+def put_timestamps(hexhashes: List[str], comment: str='', stream=app.STREAM_TIMESTAMP) -> Optional[TxId]:
+    """Publish several timestamps as stream items of a single transaction"""
+    from app.models import Profile, profile_session_scope
+
+    client = get_active_rpc_client()
+    with profile_session_scope() as session:
+        address = Profile.get_active(session).address
+
+    data_hex = timestamp_data_hex(comment)
+    items = [{'for': stream, 'key': hexhash, 'data': data_hex} for hexhash in hexhashes]
+    try:
+        response = client.createrawsendfrom(address, {}, items, 'send')
+        return TxId(response)
+
+    except Exception as e:
+        log.debug(e)
+        raise RpcResponseError(str(e))
+
+
+def file_sha256(file_path: str) -> str:
+    return FileHasher(file_path).run().sha256
+
+
+def _file_sha256_or_none(file_path: str) -> Optional[str]:
+    """file_sha256 for the process pool, None if the file cannot be read anymore"""
+    try:
+        return file_sha256(file_path)
+    except OSError as e:
+        log.warning('skipping unreadable file {}: {}'.format(file_path, e))
+        return None
+
+
+def read_timestamp_manifest(manifest_path: str) -> dict:
+    """Return {path: entry} of a manifest written by timestamp_directory"""
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as infile:
+            for line in infile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line of an interrupted run
+                    continue
+                entries[entry['path']] = entry
+    return entries
+
+
+def timestamp_directory(directory: str, manifest_path: str, comment: str='', workers: int=None,
+                        progress=None) -> dict:
+    """Timestamp all files below `directory`.
+
+    Files are hashed in a process pool. Hashes that are already timestamped on
+    chain or earlier in the run are skipped, the rest is published with as many
+    stream items per transaction as the chain allows. Every processed file is
+    appended to the JSON lines manifest as {"path", "sha256", "txid"} (txid is
+    None for skipped files) right after its transaction was sent, so a run can
+    be resumed with the same manifest. The manifest itself is not timestamped.
+    Files that cannot be read (broken links, files removed during the run) are
+    skipped with a warning and retried by the next run.
+
+    :param progress: optional callable(done, total)
+    :return: counts of published, skipped, unreadable and resumed files
+    """
+    from app.models import FileFingerprint, Timestamp, profile_session_scope
+    from app.models.db import data_session_scope
+
+    manifest = read_timestamp_manifest(manifest_path)
+    manifest_path = os.path.abspath(manifest_path)
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(path for path in (os.path.abspath(os.path.join(root, name)) for name in sorted(files))
+                     if path != manifest_path)
+    todo = [path for path in paths if path not in manifest]
+    sent = {entry['sha256'] for entry in manifest.values()}
+    stats = dict(published=0, skipped=0, unreadable=0, resumed=len(paths) - len(todo))
+
+    params = get_active_rpc_client().getblockchainparams()
+    items_per_tx = max(1, params.get('max-std-op-returns-count', 1))
+
+    keys = {}
+    for path in todo:
+        try:
+            keys[path] = FileFingerprint.key(path)
+        except OSError as e:
+            log.warning('skipping unreadable file {}: {}'.format(path, e))
+            stats['unreadable'] += 1
+    todo = [path for path in todo if path in keys]
+    hashes = {}
+    with profile_session_scope() as session:
+        for path in todo:
+            cached = FileFingerprint.lookup(session, keys[path])
+            if cached is not None and cached.sha256:
+                hashes[path] = cached.sha256
+    uncached = [path for path in todo if path not in hashes]
+
+    def hashed_files():
+        yield from hashes.items()
+        with ProcessPoolExecutor(workers) as pool:
+            for path, sha256 in zip(uncached, pool.map(_file_sha256_or_none, uncached, chunksize=16)):
+                if sha256 is not None:
+                    with profile_session_scope() as session:
+                        FileFingerprint.store(session, keys[path], sha256=sha256)
+                yield path, sha256
+
+    with open(manifest_path, 'a', encoding='utf-8') as outfile:
+        def write(batch, txid):
+            for path, sha256 in batch:
+                outfile.write(json.dumps(dict(path=path, sha256=sha256, txid=txid)) + '\n')
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+        def publish(batch):
+            hexhashes = list(OrderedDict.fromkeys(sha256 for _, sha256 in batch))
+            with data_session_scope() as session:
+                existing = {hexhash for hexhash, in session.query(Timestamp.hash).filter(
+                    Timestamp.hash.in_(hexhashes))}
+            new = [hexhash for hexhash in hexhashes if hexhash not in existing]
+            txid = None
+            if new:
+                txid = put_timestamps(new, comment)
+                log.debug('published {} timestamps in {}'.format(len(new), txid))
+            write([(path, sha256) for path, sha256 in batch if sha256 not in existing], txid)
+            write([(path, sha256) for path, sha256 in batch if sha256 in existing], None)
+            stats['published'] += sum(1 for _, sha256 in batch if sha256 not in existing)
+            stats['skipped'] += sum(1 for _, sha256 in batch if sha256 in existing)
+            sent.update(hexhashes)
+
+        done = 0
+        batch = []
+        pending = set()
+        for path, sha256 in hashed_files():
+            done += 1
+            if sha256 is None:
+                stats['unreadable'] += 1
+            elif sha256 in sent:
+                # the same content was timestamped before
+                write([(path, sha256)], None)
+                stats['skipped'] += 1
+            else:
+                batch.append((path, sha256))
+                pending.add(sha256)
+                if len(pending) == items_per_tx:
+                    publish(batch)
+                    batch = []
+                    pending = set()
+            if progress is not None:
+                progress(done, len(todo))
+        if batch:
+            publish(batch)
+
+    return stats
+
+
+# wallet export api
+
+EXPORT_FIELDS = ('txid', 'time', 'confirmed', 'valid', 'type', 'comment', 'amount', 'balance')
+EXPORT_MIN_PAGE_SIZE = 10
+EXPORT_MAX_PAGE_SIZE = 5000
+#: page sizes are adapted to this response time
+EXPORT_TARGET_SECONDS = 1.0
+#: older transactions requested with every page to find the continuation if new transactions arrived
+EXPORT_MARGIN = 10
+
+
+def wallet_transaction_count(client) -> int:
+    """Number of wallet transactions, found by exponential and binary probes of single transactions"""
+    def exists(skip):
+        return bool(client.listwallettransactions(1, skip, False, False))
+
+    if not exists(0):
+        return 0
+    lo, hi = 0, 1
+    while exists(hi):
+        lo, hi = hi, hi * 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if exists(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo + 1
+
+
+def wallet_transaction_pages(client, position: int=0, last_txid: str=None, page_size: int=100):
+    """Yield pages of verbose wallet transactions oldest first, starting at `position` (counted from the oldest).
+
+    Ends with the transactions that existed at the start, a later call
+    continues with newer ones. listwallettransactions skips from the newest
+    transaction, so transactions that arrive during the export shift the
+    requested range. Every request includes EXPORT_MARGIN older transactions:
+    the page continues after `last_txid` (or at the oldest transaction) within
+    them, the count is only probed again if the shift was larger. The page
+    size is doubled or halved to keep each call near EXPORT_TARGET_SECONDS
+    and halved for good if the node fails to respond.
+    """
+    total = wallet_transaction_count(client)
+    max_page_size = EXPORT_MAX_PAGE_SIZE
+    while position < total:
+        count = min(page_size, total - position)
+        requested = count + EXPORT_MARGIN + (1 if position > 0 else 0)
+        started = time.monotonic()
+        try:
+            page = client.listwallettransactions(requested, total - position - count, False, True)
+        except (RpcError, requests.RequestException) as e:
+            if page_size <= EXPORT_MIN_PAGE_SIZE:
+                raise
+            log.debug('listwallettransactions failed with {} transactions: {}'.format(requested, e))
+            # do not grow back to the failed size
+            max_page_size = page_size = max(EXPORT_MIN_PAGE_SIZE, page_size // 2)
+            continue
+        elapsed = time.monotonic() - started
+
+        txids = [tx['txid'] for tx in page]
+        if position > 0 and last_txid in txids:
+            page = page[txids.index(last_txid) + 1:]
+        elif position > 0 or len(page) == requested:
+            # shifted by more than the margin (or the wallet changed below the position)
+            recounted = wallet_transaction_count(client)
+            if recounted == total:
+                raise WalletExportError('wallet transaction {} is not at position {} anymore'.format(
+                    last_txid, position - 1))
+            total = recounted
+            continue
+        if not page:
+            break
+
+        if elapsed < EXPORT_TARGET_SECONDS / 2:
+            page_size = min(max_page_size, page_size * 2)
+        elif elapsed > EXPORT_TARGET_SECONDS:
+            page_size = max(EXPORT_MIN_PAGE_SIZE, page_size // 2)
+        yield page
+        position += len(page)
+        last_txid = page[-1]['txid']
+
+
+def wallet_export_rows(pages, balance: Decimal=Decimal(0)):
+    """Yield export rows of wallet transaction pages with the running balance of valid confirmed transactions"""
+    from app.models import WalletTransaction
+    for page in pages:
+        for tx in page:
+            valid = tx.get('valid') is not False
+            confirmed = bool(tx.get('blocktime'))
+            amount = Decimal(tx['balance']['amount'])
+            if valid and confirmed:
+                balance += amount
+            entries = WalletTransaction.entries(tx)
+            yield OrderedDict((
+                ('txid', tx['txid']),
+                ('time', datetime.fromtimestamp(tx.get('blocktime') or tx.get('time', 0)).isoformat(' ')),
+                ('confirmed', confirmed),
+                ('valid', valid),
+                ('type', entries[0]['tx_type']),
+                ('comment', '; '.join(entry['comment'] for entry in entries if entry['comment'])),
+                ('amount', amount),
+                # unconfirmed transactions can still be dropped
+                ('balance', balance if confirmed else None),
+            ))
+
+
+def format_export_rows(rows, fmt: str, header: bool):
+    """Yield the lines of `rows` as csv or jsonl, amounts are fixed point strings"""
+    def plain(value):
+        return format(value, 'f') if isinstance(value, Decimal) else value
+
+    if fmt == 'csv':
+        if header:
+            yield ','.join(EXPORT_FIELDS) + '\n'
+        for row in rows:
+            line = io.StringIO()
+            csv.writer(line, lineterminator='\n').writerow(
+                ['' if value is None else plain(value) for value in row.values()])
+            yield line.getvalue()
+    else:
+        for row in rows:
+            yield json.dumps(OrderedDict((key, plain(value)) for key, value in row.items())) + '\n'
+
+
+def export_records(infile, fmt: str):
+    """Yield (end offset, text) of the complete records of an export file opened in binary mode.
+
+    A csv record spans several lines if a quoted comment contains line breaks,
+    it is complete once its quotes are balanced. A last record without line
+    break is the partial write of an interrupted run and not yielded.
+    """
+    offset = 0
+    record = b''
+    for line in infile:
+        if not line.endswith(b'\n'):
+            return
+        record += line
+        if fmt == 'csv' and record.count(b'"') % 2:
+            continue
+        offset += len(record)
+        yield offset, record.decode('utf-8')
+        record = b''
+
+
+def read_export_state(path: str, fmt: str) -> dict:
+    """Position, txid and balance of the last confirmed transaction of an export file.
+
+    Reads the file record by record. `end` is the byte offset after that
+    record, unconfirmed transactions and a partial record after it are
+    exported again.
+    """
+    state = dict(position=0, txid=None, balance=Decimal(0), end=0, lines=0)
+    if not os.path.exists(path):
+        return state
+    fields = None
+    with open(path, 'rb') as infile:
+        for offset, text in export_records(infile, fmt):
+            if fmt == 'csv':
+                values = next(csv.reader(io.StringIO(text, newline='')))
+                if fields is None:
+                    fields = values
+                    state['end'] = offset
+                    continue
+                row = dict(zip(fields, values))
+                confirmed = row['confirmed'] == 'True'
+            else:
+                row = json.loads(text)
+                confirmed = row['confirmed']
+            state['lines'] += 1
+            if confirmed:
+                state.update(position=state['lines'], txid=row['txid'], end=offset)
+                if row['balance'] not in ('', None):
+                    state['balance'] = Decimal(row['balance'])
+    return state
+
+
+def export_wallet(path: str, fmt: str=None, page_size: int=100, progress=None) -> dict:
+    """Export the wallet transactions of the active profile oldest first as csv or json lines.
+
+    Pages are streamed to the file and synced to disk one by one, memory use
+    does not depend on the wallet size. An existing file is continued after
+    its last confirmed transaction.
+    Every transaction is one row with the fields of EXPORT_FIELDS, the balance
+    is the sum of all valid confirmed amounts up to it.
+
+    :param fmt: 'csv' or 'jsonl' (default: from the file extension)
+    :param progress: optional callable(exported transactions)
+    :return: counts of exported, invalid and unconfirmed transactions, the exported and the wallet balance
+    """
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    state = read_export_state(path, fmt)
+    stats = dict(resumed=state['position'], exported=0, invalid=0, unconfirmed=0, balance=state['balance'])
+
+    client = get_active_rpc_client()
+
+    def synced(pages):
+        for page in pages:
+            yield page
+            # the rows of the page are written once the next page is requested
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def counted(rows):
+        for row in rows:
+            stats['exported'] += 1
+            stats['invalid'] += not row['valid']
+            stats['unconfirmed'] += not row['confirmed']
+            if row['balance'] is not None:
+                stats['balance'] = row['balance']
+            yield row
+            if progress is not None and stats['exported'] % 1000 == 0:
+                progress(stats['resumed'] + stats['exported'])
+
+    with open(path, 'a+b') as outfile:
+        # drop unconfirmed transactions of the last run
+        outfile.truncate(state['end'])
+        pages = wallet_transaction_pages(client, state['position'], state['txid'], page_size)
+        rows = wallet_export_rows(synced(pages), state['balance'])
+        for line in format_export_rows(counted(rows), fmt, header=state['end'] == 0):
+            outfile.write(line.encode('utf-8'))
+    stats['wallet_balance'] = client.getbalance()
+    return stats
+
+
 if __name__ == '__main__':
     import app
     app.init()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Receive block and wallet notifications from the managed node"""
+import logging
+import socket
+import sys
+import threading
+from os.path import dirname, join
+
+import app
+
+log = logging.getLogger(__name__)
+
+
+NOTIFY_EVENTS = (b'block', b'wallet')
+
+
+def notify_command(port, event):
+    """Build a -blocknotify/-walletnotify command line for the notify helper.
+
+    The node runs the command through the shell and replaces %s with the hash.
+    """
+    if app.is_frozen():
+        helper = [join(dirname(sys.executable), 'coblo2-notify.exe')]
+    else:
+        helper = [sys.executable, join(app.APP_DIR, 'app', 'notify.py')]
+    command = ' '.join('"{}"'.format(arg) for arg in helper) + ' {} {} %s'.format(port, event)
+    if sys.platform == 'win32':
+        # cmd /c strips the first and the last quote of a command with more than two quotes
+        command = '"{}"'.format(command)
+    return command
+
+
+class NotificationListener:
+    """Local udp listener that wakes up the updater on node notifications.
+
+    `active` is set while a node that was launched with our notify commands is
+    running. Otherwise callers should keep polling.
+    """
+
+    HOST = '127.0.0.1'
+
+    def __init__(self):
+        self.port = None
+        self.active = False
+        self._event = threading.Event()
+        self._sock = None
+
+    def start(self) -> int:
+        """Start listening (once) and return the port for the notify helper"""
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.bind((self.HOST, 0))
+            self.port = self._sock.getsockname()[1]
+            threading.Thread(target=self._listen, name='node-notifications', daemon=True).start()
+            log.debug('listening for node notifications on port {}'.format(self.port))
+        return self.port
+
+    def stop(self):
+        self.active = False
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout) -> bool:
+        """Block until a notification arrives or `timeout` seconds passed.
+
+        Returns True if woken by a notification.
+        """
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+    def _listen(self):
+        sock = self._sock
+        while True:
+            try:
+                data, _ = sock.recvfrom(1024)
+            except OSError:
+                break
+            if data.split(b' ', 1)[0] in NOTIFY_EVENTS:
+                log.debug('node notification: {}'.format(data.decode('ascii', 'replace')))
+                self.notify()
+
+
+notification_listener = NotificationListener()
@@ -2,7 +2,12 @@
 import decimal
 import json
 import logging
+import threading
+
+import requests
+import simplejson
 from mcrpc import RpcClient
+from mcrpc.exceptions import RpcError
 # Don´t remove this import. Its a hack for cx freezing
 from multiprocessing import Queue
 
@@ -12,14 +17,155 @@ log = logging.getLogger(__name__)
 
 
 def get_active_rpc_client(override=None):
-    from app.models import Profile
-    from app.models.db import profile_session_scope
-    with profile_session_scope() as session:
-        profile = override or Profile.get_active(session)
-    assert isinstance(profile, Profile)
-    return RpcClient(
-        profile.rpc_host, profile.rpc_port, profile.rpc_user, profile.rpc_password, profile.rpc_use_ssl
-    )
+    """Return a pooled rpc client for the active (or `override`) profile.
+
+    Clients are bound to the calling thread and reused across calls.
+    """
+    return client_pool.get(override)
+
+
+class PooledRpcClient(RpcClient):
+    """RpcClient that keeps its HTTP connection alive between calls"""
+
+    def __init__(self, host, port, user, pwd, use_ssl=False, pool=None):
+        super().__init__(host, port, user, pwd, use_ssl)
+        self.pool = pool
+        self.session = requests.Session()
+        self._connection_pool = None
+
+    def _call(self, method, *args):
+        args = [arg for arg in args if arg is not None]
+        payload = {"method": method, "params": args}
+        data = self._post(simplejson.dumps(payload, use_decimal=True))
+        if data['error'] is not None:
+            raise RpcError(data['error'].get('message'))
+        return data['result']
+
+    def batch(self, calls) -> list:
+        """Send several calls in a single JSON-RPC batch request.
+
+        :param calls: iterable of (method, *params) tuples
+        :return: results in call order, an RpcError instance for every failed call
+        """
+        payload = []
+        for call_id, (method, *args) in enumerate(calls):
+            payload.append({"id": call_id, "method": method, "params": [arg for arg in args if arg is not None]})
+        if not payload:
+            return []
+        data = self._post(simplejson.dumps(payload, use_decimal=True))
+        if not isinstance(data, list):
+            # The whole batch was rejected
+            raise RpcError((data.get('error') or {}).get('message', 'invalid batch response'))
+
+        responses = {item.get('id'): item for item in data}
+        results = []
+        for call_id, call in enumerate(payload):
+            item = responses.get(call_id)
+            if item is None:
+                results.append(RpcError('no response for {}'.format(call['method'])))
+            elif item.get('error') is not None:
+                results.append(RpcError(item['error'].get('message')))
+            else:
+                results.append(item['result'])
+        return results
+
+    def _post(self, serialized):
+        num_connections = self._connection_pool.num_connections if self._connection_pool else 0
+        response = self.session.post(self._url, data=serialized, verify=False)
+        # urllib3 connection pool that served this request (kept across requests by the session)
+        self._connection_pool = getattr(response.raw, '_pool', None) or self._connection_pool
+        if self.pool is not None and self._connection_pool is not None:
+            self.pool.count_request(new_connection=self._connection_pool.num_connections > num_connections)
+        return response.json(parse_float=decimal.Decimal)
+
+    def close(self):
+        self.session.close()
+
+
+class RpcClientPool:
+    """Process-wide rpc clients keyed by profile connection settings.
+
+    Every thread gets its own client (requests sessions are not thread-safe)
+    and reuses it for all calls. The cached active profile and all clients are
+    dropped when a profile changes its connection settings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._active_profile = None
+        self.clients_created = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    @staticmethod
+    def profile_key(profile):
+        return profile.rpc_host, profile.rpc_port, profile.rpc_user, profile.rpc_password, profile.rpc_use_ssl
+
+    def get(self, profile=None):
+        from app.models import Profile
+        profile = profile or self._get_active_profile()
+        assert isinstance(profile, Profile)
+
+        key = self.profile_key(profile)
+        clients = getattr(self._local, 'clients', None)
+        if clients is None or self._local.generation != self._generation:
+            for client in (clients or {}).values():
+                client.close()
+            clients = self._local.clients = {}
+            self._local.generation = self._generation
+
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = PooledRpcClient(*key, pool=self)
+            with self._lock:
+                self.clients_created += 1
+        return client
+
+    def _get_active_profile(self):
+        from app.models import Profile
+        from app.models.db import profile_session_scope
+        with self._lock:
+            profile = self._active_profile
+        if profile is None:
+            with profile_session_scope() as session:
+                profile = Profile.get_active(session)
+            with self._lock:
+                self._active_profile = profile
+        return profile
+
+    def invalidate(self):
+        """Forget the active profile and retire all pooled clients"""
+        with self._lock:
+            self._active_profile = None
+            self._generation += 1
+
+    def on_profile_changed(self, profile):
+        with self._lock:
+            active = self._active_profile
+        if active is None or not profile.active or profile.name != active.name or \
+                self.profile_key(profile) != self.profile_key(active):
+            self.invalidate()
+
+    def count_request(self, new_connection):
+        with self._lock:
+            if new_connection:
+                self.connections_opened += 1
+            else:
+                self.connections_reused += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                clients_created=self.clients_created,
+                connections_opened=self.connections_opened,
+                connections_reused=self.connections_reused,
+            )
+
+
+client_pool = RpcClientPool()
+signals.profile_changed.connect(client_pool.on_profile_changed)
 
 
 class DecimalEncoder(json.JSONEncoder):
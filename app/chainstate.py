@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Shared node state that is polled once per updater tick"""
+import logging
+
+from app import sync
+from app.models import WalletTransaction
+from app.models.db import data_session_scope
+from app.signals import signals
+
+log = logging.getLogger(__name__)
+
+
+class ChainState:
+    """Poll best block, mempool and wallet once and publish typed change events.
+
+    Events (see app.signals):
+        new_block(Getblockchaininfo): best block hash changed
+        balance_changed(float): wallet balance changed
+        wallet_transactions_changed(): newest wallet transaction or its
+            confirmation changed and the wallet history was stored
+
+    The wallet is only queried if a new block arrived or the mempool changed.
+    Older wallet transactions are downloaded a few pages per poll until the
+    whole history is stored.
+    """
+
+    WALLET_TX_COUNT = 100
+
+    def __init__(self):
+        self.blockchaininfo = None
+        self.syncing = False
+        self.best_block_hash = ''
+        self.mempool = None
+        self.balance = None
+        self.wallet_head = None
+        self.wallet_complete = False
+
+    def poll(self, client):
+        blockchaininfo = client.getblockchaininfo()
+        # This triggers Network Info widget update that we always want
+        signals.getblockchaininfo.emit(blockchaininfo)
+        self.blockchaininfo = blockchaininfo
+
+        # The node is downloading blocks if it has more headers than blocks
+        self.syncing = blockchaininfo.blocks != blockchaininfo.headers or blockchaininfo.reindex
+        if self.syncing:
+            return
+
+        sync.getinfo()
+
+        mempool = frozenset(client.getrawmempool())
+        new_block = blockchaininfo.bestblockhash != self.best_block_hash
+        if new_block or mempool != self.mempool:
+            self.mempool = mempool if self.poll_wallet(client) else None
+
+        if new_block:
+            self.best_block_hash = blockchaininfo.bestblockhash
+            signals.new_block.emit(blockchaininfo)
+
+        if self.wallet_head is not None and not self.wallet_complete:
+            self.backfill_wallet(client)
+
+    def poll_wallet(self, client) -> bool:
+        """Publish wallet changes. Returns False if the wallet changed while reading it."""
+        balance = client.getbalance()
+        wallet_transactions = client.listwallettransactions(self.WALLET_TX_COUNT, 0, False, True)
+        if client.getbalance() != balance:
+            log.debug("Balance changed while updating")
+            return False
+
+        latest_tx = wallet_transactions[-1]["txid"] if wallet_transactions else ''
+        latest_confirmed_tx = ''
+        for tx in reversed(wallet_transactions):
+            if tx.get("blocktime"):
+                latest_confirmed_tx = tx["txid"]
+                break
+        wallet_head = (latest_tx, latest_confirmed_tx)
+
+        if balance != self.balance:
+            self.balance = balance
+            signals.balance_changed.emit(balance)
+        if wallet_head != self.wallet_head:
+            log.debug('new wallet transactions')
+            with data_session_scope() as session:
+                WalletTransaction.sync(session, client, wallet_transactions, balance)
+            self.wallet_head = wallet_head
+            self.wallet_complete = False
+        return True
+
+    def backfill_wallet(self, client):
+        """Store the next pages of older wallet transactions"""
+        try:
+            with data_session_scope() as session:
+                complete = WalletTransaction.backfill(session, client)
+        except Exception as e:
+            log.exception('cannot download wallet history: %s' % e)
+            return
+        if complete is None:
+            # store the newest transactions again on the next poll
+            self.wallet_head = None
+            self.mempool = None
+        self.wallet_complete = bool(complete)
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Command line tools for the active profile.
+
+The node of the active profile must be running (e.g. started by the
+application). Usage:
+
+    python -m app.cli timestamp DIRECTORY [--manifest FILE] [--comment TEXT] [--workers N]
+    python -m app.cli export-wallet FILE [--format csv|jsonl] [--page-size N]
+"""
+import argparse
+import multiprocessing
+import sys
+
+
+def timestamp(args):
+    from app.api import timestamp_directory
+
+    def progress(done, total):
+        sys.stdout.write('\rhashed {}/{} files'.format(done, total))
+        sys.stdout.flush()
+
+    stats = timestamp_directory(args.directory, args.manifest, args.comment, args.workers, progress)
+    print('\npublished {published}, skipped {skipped}, unreadable {unreadable}, already in manifest {resumed}'.format(
+        **stats))
+
+
+def export_wallet(args):
+    from app.api import export_wallet
+
+    def progress(done):
+        sys.stdout.write('\rexported {} transactions'.format(done))
+        sys.stdout.flush()
+
+    stats = export_wallet(args.file, args.format, args.page_size, progress)
+    print('\nexported {exported} ({invalid} invalid, {unconfirmed} unconfirmed), already in file {resumed}'.format(
+        **stats))
+    print('exported balance {balance}, wallet balance {wallet_balance}'.format(**stats))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='coblo2-cli', description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('timestamp', help='timestamp all files of a directory')
+    command.add_argument('directory')
+    command.add_argument('--manifest', default='timestamps.jsonl',
+                         help='JSON lines record of sent timestamps, reused to resume (default: %(default)s)')
+    command.add_argument('--comment', default='', help='public comment for every timestamp')
+    command.add_argument('--workers', type=int, default=None, help='hashing processes (default: cpu count)')
+    command.set_defaults(func=timestamp)
+    command = commands.add_parser('export-wallet', help='export all wallet transactions')
+    command.add_argument('file', help='csv or json lines file, an existing file is continued')
+    command.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                         help='default: csv for *.csv files, jsonl otherwise')
+    command.add_argument('--page-size', type=int, default=100,
+                         help='initial number of transactions per rpc call, adapted while exporting')
+    command.set_defaults(func=export_wallet)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    import app
+    app.init()
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
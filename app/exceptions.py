@@ -7,3 +7,21 @@ class CharmError(Exception):
 
 class RpcResponseError(CharmError):
     pass
+
+
+class SyncError(CharmError):
+    """A sync stage failed after all retries"""
+
+    def __init__(self, stage, error):
+        super().__init__('{} stage failed: {}'.format(stage, error))
+        self.stage = stage
+        self.error = error
+
+
+class HashingCancelled(CharmError):
+    pass
+
+
+class WalletExportError(CharmError):
+    """The wallet changed below the exported transactions, an export cannot be resumed"""
+    pass
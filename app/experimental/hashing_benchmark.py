@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Compare separate per digest file reads with the single pass fan-out reader.
+
+Writes a random file, checks that FileHasher returns exactly what the iscc
+functions and hashlib return and prints the timings. Usage:
+
+    python -m app.experimental.hashing_benchmark [megabytes]
+"""
+import os
+import sys
+import tempfile
+import time
+from hashlib import sha256
+
+import iscc
+
+from app.tools.hashing import DATA_ID, FileHasher, INSTANCE_ID, SHA256
+
+
+def separate(file_path):
+    hasher = sha256()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    instance_id, instance_hash = iscc.instance_id(file_path)
+    return hasher.hexdigest(), instance_id, instance_hash, iscc.data_id(file_path)
+
+
+def single_pass(file_path, parallel):
+    digests = FileHasher(file_path, (SHA256, INSTANCE_ID, DATA_ID), parallel=parallel).run()
+    return digests.sha256, digests.instance_id, digests.instance_hash, digests.data_id
+
+
+def timed(func, *args, repeat=3):
+    """Best of `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(megabytes=20):
+    with tempfile.NamedTemporaryFile(delete=False) as outfile:
+        outfile.write(os.urandom(megabytes * 1024 * 1024))
+    try:
+        expected_time, expected = timed(separate, outfile.name)
+        sequential_time, sequential = timed(single_pass, outfile.name, False)
+        parallel_time, parallel = timed(single_pass, outfile.name, True)
+    finally:
+        os.remove(outfile.name)
+
+    assert sequential == expected, (sequential, expected)
+    assert parallel == expected, (parallel, expected)
+    print('{} MB, sha256 + instance id + data id, identical results, best of 3'.format(megabytes))
+    print('separate reads:        {:6.2f}s'.format(expected_time))
+    print('single pass:           {:6.2f}s'.format(sequential_time))
+    print('single pass, fan-out:  {:6.2f}s'.format(parallel_time))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Compare the exact match conflict query with the partitioned hamming index.
+
+Fills a temporary database with random ISCCs (some of them near duplicates),
+checks the index against a brute force scan and prints query timings. Usage:
+
+    python -m app.experimental.iscc_similarity_benchmark [isccs] [queries] [max_distance]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import iscc
+import sqlalchemy
+
+from app.models import ISCC, ISCCHash, data_base, data_db
+from app.models.iscc_hash import decode_component, hamming_distance
+
+
+def random_code(head, value):
+    return iscc.encode(head + value.to_bytes(8, 'big'))
+
+
+def flip_bits(value, count):
+    for position in random.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def fill(session, count):
+    hashes = [random.getrandbits(64) for _ in range(count // 2)]
+    # the second half are near duplicates of the first half
+    hashes += [flip_bits(value, random.randint(1, 12)) for value in hashes]
+    rows = [dict(
+        meta_id=random_code(iscc.HEAD_MID, random.getrandbits(64)),
+        content_id=random_code(iscc.HEAD_CID_T, value),
+        data_id=random_code(iscc.HEAD_DID, random.getrandbits(64)),
+        instance_id=random_code(iscc.HEAD_IID, random.getrandbits(64)),
+        address='address', title='title {}'.format(number),
+    ) for number, value in enumerate(hashes)]
+    session.execute(ISCC.__table__.insert(), rows)
+    ISCCHash.backfill(session)
+    session.commit()
+    return [row['content_id'] for row in rows]
+
+
+def brute_force(all_hashes, code, max_distance):
+    kind, value = decode_component(code)
+    return {iscc_id: distance for iscc_id, distance in (
+        (iscc_id, hamming_distance(candidate, value)) for iscc_id, candidate in all_hashes
+    ) if distance <= max_distance}
+
+
+def run(count=100000, queries=200, max_distance=8):
+    random.seed(1)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(path))
+    data_db.configure(bind=engine)
+    data_base.metadata.create_all(engine)
+    session = data_db()
+    try:
+        start = time.perf_counter()
+        content_ids = fill(session, count)
+        print('{} isccs indexed in {:.1f}s'.format(count, time.perf_counter() - start))
+
+        samples = random.sample(content_ids, queries)
+        isccs = {entry.content_id: entry for entry in session.query(ISCC).filter(ISCC.content_id.in_(samples))}
+        all_hashes = [(iscc_id, value & ((1 << 64) - 1)) for iscc_id, value in session.query(
+            ISCCHash.iscc_id, ISCCHash.value).filter(ISCCHash.kind == decode_component(samples[0])[0])]
+
+        start = time.perf_counter()
+        exact_found = 0
+        for code in samples:
+            entry = isccs[code]
+            exact_found += len(ISCC.get_conflicts(session, entry.meta_id, entry.content_id, entry.data_id,
+                                                  entry.instance_id))
+        exact = time.perf_counter() - start
+
+        start = time.perf_counter()
+        similar_found = 0
+        for code in samples:
+            entry = isccs[code]
+            similar_found += len(ISCCHash.get_conflicts(session, entry.meta_id, entry.content_id, entry.data_id,
+                                                        entry.instance_id, max_distance))
+        similar = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for code in samples[:20]:
+            assert ISCCHash.find_similar(session, code, max_distance) == brute_force(all_hashes, code, max_distance)
+        scan = (time.perf_counter() - start) / 20
+    finally:
+        session.close()
+        os.remove(path)
+
+    print('exact match query (ISCC.get_conflicts):  {:6.2f}ms per query, {} conflicts'.format(
+        exact / queries * 1000, exact_found))
+    print('hamming index, distance <= {:2}:           {:6.2f}ms per query, {} conflicts'.format(
+        max_distance, similar / queries * 1000, similar_found))
+    print('brute force scan of content ids:         {:6.2f}ms per query (results identical)'.format(scan * 1000))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
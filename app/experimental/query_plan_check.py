@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Check the query plans of the data db model queries against full table scans.
+
+Fills a temporary database with generated chain data, runs every model query,
+captures the SQL it sends and runs EXPLAIN QUERY PLAN on it. Plain table scans
+(without an index) and index scans whose result is sorted afterwards are
+reported and the exit status is 1. Other index scans (e.g. a covering index
+for a group by) are fine. Usage:
+
+    python -m app.experimental.query_plan_check [blocks] [--verbose]
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from hashlib import sha256
+
+import iscc
+import sqlalchemy
+from sqlalchemy import event
+
+from app.enums import PermTypes
+from app.models import (
+    AddressStats, Alias, Block, CurrentAlias, ISCC, ISCCHash, MiningReward, PendingVote, Permission, Profile, Profile_Base,
+    SyncCheckpoint, Timestamp, Transaction, Vote, WalletCheckpoint, WalletTransaction, data_base, data_db, profile_db
+)
+
+# SCAN TABLE x (sqlite < 3.36) or SCAN x, optionally aliased, without an index
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+# any scan of x, with an index it still reads every row if the result is sorted afterwards
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+SORT_ALL = 'USE TEMP B-TREE FOR ORDER BY'
+
+ADDRESSES = ['1address{:04}'.format(number) for number in range(500)]
+
+
+def txid(number):
+    return sha256('tx{}'.format(number).encode()).hexdigest()
+
+
+def random_code(head):
+    return iscc.encode(head + random.getrandbits(64).to_bytes(8, 'big'))
+
+
+def fill(session, blocks):
+    """Blocks over the last 60 days, every block has a mining reward and two transactions"""
+    now = datetime.now()
+    hashes = [sha256(str(height).encode()).digest() for height in range(blocks)]
+    session.execute(Block.__table__.insert(), [dict(
+        hash=block_hash, height=height, txcount=2,
+        mining_time=now - timedelta(days=60) + timedelta(seconds=height * 60 * 86400 / blocks),
+    ) for height, block_hash in enumerate(hashes)])
+    session.execute(MiningReward.__table__.insert(), [
+        dict(block=block_hash, address=random.choice(ADDRESSES)) for block_hash in hashes])
+    session.execute(Transaction.__table__.insert(), [
+        dict(txid=txid(number), block=hashes[number // 2], pos_in_block=number % 2) for number in range(blocks * 2)])
+
+    kinds = random.choices(['timestamp', 'iscc', 'vote', 'alias'], weights=[60, 30, 5, 5], k=blocks * 2)
+    numbers = {kind: [number for number, chosen in enumerate(kinds) if chosen == kind] for kind in set(kinds)}
+    session.execute(Timestamp.__table__.insert(), [dict(
+        txid=txid(number), pos_in_tx=0, address=random.choice(ADDRESSES),
+        hash=sha256(str(number).encode()).hexdigest(), comment='comment',
+    ) for number in numbers['timestamp']])
+    session.execute(ISCC.__table__.insert(), [dict(
+        txid=txid(number), meta_id=random_code(iscc.HEAD_MID), content_id=random_code(iscc.HEAD_CID_T),
+        data_id=random_code(iscc.HEAD_DID), instance_id=random_code(iscc.HEAD_IID),
+        address=random.choice(ADDRESSES), title='title {}'.format(number),
+    ) for number in numbers['iscc']])
+    ISCCHash.backfill(session)
+    session.execute('INSERT INTO iscc_fts(iscc_fts) VALUES (\'rebuild\')')
+    session.execute(Vote.__table__.insert(), [dict(
+        txid=txid(number), pos_in_tx=0, from_address=random.choice(ADDRESSES), to_address=random.choice(ADDRESSES),
+        start_block=0, end_block=Permission.MAX_END_BLOCK, perm_type=random.choice(list(PermTypes)),
+    ) for number in numbers['vote']])
+    session.execute(Alias.__table__.insert(), [dict(
+        txid=txid(number), pos_in_tx=0, address=random.choice(ADDRESSES), alias='alias{}'.format(number),
+    ) for number in numbers['alias']])
+    CurrentAlias.rebuild(session)
+    AddressStats.rebuild(session)
+    session.execute(Permission.__table__.insert(), [dict(
+        address=address, perm_type=perm_type, start_block=0, end_block=Permission.MAX_END_BLOCK,
+    ) for address in ADDRESSES for perm_type in random.sample(list(PermTypes), 2)])
+    votes = {(random.choice(ADDRESSES), random.choice(ADDRESSES), random.choice(list(PermTypes)),
+              random.choice([0, Permission.MAX_END_BLOCK])) for _ in range(2000)}
+    session.execute(PendingVote.__table__.insert(), [dict(
+        address_from=address_from, address_to=address_to, perm_type=perm_type, start_block=0, end_block=end_block,
+    ) for address_from, address_to, perm_type, end_block in votes])
+    session.execute(WalletTransaction.__table__.insert(), [dict(
+        seq=number, txid=txid(number), tx_type=random.choice([WalletTransaction.PAYMENT, WalletTransaction.PUBLISH]),
+        time=now - timedelta(seconds=blocks - number), confirmed=True, pos_in_block=0, comment='',
+        amount=random.randint(-10 ** 8, 10 ** 8), balance=random.randint(0, 10 ** 12),
+    ) for number in range(blocks)])
+    session.commit()
+
+
+def model_queries(session):
+    """(name, callable, tables that may be scanned completely) of every data db model query"""
+    entry = session.query(ISCC).order_by(ISCC.iscc_id.desc()).first()
+    components = entry.meta_id, entry.content_id, entry.data_id, entry.instance_id
+    timestamp = session.query(Timestamp).first()
+    last_page = session.query(ISCC.iscc_id, ISCC.title).order_by(ISCC.iscc_id.desc()).first()
+    newest = ISCC.get_page(session, page_size=1000)[-1]
+    height = session.query(sqlalchemy.func.max(Block.height)).scalar()
+    block_hash = session.query(Block.hash).filter(Block.height == height).scalar()
+    wallet_txs = [dict(txid=txid(number)) for number in range(100)]
+    windows = {sort_key: WalletTransaction.get_window(session, sort_key, limit=1000)[-1] for sort_key in (
+        WalletTransaction.SORT_DATE, WalletTransaction.SORT_AMOUNT, WalletTransaction.SORT_BALANCE)}
+    return [
+        ('Block.block_exists', lambda: Block.block_exists(session, block_hash.hex()), ()),
+        ('Transaction.transaction_in_db', lambda: Transaction.transaction_in_db(session, txid(1)), ()),
+        ('Timestamp.get_timestamps_for_hash', lambda: Timestamp.get_timestamps_for_hash(session, timestamp.hash), ()),
+        ('Timestamp.get_timestamps_for_address',
+         lambda: Timestamp.get_timestamps_for_address(session, timestamp.address), ()),
+        ('Vote.last_voted', lambda: Vote.last_voted(session), ()),
+        ('Vote.voted_since', lambda: Vote.voted_since(session, height - 10), ()),
+        ('MiningReward.last_mined', lambda: MiningReward.last_mined(session), ()),
+        ('AddressStats.get_stats', lambda: AddressStats.get_stats(session), ('address_stats',)),
+        ('AddressStats.record mined', lambda: AddressStats.record(session, AddressStats.MINED, height - 499, height), ()),
+        ('AddressStats.record voted', lambda: AddressStats.record(session, AddressStats.VOTED, height - 99, height), ()),
+        ('AddressStats.revert_above', lambda: AddressStats.revert_above(session, height - 10), ()),
+        ('PendingVote.num_revokes', lambda: PendingVote.num_revokes(session, PermTypes.mine), ()),
+        ('PendingVote.num_candidates', lambda: PendingVote.num_candidates(session), ()),
+        ('PendingVote.get_candidates', lambda: PendingVote.get_candidates(session), ()),
+        ('PendingVote.already_granted', lambda: PendingVote.already_granted(session), ()),
+        ('PendingVote.already_revoked', lambda: PendingVote.already_revoked(session, PermTypes.mine), ()),
+        ('Permission.validators', lambda: Permission.validators(session), ()),
+        ('Permission.guardians', lambda: Permission.guardians(session), ()),
+        ('Permission.num_validators', lambda: Permission.num_validators(session), ()),
+        ('Permission.num_guardians', lambda: Permission.num_guardians(session), ()),
+        ('Permission.get_permissions_for_address',
+         lambda: Permission.get_permissions_for_address(session, ADDRESSES[0]), ()),
+        # loads the whole mapping into the cache by design
+        ('CurrentAlias.get_aliases', lambda: (CurrentAlias.invalidate_cache(), CurrentAlias.get_aliases(session)),
+         ('current_alias',)),
+        ('CurrentAlias.get_address', lambda: CurrentAlias.get_address(session, 'alias1'), ()),
+        ('CurrentAlias.update_since', lambda: CurrentAlias.update_since(session, height - 100), ()),
+        # single row table
+        ('SyncCheckpoint.get', lambda: SyncCheckpoint.get(session), ('sync_checkpoint',)),
+        ('ISCC.get_conflicts', lambda: ISCC.get_conflicts(session, *components), ()),
+        ('ISCC.already_exists', lambda: ISCC.already_exists(session, *components), ()),
+        ('ISCC.conflict_in_meta', lambda: ISCC.conflict_in_meta(session, entry.meta_id), ()),
+        ('ISCC.get_page newest', lambda: ISCC.get_page(session), ()),
+        ('ISCC.get_page newest, next page', lambda: ISCC.get_page(session, after=(newest.mining_time, newest.iscc_id)),
+         ()),
+        ('ISCC.get_page oldest', lambda: ISCC.get_page(session, sort_key=ISCC.SORT_DATE, descending=False), ()),
+        ('ISCC.get_page by iscc', lambda: ISCC.get_page(session, sort_key=ISCC.SORT_ISCC, descending=False), ()),
+        ('ISCC.get_page by title', lambda: ISCC.get_page(
+            session, sort_key=ISCC.SORT_TITLE, after=(last_page.title, last_page.iscc_id)), ()),
+        # the alias or address of the publisher comes from two tables, no index can provide that order
+        ('ISCC.get_page by publisher', lambda: ISCC.get_page(session, sort_key=ISCC.SORT_PUBLISHER), ('isccs',)),
+        ('ISCC.get_page search', lambda: ISCC.get_page(session, 'title 12'), ()),
+        ('ISCC.get_page search by date', lambda: ISCC.get_page(session, 'title 12', ISCC.SORT_DATE), ()),
+        ('ISCC.get_page code', lambda: ISCC.get_page(session, entry.meta_id + '-' + entry.content_id[:5]), ()),
+        ('ISCCHash.get_conflicts', lambda: ISCCHash.get_conflicts(session, *components), ()),
+        # single row table
+        ('WalletCheckpoint.get', lambda: WalletCheckpoint.get(session), ('wallet_checkpoint',)),
+        ('WalletTransaction.known', lambda: WalletTransaction.known(session, wallet_txs), ()),
+        ('WalletTransaction.confirmed_balance', lambda: WalletTransaction.confirmed_balance(session), ()),
+        ('WalletTransaction.confirmed_balance oldest',
+         lambda: WalletTransaction.confirmed_balance(session, oldest=True), ()),
+        ('WalletTransaction.balance_offset', lambda: WalletTransaction.balance_offset(session), ('wallet_checkpoint',)),
+        ('WalletTransaction unconfirmed', lambda: session.query(WalletTransaction).filter(
+            WalletTransaction.confirmed == False).all(), ()),  # noqa: E712
+        # counts every row by design
+        ('WalletTransaction.count', lambda: WalletTransaction.count(session), ('wallet_transactions',)),
+    ] + [
+        ('WalletTransaction.get_window by {}{}{}'.format(sort_key, ' ascending' if not descending else '',
+                                                          ', next window' if after else ''),
+         lambda sort_key=sort_key, descending=descending, after=after: WalletTransaction.get_window(
+             session, sort_key, descending,
+             after=WalletTransaction.sort_values(windows[sort_key], sort_key) if after else None),
+         ())
+        for sort_key in windows for descending in (True, False) for after in (False, True)
+    ]
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def check(engine, session, name, query, allowed, verbose=False) -> bool:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        start = time.perf_counter()
+        query()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        session.rollback()
+
+    scans = []
+    plans = []
+    for statement, parameters in statements:
+        plan = explain(session.connection(), statement, parameters)
+        plans.append(plan)
+        pattern = SCAN if SORT_ALL in plan else FULL_SCAN
+        scans += [line for line in plan if pattern.match(line) and pattern.match(line).group(1) not in allowed]
+
+    print('{:<5} {:<60} {:7.1f}ms {}'.format(
+        'FAIL' if scans else 'ok', name, elapsed * 1000, ', '.join(scans)))
+    if verbose or scans:
+        for plan in plans:
+            for line in plan:
+                print('          ' + line)
+    return not scans
+
+
+def run(blocks=50000, verbose=False):
+    random.seed(1)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(path))
+    data_db.configure(bind=engine)
+    data_base.metadata.create_all(engine)
+    profile_engine = sqlalchemy.create_engine('sqlite://')
+    profile_db.configure(bind=profile_engine)
+    Profile_Base.metadata.create_all(profile_engine)
+    profile_db().add(Profile(name='check', active=True, address=ADDRESSES[0]))
+    profile_db().commit()
+    session = data_db()
+    try:
+        ISCC.init_search_index(session)
+        start = time.perf_counter()
+        fill(session, blocks)
+        print('{} blocks generated in {:.1f}s, sqlite {}'.format(
+            blocks, time.perf_counter() - start, engine.dialect.dbapi.sqlite_version))
+        results = [check(engine, session, name, query, allowed, verbose)
+                   for name, query, allowed in model_queries(session)]
+    finally:
+        session.close()
+        data_db.remove()
+        os.remove(path)
+
+    failed = results.count(False)
+    print('{} queries checked, {} with full table scans'.format(len(results), failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '--verbose']
+    sys.exit(run(*[int(arg) for arg in args[:1]], verbose='--verbose' in sys.argv))
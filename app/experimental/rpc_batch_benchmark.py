@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Compare single JSON-RPC calls with batch requests against a local stub server.
+
+The stub answers getblock with a fake verbose block after a fixed delay that
+simulates the per request overhead of the node. Usage:
+
+    python -m app.experimental.rpc_batch_benchmark [blocks] [batch_size] [latency_ms]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from app.backend.rpc import PooledRpcClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.002
+    requests = 0
+
+    def do_POST(self):
+        StubHandler.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        time.sleep(self.latency)
+        if isinstance(body, list):
+            response = [self.answer(call) for call in body]
+        else:
+            response = self.answer(body)
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def answer(call):
+        height = int(call['params'][0])
+        block = dict(hash='{:064x}'.format(height), height=height, tx=[dict(txid='{:064x}'.format(height))])
+        return dict(result=block, error=None, id=call.get('id'))
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def run(blocks=2000, batch_size=50, latency_ms=2):
+    StubHandler.latency = latency_ms / 1000
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = PooledRpcClient('127.0.0.1', server.server_address[1], 'user', 'password')
+
+    StubHandler.requests = 0
+    start = time.perf_counter()
+    for height in range(blocks):
+        client.getblock('{}'.format(height), 4)
+    single = time.perf_counter() - start, StubHandler.requests
+
+    StubHandler.requests = 0
+    start = time.perf_counter()
+    for first in range(0, blocks, batch_size):
+        heights = range(first, min(first + batch_size, blocks))
+        client.batch([('getblock', '{}'.format(height), 4) for height in heights])
+    batched = time.perf_counter() - start, StubHandler.requests
+
+    server.shutdown()
+    print('{} blocks, {} ms simulated latency per request'.format(blocks, latency_ms))
+    print('single calls: {:6.2f}s {:6} requests'.format(*single))
+    print('batch of {:3}: {:6.2f}s {:6} requests'.format(batch_size, *batched))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:4]])
@@ -7,17 +7,24 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.sql.ddl import CreateTable
 
 import app
-from app.models.address import Address
+from app.models.address import Address, address_cache
+from app.models.address_stats import AddressActivity, AddressStats
 from app.models.alias import Alias
 from app.models.block import Block
+from app.models.file_fingerprint import FileFingerprint
+from app.models.current_alias import CurrentAlias
 from app.models.miningreward import MiningReward
 from app.models.iscc import ISCC
+from app.models.iscc_hash import ISCCHash
 from app.models.pendingvote import PendingVote
 from app.models.permission import Permission
 from app.models.transaction import Transaction
 from app.models.timestamp import Timestamp
 from app.models.profile import Profile, Profile_Base
+from app.models.snapshot import snapshots
+from app.models.sync_checkpoint import SyncCheckpoint
 from app.models.vote import Vote
+from app.models.wallet_transaction import WalletCheckpoint, WalletTransaction
 from app.models.db import data_db, profile_db, data_base, profile_session_scope
 
 log = logging.getLogger(__name__)
@@ -53,6 +60,12 @@ def init_profile_db():
     else:
         log.debug("{}-db schema up to date".format(Profile.__table__.name))
 
+    # the fingerprint cache can simply be rebuilt
+    if not check_table_ddl_against_model(profile_db, FileFingerprint.__table__):
+        log.debug("{}-db schema outdated, resetting".format(FileFingerprint.__table__.name))
+        if engine.dialect.has_table(engine, FileFingerprint.__tablename__):
+            FileFingerprint.__table__.drop(engine)
+
     # create the database
     Profile_Base.metadata.create_all(engine)
 
@@ -73,6 +86,8 @@ def init_profile_db():
                 balance=profile.balance if 'balance' in profile else 0,
                 is_admin=profile.is_admin if 'is_admin' in profile else 0,
                 is_miner=profile.is_miner if 'is_miner' in profile else 0,
+                sync_workers=profile.sync_workers if 'sync_workers' in profile else 4,
+                sync_queue_depth=profile.sync_queue_depth if 'sync_queue_depth' in profile else 16,
             ))
 
     return profile_db
@@ -90,14 +105,17 @@ def init_data_db():
     engine = sqlalchemy.create_engine('sqlite:///{}'.format(fp))
     data_db.configure(bind=engine)
     engine.execute("PRAGMA journal_mode=WAL")
+    snapshots.clear()
 
     log.debug("check data-db schema")
     reset_blocks = False
+    # the wallet history can simply be downloaded again
+    independent_tables = (WalletCheckpoint.__table__, WalletTransaction.__table__)
     for table_name, table in data_base.metadata.tables.items():
         log.debug("check {}-db schema".format(table.name))
         if not check_table_ddl_against_model(data_db, table):
             log.debug("{}-db schema outdated, resetting".format(table.name))
-            reset_blocks = True
+            reset_blocks = reset_blocks or table not in independent_tables
             if engine.dialect.has_table(engine, table_name):
                 table.drop(engine)
 
@@ -105,8 +123,18 @@ def init_data_db():
             log.debug("{}-db schema up to date".format(table.name))
 
     data_base.metadata.create_all(engine)
+    for table in data_base.metadata.tables.values():
+        create_missing_indexes(data_db, table)
+    ISCC.init_search_index(data_db())
+    ISCCHash.backfill(data_db())
+    AddressStats.backfill(data_db())
     if reset_blocks:
         data_db().query(Block).delete()
+        data_db().query(SyncCheckpoint).delete()
+        CurrentAlias.rebuild(data_db())
+        AddressStats.rebuild(data_db())
+        data_db().commit()
+    address_cache.warm(data_db())
     return data_db
 
 
@@ -119,6 +147,16 @@ def check_table_ddl_against_model(database, table) -> bool:
     return str.strip(CreateTable(table).compile(database.bind).string) == str.strip(db_table_ddl or '')
 
 
+def create_missing_indexes(database, table):
+    """Create indexes declared on `table` after it was created (create_all skips existing tables)"""
+    existing = {name for name, in database().execute(
+        "select name from sqlite_master where type = 'index' and tbl_name = :table", dict(table=table.name))}
+    for index in table.indexes:
+        if index.name not in existing:
+            log.debug("create index {}".format(index.name))
+            index.create(database.bind)
+
+
 if __name__ == '__main__':
     import app.helpers
     app.helpers.init_logging()
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, String, exists
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import Column, String
 from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session
 
 from app.models.db import data_base
-from app.signals import signals
+from app.signals import coalesced
+
+log = logging.getLogger(__name__)
 
 
 class Address(data_base):
@@ -20,10 +27,85 @@ class Address(data_base):
 
     @staticmethod
     def create_if_not_exists(data_db, address):
-        if not data_db.query(exists().where(Address.address == address)).scalar():
-            data_db.add(Address(address=address))
+        Address.bulk_create_if_not_exists(data_db, (address,))
+
+    @staticmethod
+    def bulk_create_if_not_exists(data_db, addresses):
+        """Queue addresses that are not known to be stored yet.
+
+        Known addresses are skipped without touching the database. The queue is
+        written with a single INSERT OR IGNORE when the session commits.
+        """
+        unknown = address_cache.unknown(addresses)
+        if unknown:
+            data_db.info.setdefault('pending_addresses', set()).update(unknown)
+
+    @staticmethod
+    def flush_pending(data_db) -> int:
+        """Insert queued addresses now. Returns the number of new rows."""
+        pending = data_db.info.pop('pending_addresses', None)
+        if not pending:
+            return 0
+        rows = [{'address': address} for address in pending]
+        inserted = data_db.execute(Address.__table__.insert().prefix_with('OR IGNORE'), rows).rowcount
+        data_db.info.setdefault('flushed_addresses', set()).update(pending)
+        if inserted:
+            coalesced.mark(data_db, 'new_address')
+        return inserted
+
+
+class AddressCache:
+    """Bounded process-wide set of addresses known to be stored in the data db.
+
+    Least recently used addresses are evicted first. An evicted address only
+    costs a redundant INSERT OR IGNORE.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+
+    def warm(self, data_db):
+        """Reload from the addresses table (e.g. after switching the data db)"""
+        addresses = [address for address, in data_db.query(Address.address).limit(self.max_size)]
+        with self._lock:
+            self._known = OrderedDict.fromkeys(addresses)
+        log.debug('warmed address cache with {} addresses'.format(len(addresses)))
+
+    def unknown(self, addresses) -> set:
+        unknown = set()
+        with self._lock:
+            for address in addresses:
+                if address in self._known:
+                    self._known.move_to_end(address)
+                else:
+                    unknown.add(address)
+        return unknown
+
+    def add(self, addresses):
+        with self._lock:
+            for address in addresses:
+                self._known[address] = None
+                self._known.move_to_end(address)
+            while len(self._known) > self.max_size:
+                self._known.popitem(last=False)
+
+
+address_cache = AddressCache()
+
+
+@listens_for(Session, "before_commit")
+def flush_pending_addresses(session):
+    Address.flush_pending(session)
+
+
+@listens_for(Session, "after_commit")
+def after_commit(session):
+    address_cache.add(session.info.pop('flushed_addresses', ()))
 
 
-@listens_for(Address, "after_insert")
-def after_update(mapper, connection, address):
-    signals.new_address.emit()
\ No newline at end of file
+@listens_for(Session, "after_rollback")
+def after_rollback(session):
+    for key in ('pending_addresses', 'flushed_addresses'):
+        session.info.pop(key, None)
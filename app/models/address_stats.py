@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, String, func
+
+from app.models.db import cross_join, data_base
+from app.signals import coalesced
+
+log = logging.getLogger(__name__)
+
+# last mined / voted block time and the number of blocks mined / votes cast in the last 24 hours
+Stats = namedtuple('Stats', 'last_mined last_voted mined voted')
+
+
+def hour_of(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class AddressActivity(data_base):
+    __tablename__ = "address_activity"
+    """Blocks mined and votes cast per address and hour of the recent blocks"""
+
+    address = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True, index=True)
+    mined = Column(Integer, nullable=False, default=0)
+    voted = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return "AddressActivity(%s, %s, %s, %s)" % (self.address, self.hour, self.mined, self.voted)
+
+    @staticmethod
+    def add(data_db, kind, counts: Counter, sign=1):
+        """Add (or subtract with sign -1) the counts per (address, hour) to the `kind` column"""
+        if not counts:
+            return
+        # only the buckets of the last hours exist, load them at once
+        buckets = {(bucket.address, bucket.hour): bucket for bucket in data_db.query(AddressActivity).filter(
+            AddressActivity.hour >= min(hour for address, hour in counts))}
+        for (address, hour), count in counts.items():
+            bucket = buckets.get((address, hour))
+            if bucket is None:
+                if sign < 0:
+                    continue
+                bucket = AddressActivity(address=address, hour=hour, mined=0, voted=0)
+                data_db.add(bucket)
+            setattr(bucket, kind, getattr(bucket, kind) + sign * count)
+            if bucket.mined <= 0 and bucket.voted <= 0:
+                data_db.delete(bucket)
+
+
+class AddressStats(data_base):
+    __tablename__ = "address_stats"
+    """Last mined and last voted block time per address.
+
+    Kept up to date by the sync together with the hourly AddressActivity
+    buckets: the header stage records mining rewards, the body stage votes and
+    a reorg reverts the removed blocks before they are deleted. The 24 hour
+    counts are the sum of the buckets of the last 24 (partial) hours.
+    """
+
+    MINED = 'mined'
+    VOTED = 'voted'
+    WINDOW = timedelta(hours=24)
+
+    address = Column(String, primary_key=True)
+    last_mined = Column(DateTime)
+    last_voted = Column(DateTime)
+
+    def __repr__(self):
+        return "AddressStats(%s, %s, %s)" % (self.address, self.last_mined, self.last_voted)
+
+    @staticmethod
+    def load(data_db, addresses) -> dict:
+        """{address: AddressStats} of the existing rows for `addresses`"""
+        addresses = list(addresses)
+        result = {}
+        # stay below the sqlite limit of bound parameters
+        for i in range(0, len(addresses), 500):
+            result.update((stats.address, stats) for stats in data_db.query(AddressStats).filter(
+                AddressStats.address.in_(addresses[i:i + 500])))
+        return result
+
+    @staticmethod
+    def window_start(now=None) -> datetime:
+        return hour_of((now or datetime.now()) - AddressStats.WINDOW)
+
+    @staticmethod
+    def activity(data_db, kind, *criteria) -> list:
+        """(address, mining_time) of every mining reward or vote in the blocks matching `criteria`"""
+        from app.models import Block, MiningReward, Transaction, Vote
+        if kind == AddressStats.MINED:
+            query = data_db.query(MiningReward.address, Block.mining_time).select_from(
+                cross_join(Block, MiningReward, MiningReward.block == Block.hash))
+        else:
+            query = data_db.query(Vote.from_address, Block.mining_time).select_from(
+                cross_join(cross_join(Block, Transaction, Block.hash == Transaction.block), Vote,
+                           Transaction.txid == Vote.txid))
+        return query.filter(*criteria).all()
+
+    @staticmethod
+    def latest(data_db, kind, address, height):
+        """Time of the last block up to `height` the address mined / voted in"""
+        from app.models import Block, MiningReward, Transaction, Vote
+        if kind == AddressStats.MINED:
+            return data_db.query(Block.mining_time).select_from(
+                cross_join(Block, MiningReward, MiningReward.block == Block.hash)).filter(
+                MiningReward.address == address, Block.height <= height).order_by(
+                Block.mining_time.desc()).limit(1).scalar()
+        return data_db.query(func.max(Block.mining_time)).select_from(Vote).join(Transaction, Block).filter(
+            Vote.from_address == address, Block.height <= height).scalar()
+
+    @staticmethod
+    def record(data_db, kind, first, last):
+        """Add the mining rewards or votes of the blocks `first` to `last`"""
+        from app.models import Block
+        rows = AddressStats.activity(data_db, kind, Block.height.between(first, last))
+        if not rows:
+            return
+
+        latest = {}
+        for address, mining_time in rows:
+            if address not in latest or mining_time > latest[address]:
+                latest[address] = mining_time
+        column = 'last_' + kind
+        existing = AddressStats.load(data_db, latest)
+        for address, mining_time in latest.items():
+            stats = existing.get(address)
+            if stats is None:
+                stats = AddressStats(address=address)
+                data_db.add(stats)
+            if getattr(stats, column) is None or getattr(stats, column) < mining_time:
+                setattr(stats, column, mining_time)
+
+        start = AddressStats.window_start()
+        AddressActivity.add(data_db, kind, Counter(
+            (address, hour_of(mining_time)) for address, mining_time in rows if mining_time >= start))
+        data_db.query(AddressActivity).filter(AddressActivity.hour < start).delete(synchronize_session=False)
+        coalesced.mark(data_db, 'community_stats_changed')
+
+    @staticmethod
+    def revert_above(data_db, height):
+        """Remove the activity of blocks above `height`, must run before the blocks are deleted"""
+        from app.models import Block
+        start = AddressStats.window_start()
+        for kind in (AddressStats.MINED, AddressStats.VOTED):
+            rows = AddressStats.activity(data_db, kind, Block.height > height)
+            if not rows:
+                continue
+            AddressActivity.add(data_db, kind, Counter(
+                (address, hour_of(mining_time)) for address, mining_time in rows if mining_time >= start), -1)
+            for address, stats in AddressStats.load(data_db, {address for address, mining_time in rows}).items():
+                setattr(stats, 'last_' + kind, AddressStats.latest(data_db, kind, address, height))
+            coalesced.mark(data_db, 'community_stats_changed')
+
+    @staticmethod
+    def rebuild(data_db):
+        """Recompute both tables from the whole history"""
+        from app.models import Block, MiningReward, Vote
+        data_db.query(AddressStats).delete()
+        data_db.query(AddressActivity).delete()
+
+        stats = {}
+        for last_mined, address in MiningReward.last_mined(data_db):
+            stats[address] = dict(address=address, last_mined=last_mined, last_voted=None)
+        for last_voted, address in Vote.last_voted(data_db):
+            stats.setdefault(address, dict(address=address, last_mined=None))['last_voted'] = last_voted
+        if stats:
+            data_db.execute(AddressStats.__table__.insert(), list(stats.values()))
+
+        start = AddressStats.window_start()
+        for kind in (AddressStats.MINED, AddressStats.VOTED):
+            AddressActivity.add(data_db, kind, Counter(
+                (address, hour_of(mining_time))
+                for address, mining_time in AddressStats.activity(data_db, kind, Block.mining_time >= start)))
+        log.debug('rebuilt address stats with {} entries'.format(len(stats)))
+
+    @staticmethod
+    def backfill(data_db):
+        """Build the tables if they are new (e.g. created on an existing database)"""
+        from app.models import MiningReward
+        if data_db.query(AddressStats.address).first() is None and data_db.query(MiningReward.block).first():
+            AddressStats.rebuild(data_db)
+            data_db.commit()
+
+    @staticmethod
+    def get_stats(data_db, start=None) -> dict:
+        """{address: Stats} of every address that mined or voted, counted from the hour `start` (24 hours ago)"""
+        counts = {address: (mined, voted) for address, mined, voted in data_db.query(
+            AddressActivity.address, func.sum(AddressActivity.mined), func.sum(AddressActivity.voted)).filter(
+            AddressActivity.hour >= (start or AddressStats.window_start())).group_by(AddressActivity.address)}
+        return {
+            stats.address: Stats(stats.last_mined, stats.last_voted, *counts.get(stats.address, (0, 0)))
+            for stats in data_db.query(AddressStats)
+        }
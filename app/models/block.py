@@ -15,8 +15,9 @@ class Block(data_base):
     """Blocks"""
 
     hash = Column(LargeBinary, primary_key=True)
-    mining_time = Column(DateTime)
+    mining_time = Column(DateTime, index=True)
     height = Column(Integer, index=True)
+    txcount = Column(Integer)
 
     class Meta:
         database = data_db
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from sqlalchemy import Column, String
+
+from app.models.db import cross_join, data_base, data_session_scope, profile_session_scope
+from app.signals import signals, coalesced
+
+log = logging.getLogger(__name__)
+
+
+class CurrentAlias(data_base):
+    __tablename__ = "current_alias"
+    """Resolved address <-> alias mapping derived from the alias history"""
+
+    address = Column(String, primary_key=True)
+    alias = Column(String, unique=True, nullable=False)
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    def __repr__(self):
+        return "CurrentAlias(%s, %s)" % (self.address, self.alias)
+
+    @staticmethod
+    def resolve(alias_entries) -> dict:
+        """Resolve alias history entries ordered newest first.
+
+        The most recent registration of an address wins unless its alias was
+        taken over by a newer registration of another address.
+        """
+        address_to_alias = {}
+        alias_in_use = set()
+        for address, alias in alias_entries:
+            if address in address_to_alias or alias in alias_in_use:
+                continue
+            address_to_alias[address] = alias
+            alias_in_use.add(alias)
+        return address_to_alias
+
+    @staticmethod
+    def rebuild(data_db):
+        """Recompute the whole table from the alias history (e.g. after a reorg)"""
+        from app.models import Alias, Block, Transaction
+        history = data_db.query(Alias.address, Alias.alias).join(Transaction, Block).order_by(
+            Block.height.desc(), Transaction.pos_in_block.desc(), Alias.pos_in_tx.desc())
+        rows = [dict(address=address, alias=alias) for address, alias in CurrentAlias.resolve(history).items()]
+        data_db.query(CurrentAlias).delete()
+        if rows:
+            data_db.execute(CurrentAlias.__table__.insert(), rows)
+        log.debug('rebuilt current alias table with %s entries' % len(rows))
+
+    @staticmethod
+    def update_since(data_db, height) -> bool:
+        """Apply alias registrations from blocks above `height` in chain order.
+
+        Registrations that neither reuse an assigned alias nor replace an existing
+        alias of the address are inserted directly. Anything else may shift older
+        registrations so the table is rebuilt. Returns True if aliases changed.
+        """
+        from app.models import Alias, Block, Transaction
+        new_entries = data_db.query(Alias.address, Alias.alias).select_from(
+            cross_join(cross_join(Block, Transaction, Block.hash == Transaction.block), Alias,
+                       Transaction.txid == Alias.txid)).filter(
+            Block.height > height).order_by(
+            Block.height.asc(), Transaction.pos_in_block.asc(), Alias.pos_in_tx.asc()).all()
+
+        changed = False
+        for address, alias in new_entries:
+            current = data_db.query(CurrentAlias).filter(
+                (CurrentAlias.address == address) | (CurrentAlias.alias == alias)).all()
+            if not current:
+                data_db.execute(CurrentAlias.__table__.insert(), dict(address=address, alias=alias))
+                changed = True
+            elif len(current) == 1 and current[0].address == address and current[0].alias == alias:
+                continue
+            else:
+                CurrentAlias.rebuild(data_db)
+                return True
+        return changed
+
+    @staticmethod
+    def get_aliases(data_db) -> dict:
+        """Return the cached address -> alias mapping. Do not modify the result."""
+        with CurrentAlias._cache_lock:
+            if CurrentAlias._cache is None:
+                CurrentAlias._cache = dict(data_db.query(CurrentAlias.address, CurrentAlias.alias).all())
+            return CurrentAlias._cache
+
+    @staticmethod
+    def get_alias(data_db, address) -> str:
+        return CurrentAlias.get_aliases(data_db).get(address, '')
+
+    @staticmethod
+    def get_address(data_db, alias) -> str:
+        return data_db.query(CurrentAlias.address).filter(CurrentAlias.alias == alias).scalar()
+
+    @staticmethod
+    def invalidate_cache():
+        with CurrentAlias._cache_lock:
+            CurrentAlias._cache = None
+
+    @staticmethod
+    def publish_changes():
+        """Refresh caches and the profile alias after alias changes were committed"""
+        from app.models import Profile
+        CurrentAlias.invalidate_cache()
+        with profile_session_scope() as profile_db, data_session_scope() as data_db:
+            profile = Profile.get_active(profile_db)
+            alias = CurrentAlias.get_alias(data_db, profile.address)
+            if alias != profile.alias:
+                profile.alias = alias
+        coalesced.emit('alias_list_changed')
+
+
+signals.alias_list_changed.connect(CurrentAlias.invalidate_cache)
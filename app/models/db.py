@@ -8,9 +8,14 @@ See models.__init__.py for initialization functions.
 """
 from contextlib import contextmanager
 
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.event import listens_for
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Join
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
 from sqlalchemy.ext.declarative import declarative_base
 
+from app.signals import coalesced
+
 profile_db = scoped_session(sessionmaker(expire_on_commit=False))
 # todo rename those e.g. cache_db
 data_db = scoped_session(sessionmaker(expire_on_commit=False))
@@ -45,3 +50,33 @@ def data_session_scope():
     finally:
         session.expunge_all()
         session.close()
+
+
+@listens_for(Session, "after_commit")
+def emit_dirty_topics(session):
+    coalesced.on_commit(session)
+
+
+@listens_for(Session, "after_rollback")
+def drop_dirty_topics(session):
+    coalesced.on_rollback(session)
+
+
+class CrossJoin(Join):
+    """Inner join that sqlite does not reorder, the left side stays the outer loop.
+
+    Without table statistics the query planner tends to scan the joined table
+    instead of starting from a selective block range or the mining_time index.
+    """
+
+
+def cross_join(left, right, onclause) -> CrossJoin:
+    return CrossJoin(getattr(left, '__table__', left), getattr(right, '__table__', right), onclause)
+
+
+@compiles(CrossJoin)
+def compile_cross_join(join, compiler, asfrom=False, **kw):
+    return '{} CROSS JOIN {} ON {}'.format(
+        compiler.process(join.left, asfrom=True, **kw),
+        compiler.process(join.right, asfrom=True, **kw),
+        compiler.process(join.onclause, **kw))
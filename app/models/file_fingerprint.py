@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String
+
+from app.models.profile import Profile_Base
+
+log = logging.getLogger(__name__)
+
+FileKey = namedtuple('FileKey', 'path size mtime_ns inode')
+
+
+class FileFingerprint(Profile_Base):
+    """Cached digests of local files (timestamp sha256 and ISCC components).
+
+    Lives in the profile database so the cache is shared by all profiles. An
+    entry is only valid while path, size, mtime and inode of the file match.
+    The least recently used entries are evicted above MAX_ENTRIES.
+    """
+    __tablename__ = 'file_fingerprints'
+
+    MAX_ENTRIES = 10000
+
+    path = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    inode = Column(Integer, nullable=False)
+    sha256 = Column(String)
+    content_id = Column(String)
+    data_id = Column(String)
+    instance_id = Column(String)
+    instance_hash = Column(String)
+    last_used = Column(DateTime, index=True)
+
+    def __repr__(self):
+        return 'FileFingerprint(%s, %s)' % (self.path, self.sha256)
+
+    @property
+    def has_iscc(self) -> bool:
+        return None not in (self.content_id, self.data_id, self.instance_id, self.instance_hash)
+
+    @staticmethod
+    def key(file_path) -> FileKey:
+        stat = os.stat(file_path)
+        return FileKey(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    @staticmethod
+    def lookup(profile_db, key: FileKey) -> 'FileFingerprint':
+        """Return the valid cache entry for `key` or None"""
+        entry = profile_db.query(FileFingerprint).get(key.path)
+        if entry is None or (entry.size, entry.mtime_ns, entry.inode) != (key.size, key.mtime_ns, key.inode):
+            return None
+        entry.last_used = datetime.now()
+        return entry
+
+    @staticmethod
+    def store(profile_db, key: FileKey, **digests) -> 'FileFingerprint':
+        """Add `digests` to the cache entry for `key`, keeping digests that are still valid"""
+        entry = FileFingerprint.lookup(profile_db, key)
+        if entry is None:
+            profile_db.query(FileFingerprint).filter(FileFingerprint.path == key.path).delete()
+            entry = FileFingerprint(path=key.path, size=key.size, mtime_ns=key.mtime_ns, inode=key.inode)
+            profile_db.add(entry)
+        for name, value in digests.items():
+            setattr(entry, name, value)
+        entry.last_used = datetime.now()
+        profile_db.flush()
+        FileFingerprint.evict(profile_db)
+        return entry
+
+    @staticmethod
+    def evict(profile_db):
+        """Remove least recently used entries above MAX_ENTRIES"""
+        cutoff = profile_db.query(FileFingerprint.last_used).order_by(
+            FileFingerprint.last_used.desc()).offset(FileFingerprint.MAX_ENTRIES).limit(1).scalar()
+        if cutoff is not None:
+            removed = profile_db.query(FileFingerprint).filter(
+                FileFingerprint.last_used <= cutoff).delete(synchronize_session=False)
+            log.debug('evicted {} file fingerprints'.format(removed))
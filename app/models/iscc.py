@@ -1,21 +1,45 @@
 # -*- coding: utf-8 -*-
 import logging
+import re
 
-from sqlalchemy import Column, String, ForeignKey, Integer, and_, or_
+from sqlalchemy import Column, Float, String, ForeignKey, Index, Integer, and_, or_, func, literal_column, select, text
 from sqlalchemy import exists
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.event import listens_for
+from sqlalchemy.orm import object_session
 
-from app.models.db import data_base
-from app.signals import signals
+from app.models.db import data_base, cross_join
+from app.signals import coalesced
 
 log = logging.getLogger(__name__)
 
+# one dash separated component of an ISCC code, only the last one may be incomplete
+ISCC_CODE_PART = re.compile(r'^C[0-9A-Za-z]{1,12}$')
+
+# Full text index over titles and code components (external content table kept in sync by triggers)
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS iscc_fts USING fts5("
+    "title, meta_id, content_id, data_id, instance_id, content='isccs', content_rowid='iscc_id', prefix='2 3 4')",
+    "CREATE TRIGGER IF NOT EXISTS isccs_fts_insert AFTER INSERT ON isccs BEGIN "
+    "INSERT INTO iscc_fts(rowid, title, meta_id, content_id, data_id, instance_id) "
+    "VALUES (new.iscc_id, new.title, new.meta_id, new.content_id, new.data_id, new.instance_id); END",
+    "CREATE TRIGGER IF NOT EXISTS isccs_fts_delete AFTER DELETE ON isccs BEGIN "
+    "INSERT INTO iscc_fts(iscc_fts, rowid, title, meta_id, content_id, data_id, instance_id) "
+    "VALUES ('delete', old.iscc_id, old.title, old.meta_id, old.content_id, old.data_id, old.instance_id); END",
+    "CREATE TRIGGER IF NOT EXISTS isccs_fts_update AFTER UPDATE ON isccs BEGIN "
+    "INSERT INTO iscc_fts(iscc_fts, rowid, title, meta_id, content_id, data_id, instance_id) "
+    "VALUES ('delete', old.iscc_id, old.title, old.meta_id, old.content_id, old.data_id, old.instance_id); "
+    "INSERT INTO iscc_fts(rowid, title, meta_id, content_id, data_id, instance_id) "
+    "VALUES (new.iscc_id, new.title, new.meta_id, new.content_id, new.data_id, new.instance_id); END",
+)
+
 
 class ISCC(data_base):
     __tablename__ = "isccs"
 
     iscc_id = Column(Integer, autoincrement=True, primary_key=True)
-    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"))
+    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+                  index=True)
     meta_id = Column(String, index=True)
     content_id = Column(String, index=True)
     data_id = Column(String, index=True)
@@ -23,6 +47,18 @@ class ISCC(data_base):
     address = Column(String)
     title = Column(String)
 
+    # must match sort_expression(SORT_TITLE) literally to be used for sorting
+    __table_args__ = (Index('ix_isccs_title', func.coalesce(title, literal_column("''"))),)
+
+    SORT_ISCC = 'iscc'
+    SORT_TITLE = 'title'
+    SORT_DATE = 'date'
+    SORT_PUBLISHER = 'publisher'
+    SORT_RANK = 'rank'
+
+    # set by init_search_index if sqlite supports fts5
+    fts_available = False
+
     def __repr__(self):
         return "(%s-%s-%s-%s)" % (self.meta_id, self.content_id, self.data_id, self.instance_id)
 
@@ -55,29 +91,136 @@ class ISCC(data_base):
             query = query.offset(page * page_size)
         return query.all()
 
+    @staticmethod
+    def init_search_index(data_db):
+        """Create the full text index if needed and fill it if it is out of date"""
+        triggers = data_db.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'isccs_fts_%'").scalar()
+        try:
+            for statement in FTS_DDL:
+                data_db.execute(statement)
+        except OperationalError as e:
+            log.debug('sqlite full text search not available ({}), using slow search'.format(e))
+            data_db.rollback()
+            ISCC.fts_available = False
+            return
+        if triggers != 3:
+            # new index or the isccs table was recreated
+            log.debug('rebuild iscc search index')
+            data_db.execute("INSERT INTO iscc_fts(iscc_fts) VALUES ('rebuild')")
+        data_db.commit()
+        ISCC.fts_available = True
+
+    @staticmethod
+    def parse_code(search_term) -> []:
+        """Return the components of a (partial) dash separated ISCC code or None"""
+        parts = search_term.strip().split('-')
+        if not 2 <= len(parts) <= 4 or not all(ISCC_CODE_PART.match(part) for part in parts):
+            return None
+        if any(len(part) != 13 for part in parts[:-1]):
+            return None
+        return parts
+
+    @staticmethod
+    def fts_query(search_term) -> str:
+        """Prefix match every whitespace separated term in any column"""
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in search_term.split())
+
+    @staticmethod
+    def fts_matches(search_term):
+        """Selectable of (iscc_id, rank) for a full text search, best matches have the lowest rank"""
+        return text("SELECT rowid AS iscc_id, rank FROM iscc_fts WHERE iscc_fts MATCH :query").columns(
+            iscc_id=Integer, rank=Float).bindparams(query=ISCC.fts_query(search_term)).alias('fts')
+
+    @staticmethod
+    def search_filter(search_term):
+        parts = ISCC.parse_code(search_term)
+        if parts is not None:
+            components = (ISCC.meta_id, ISCC.content_id, ISCC.data_id, ISCC.instance_id)
+            return and_(*[column == part if len(part) == 13 else column.like(part + '%')
+                          for column, part in zip(components, parts)])
+        if ISCC.fts_available:
+            matches = ISCC.fts_matches(search_term)
+            return ISCC.iscc_id.in_(select([matches.c.iscc_id]))
+        return or_(
+            ISCC.title.ilike("%" + search_term + "%"),
+            ISCC.meta_id.ilike(search_term + "%"),
+            ISCC.content_id.ilike(search_term + "%"),
+            ISCC.data_id.ilike(search_term + "%"),
+            ISCC.instance_id.ilike(search_term + "%")
+        )
+
+    @staticmethod
+    def sort_expression(sort_key):
+        from app.models import Block, CurrentAlias
+        return {
+            ISCC.SORT_ISCC: ISCC.meta_id,
+            ISCC.SORT_TITLE: func.coalesce(ISCC.title, literal_column("''")),
+            ISCC.SORT_DATE: Block.mining_time,
+            ISCC.SORT_PUBLISHER: func.coalesce(CurrentAlias.alias, ISCC.address),
+        }[sort_key]
+
+    @staticmethod
+    def get_page(data_db, search_term=None, sort_key=None, descending=True, after=None, page_size=100) -> []:
+        """Return one page of ISCCs with mining time ordered by `sort_key` and iscc_id.
+
+        Without `sort_key` full text searches are ranked by relevance, everything
+        else is ordered newest first. Uses keyset pagination: `after` is the (sort_value, iscc_id) of the last
+        row of the previous page, so the query cost does not grow with the page
+        number. Every row has the columns iscc_id, meta_id, content_id, data_id,
+        instance_id, title, address, mining_time and sort_value.
+        """
+        from app.models import Transaction, Block, CurrentAlias
+        search_term = (search_term or '').strip()
+        ranked = ISCC.fts_available and bool(ISCC.fts_query(search_term)) and ISCC.parse_code(search_term) is None
+        if sort_key is None:
+            sort_key, descending = (ISCC.SORT_RANK, False) if ranked else (ISCC.SORT_DATE, True)
+        if sort_key == ISCC.SORT_RANK and not ranked:
+            sort_key, descending = ISCC.SORT_DATE, True
+
+        matches = ISCC.fts_matches(search_term) if sort_key == ISCC.SORT_RANK else None
+        sort_expr = matches.c.rank if matches is not None else ISCC.sort_expression(sort_key)
+        query = data_db.query(
+            ISCC.iscc_id, ISCC.meta_id, ISCC.content_id, ISCC.data_id, ISCC.instance_id, ISCC.title, ISCC.address,
+            Block.mining_time, sort_expr.label('sort_value')
+        )
+        if sort_key == ISCC.SORT_DATE and not search_term:
+            # walk the mining_time index instead of sorting all isccs
+            query = query.select_from(cross_join(cross_join(Block, Transaction, Block.hash == Transaction.block),
+                                                 ISCC, Transaction.txid == ISCC.txid))
+        else:
+            query = query.select_from(ISCC).join(Transaction, Block)
+        query = query.outerjoin(CurrentAlias, CurrentAlias.address == ISCC.address)
+        if matches is not None:
+            query = query.join(matches, matches.c.iscc_id == ISCC.iscc_id)
+        elif search_term:
+            query = query.filter(ISCC.search_filter(search_term))
+        if after is not None:
+            sort_value, iscc_id = after
+            # the redundant range lets sqlite seek in the index of the sort expression
+            if descending:
+                query = query.filter(sort_expr <= sort_value, or_(
+                    sort_expr < sort_value, and_(sort_expr == sort_value, ISCC.iscc_id < iscc_id)))
+            else:
+                query = query.filter(sort_expr >= sort_value, or_(
+                    sort_expr > sort_value, and_(sort_expr == sort_value, ISCC.iscc_id > iscc_id)))
+        if descending:
+            query = query.order_by(sort_expr.desc(), ISCC.iscc_id.desc())
+        else:
+            query = query.order_by(sort_expr.asc(), ISCC.iscc_id.asc())
+        return query.limit(page_size).all()
+
     @staticmethod
     def filter_iscc(data_db, search_term) -> []:
         from app.models import Transaction, Block
         return data_db.query(ISCC, Block.mining_time).join(Transaction, Block)\
-            .filter(or_(
-                ISCC.title.ilike("%" + search_term + "%"),
-                ISCC.meta_id.ilike(search_term + "%"),
-                ISCC.content_id.ilike(search_term + "%"),
-                ISCC.data_id.ilike(search_term + "%"),
-                ISCC.instance_id.ilike(search_term + "%")
-            )).order_by(Block.mining_time.desc()).all()
+            .filter(ISCC.search_filter(search_term)).order_by(Block.mining_time.desc()).all()
 
     @staticmethod
     def filter_iscc_paged(data_db, search_term, page = 0, page_size = None) -> []:
         from app.models import Transaction, Block
         query = data_db.query(ISCC, Block.mining_time).join(Transaction, Block) \
-            .filter(or_(
-            ISCC.title.ilike("%" + search_term + "%"),
-            ISCC.meta_id.ilike(search_term + "%"),
-            ISCC.content_id.ilike(search_term + "%"),
-            ISCC.data_id.ilike(search_term + "%"),
-            ISCC.instance_id.ilike(search_term + "%")
-        )).order_by(Block.mining_time.desc())
+            .filter(ISCC.search_filter(search_term)).order_by(Block.mining_time.desc())
         if page_size:
             query = query.limit(page_size)
         if page and page_size:
@@ -85,5 +228,5 @@ class ISCC(data_base):
         return query.all()
 
 @listens_for(ISCC, "after_insert")
-def after_update(mapper, connection, alias):
-    signals.iscc_inserted.emit()
+def after_insert(mapper, connection, iscc):
+    coalesced.mark(object_session(iscc), 'iscc_inserted')
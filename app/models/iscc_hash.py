@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import namedtuple
+from itertools import combinations
+
+import iscc
+from sqlalchemy import Column, ForeignKey, Index, Integer, text
+from sqlalchemy.event import listens_for
+
+from app.models.db import data_base
+from app.models.iscc import ISCC
+
+log = logging.getLogger(__name__)
+
+# ISCC with the hamming distances of its meta, content, data and instance id (None if not similar)
+Conflict = namedtuple('Conflict', 'iscc distances')
+
+
+def decode_component(code):
+    """Return (kind, 64 bit value) of an ISCC component or None for invalid codes"""
+    try:
+        digest = iscc.decode(code)
+    except (KeyError, ValueError, TypeError):
+        return None
+    if len(digest) != 9:
+        return None
+    # the lowest header bit only flags partial content
+    return digest[0] & 0xfe, int.from_bytes(digest[1:], 'big')
+
+
+def hamming_distance(a, b) -> int:
+    return bin(a ^ b).count('1')
+
+
+def neighbours(value, radius, bits=16):
+    """All values within `radius` bits of `value`"""
+    result = [value]
+    for distance in range(1, radius + 1):
+        for positions in combinations(range(bits), distance):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            result.append(flipped)
+    return result
+
+
+class ISCCHash(data_base):
+    __tablename__ = "iscc_hashes"
+    """Similarity hashes of the meta, content and data ids as 64 bit integers.
+
+    Every hash is split into four 16 bit partitions that are indexed separately.
+    Two hashes within hamming distance d share at least one partition within
+    distance d // 4 (pigeonhole), so candidates are found by index lookups of
+    the partition neighbourhoods and then verified.
+    """
+
+    PARTITIONS = 4
+    PARTITION_BITS = 16
+    DEFAULT_DISTANCE = 8
+    MAX_DISTANCE = 15
+
+    iscc_id = Column(Integer, ForeignKey('isccs.iscc_id', ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+                     primary_key=True)
+    kind = Column(Integer, primary_key=True)
+    # sqlite integers are signed
+    value = Column(Integer, nullable=False)
+    p0 = Column(Integer, nullable=False)
+    p1 = Column(Integer, nullable=False)
+    p2 = Column(Integer, nullable=False)
+    p3 = Column(Integer, nullable=False)
+
+    __table_args__ = tuple(Index('ix_iscc_hashes_kind_p%d' % i, 'kind', 'p%d' % i) for i in range(PARTITIONS))
+
+    def __repr__(self):
+        return "ISCCHash(%s, %s, %016x)" % (self.iscc_id, self.kind, self.value)
+
+    @staticmethod
+    def partitions(value) -> list:
+        mask = (1 << ISCCHash.PARTITION_BITS) - 1
+        return [(value >> (ISCCHash.PARTITION_BITS * i)) & mask for i in range(ISCCHash.PARTITIONS)]
+
+    @staticmethod
+    def to_signed(value) -> int:
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    @staticmethod
+    def rows_for(iscc_id, meta_id, content_id, data_id) -> list:
+        rows = []
+        for code in (meta_id, content_id, data_id):
+            decoded = decode_component(code)
+            if decoded is None:
+                continue
+            kind, value = decoded
+            row = dict(iscc_id=iscc_id, kind=kind, value=ISCCHash.to_signed(value))
+            row.update(('p%d' % i, part) for i, part in enumerate(ISCCHash.partitions(value)))
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def backfill(data_db):
+        """Index ISCCs that have no hashes yet (e.g. after the table was created)"""
+        missing = data_db.query(ISCC.iscc_id, ISCC.meta_id, ISCC.content_id, ISCC.data_id).filter(
+            ~ISCC.iscc_id.in_(data_db.query(ISCCHash.iscc_id))).all()
+        rows = [row for iscc_row in missing for row in ISCCHash.rows_for(*iscc_row)]
+        if rows:
+            log.debug('indexing similarity hashes of {} isccs'.format(len(missing)))
+            data_db.execute(ISCCHash.__table__.insert(), rows)
+
+    @staticmethod
+    def find_similar(data_db, code, max_distance=DEFAULT_DISTANCE) -> dict:
+        """Return {iscc_id: distance} of all hashes of the same kind within `max_distance` of `code`"""
+        decoded = decode_component(code)
+        if decoded is None:
+            return {}
+        kind, value = decoded
+        max_distance = min(max_distance, ISCCHash.MAX_DISTANCE)
+        radius = max_distance // ISCCHash.PARTITIONS
+        # One lookup per partition index (sqlite does not use several indexes for OR over different columns).
+        # The neighbourhoods are plain integers and inlined, binding hundreds of parameters is much slower.
+        lookups = [
+            'SELECT iscc_id, value FROM iscc_hashes WHERE kind = :kind AND p{} IN ({})'.format(
+                i, ','.join(str(n) for n in neighbours(part, radius, ISCCHash.PARTITION_BITS)))
+            for i, part in enumerate(ISCCHash.partitions(value))
+        ]
+        candidates = data_db.execute(text(' UNION '.join(lookups)), dict(kind=kind))
+        result = {}
+        for iscc_id, candidate in candidates:
+            distance = hamming_distance(candidate & ((1 << 64) - 1), value)
+            if distance <= max_distance:
+                result[iscc_id] = distance
+        return result
+
+    @staticmethod
+    def get_conflicts(data_db, meta_id, content_id, data_id, instance_id, max_distance=DEFAULT_DISTANCE) -> list:
+        """Registered ISCCs with a similar meta, content or data id or the same instance id.
+
+        Returns Conflict tuples ordered by the number of matching components and
+        their total distance.
+        """
+        found = [ISCCHash.find_similar(data_db, code, max_distance) for code in (meta_id, content_id, data_id)]
+        found.append({iscc_id: 0 for iscc_id, in data_db.query(ISCC.iscc_id).filter(ISCC.instance_id == instance_id)})
+        iscc_ids = set().union(*found)
+        if not iscc_ids:
+            return []
+        conflicts = [
+            Conflict(entry, tuple(distances.get(entry.iscc_id) for distances in found))
+            for entry in data_db.query(ISCC).filter(ISCC.iscc_id.in_(iscc_ids))
+        ]
+        conflicts.sort(key=lambda c: (-sum(d is not None for d in c.distances),
+                                      sum(d for d in c.distances if d is not None), c.iscc.iscc_id))
+        return conflicts
+
+
+@listens_for(ISCC, "after_insert")
+def index_iscc(mapper, connection, target):
+    rows = ISCCHash.rows_for(target.iscc_id, target.meta_id, target.content_id, target.data_id)
+    if rows:
+        connection.execute(ISCCHash.__table__.insert(), rows)
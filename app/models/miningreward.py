@@ -1,8 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import datetime, timedelta
 
-from sqlalchemy import Column, String, ForeignKey, func
+from sqlalchemy import Column, String, ForeignKey, Index, func
 
 from app.models.db import data_base
 
@@ -16,6 +15,9 @@ class MiningReward(data_base):
     block = Column(String, ForeignKey('blocks.hash', ondelete="CASCADE", deferrable=True, initially="DEFERRED"), primary_key=True)
     address = Column(String)
 
+    # covers the per address aggregates
+    __table_args__ = (Index('ix_mining_rewards_address_block', 'address', 'block'),)
+
     def __repr__(self):
         return "MiningReward(%s, %s)" % (self.block, self.address)
 
@@ -26,16 +28,7 @@ class MiningReward(data_base):
         return (
             data_db.
             query(func.max(Block.mining_time).label("last_mined"), MiningReward.address).
-            join(MiningReward).
+            select_from(MiningReward).
+            join(Block).
             group_by(MiningReward.address)
         ).all()
-
-    @staticmethod
-    def mined_last_24h(data_db):
-        from app.models import Block
-        return (
-            data_db.
-            query(MiningReward.address, func.count("*").label("count")).
-            join(Block).filter(datetime.now() - timedelta(days=1) <= Block.mining_time)
-            .group_by(MiningReward.address)
-        ).all()
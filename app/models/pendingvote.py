@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
 
-from sqlalchemy import String, Column, Enum, Integer, func, distinct
+from sqlalchemy import String, Column, Enum, Index, Integer, func, distinct
 
 from app.enums import PermTypes
 from app.models.db import data_base
@@ -21,6 +21,8 @@ class PendingVote(data_base):
     start_block = Column(Integer, primary_key=True)
     end_block = Column(Integer, primary_key=True)
 
+    __table_args__ = (Index('ix_pending_votes_blocks', 'start_block', 'end_block', 'address_to', 'perm_type'),)
+
     def __repr__(self):
         return "Vote(%s, %s, %s, %s)" % (self.txid, self.from_address, self.to_address, self.perm_type)
 
@@ -29,7 +31,7 @@ class PendingVote(data_base):
         return (
             data_db.
             query(PendingVote.address_to, func.count("*").label("count")).
-            filter(PendingVote.perm_type == perm_type and PendingVote.start_block == 0 and PendingVote.end_block == 0).
+            filter((PendingVote.perm_type == perm_type) & (PendingVote.start_block == 0) & (PendingVote.end_block == 0)).
             group_by(PendingVote.address_to)
         ).all()
 
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
 
-from sqlalchemy import Column, String, Enum, Integer
+from sqlalchemy import Column, String, Enum, Index, Integer
 
 from app import enums
 from app.enums import PermTypes
@@ -22,6 +22,8 @@ class Permission(data_base):
     start_block = Column(Integer)
     end_block = Column(Integer)
 
+    __table_args__ = (Index('ix_permissions_type_blocks', 'perm_type', 'start_block', 'end_block'),)
+
 
     def __repr__(self):
         return "Permission(%s, %s, %s, %s)" % (
@@ -4,7 +4,7 @@ import logging
 import os
 from decimal import Decimal
 
-from sqlalchemy import String, Column, Boolean, Float
+from sqlalchemy import String, Column, Boolean, Float, Integer
 from sqlalchemy.event import listens_for
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -37,6 +37,10 @@ class Profile(Profile_Base):
     is_admin = Column(Boolean, default=False)
     is_miner = Column(Boolean, default=False)
 
+    # block sync tuning
+    sync_workers = Column(Integer, default=4)
+    sync_queue_depth = Column(Integer, default=16)
+
     def __repr__(self):
         return 'Profile(%s, %s, %s...)' % (self.name, self.rpc_host, self.rpc_user)
 
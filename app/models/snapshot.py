@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """Read-only query results shared by the model updaters for one synced chain state.
+
+    `get` returns compute(data_db, *args) computed at most once per version.
+    The version is the synced header and body height of the sync checkpoint
+    plus a generation that `invalidate` increases after commits that do not
+    advance the heights (permission syncs, reorgs). Entries of older versions
+    are evicted as soon as a newer version is seen. An updater that asks for a
+    dataset another thread is computing waits for that result.
+
+    `compute` is part of the key, so it must be a function or staticmethod
+    (not a lambda) and the arguments must be hashable.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.generation = 0
+        self.version = None
+        self.metrics = dict(hits=0, misses=0, waits=0, evictions=0)
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Call after committing changes that do not advance the synced heights, before signaling them"""
+        with self._lock:
+            self.generation += 1
+
+    def clear(self):
+        """Drop everything (e.g. after switching the data db)"""
+        with self._lock:
+            self.generation += 1
+            self.version = None
+            self._entries.clear()
+
+    def current_version(self, data_db) -> tuple:
+        from app.models import SyncCheckpoint
+        # the generation is read first: data read afterwards is at least as new
+        with self._lock:
+            generation = self.generation
+        heights = data_db.query(SyncCheckpoint.headers_height, SyncCheckpoint.bodies_height).first()
+        return tuple(heights or (-1, -1)) + (generation,)
+
+    def get(self, data_db, compute, *args):
+        version = self.current_version(data_db)
+        key = (compute, args)
+        while True:
+            with self._lock:
+                self._advance(version)
+                if version != self.version:
+                    # a newer version was seen meanwhile, do not cache outdated results
+                    self.metrics['misses'] += 1
+                    return compute(data_db, *args)
+                if key in self._entries:
+                    self.metrics['hits'] += 1
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    self.metrics['misses'] += 1
+                    break
+                self.metrics['waits'] += 1
+            # another updater computes this dataset, use its result (or compute after it failed)
+            pending.wait()
+
+        try:
+            result = compute(data_db, *args)
+            with self._lock:
+                if version == self.version:
+                    self._entries[key] = result
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.metrics['evictions'] += 1
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def _advance(self, version):
+        """Evict all entries if `version` is newer than the cached version (lock held)"""
+        if self.version is not None and (version[2], version[:2]) <= (self.version[2], self.version[:2]):
+            return
+        if self._entries:
+            self.metrics['evictions'] += len(self._entries)
+            log.debug('snapshot cache advances to {}, evicting {} entries ({})'.format(
+                version, len(self._entries), ', '.join('{} {}'.format(k, v) for k, v in self.metrics.items())))
+        self._entries.clear()
+        self.version = version
+
+
+snapshots = SnapshotCache()
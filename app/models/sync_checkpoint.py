@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, LargeBinary, DateTime
+
+from app.models.db import data_base
+
+log = logging.getLogger(__name__)
+
+
+class SyncCheckpoint(data_base):
+    __tablename__ = "sync_checkpoint"
+    """Progress of the staged block sync (single row)"""
+
+    checkpoint_id = Column(Integer, primary_key=True)
+    # blocks and mining rewards are stored up to this height
+    headers_height = Column(Integer, nullable=False, default=-1)
+    headers_hash = Column(LargeBinary)
+    # relevant transactions are stored for all blocks up to this height
+    bodies_height = Column(Integer, nullable=False, default=-1)
+    # permissions and pending votes were synced after storing bodies up to this height
+    permissions_height = Column(Integer, nullable=False, default=-1)
+    updated = Column(DateTime)
+
+    def __repr__(self):
+        return "SyncCheckpoint(headers=%s, bodies=%s)" % (self.headers_height, self.bodies_height)
+
+    @staticmethod
+    def get(data_db) -> 'SyncCheckpoint':
+        checkpoint = data_db.query(SyncCheckpoint).first()
+        if checkpoint is None:
+            checkpoint = SyncCheckpoint(checkpoint_id=1, headers_height=-1, bodies_height=-1, permissions_height=-1)
+            data_db.add(checkpoint)
+        return checkpoint
+
+    @staticmethod
+    def rewind(data_db, height):
+        """Forget progress above `height` (blocks above were removed)"""
+        from app.models import Block
+        checkpoint = SyncCheckpoint.get(data_db)
+        if checkpoint.headers_height > height:
+            checkpoint.headers_height = height
+            checkpoint.headers_hash = data_db.query(Block.hash).filter(Block.height == height).scalar()
+        checkpoint.bodies_height = min(checkpoint.bodies_height, height)
+        # removed blocks may have contained votes
+        checkpoint.permissions_height = -1
+        checkpoint.updated = datetime.now()
@@ -13,9 +13,10 @@ class Timestamp(data_base):
     __tablename__ = "timestamps"
 
     timestamp_id = Column(Integer, autoincrement=True, primary_key=True)
-    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"))
+    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+                  index=True)
     pos_in_tx = Column(Integer)
-    address = Column(String)
+    address = Column(String, index=True)
     hash = Column(String, index=True)
     comment = Column(String)
 
@@ -24,18 +25,19 @@ class Timestamp(data_base):
 
     @staticmethod
     def get_timestamps_for_hash(data_db, hash_value: str) -> []:
-        # The first table mentioned is in the FROM clause
         return (data_db.
                 query(Block.mining_time, Timestamp.address, Timestamp.comment).
+                select_from(Timestamp).
                 join(Transaction, Timestamp.txid == Transaction.txid).
-                join(Timestamp, Block.hash == Transaction.block).
+                join(Block, Block.hash == Transaction.block).
                 filter(Timestamp.hash == hash_value).
                 order_by(Block.height.asc(), Transaction.pos_in_block.asc(), Timestamp.pos_in_tx.asc())
                 ).all()
 
     @staticmethod
     def get_timestamps_for_address(data_db, address: str):
-        result = data_db.query(Block.mining_time, Timestamp.hash, Timestamp.comment).join(Transaction, Timestamp).filter(Timestamp.address == address).all()
+        result = data_db.query(Block.mining_time, Timestamp.hash, Timestamp.comment).select_from(Timestamp).join(
+            Transaction, Block).filter(Timestamp.address == address).all()
 
         return result
 
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
 
-from sqlalchemy import String, Column, Integer, ForeignKey, LargeBinary, exists
+from sqlalchemy import String, Column, Integer, ForeignKey, LargeBinary, Index, exists
 
 from app.models.db import data_base
 
@@ -16,6 +16,8 @@ class Transaction(data_base):
     block = Column(LargeBinary, ForeignKey('blocks.hash', deferrable=True, ondelete="CASCADE", initially="DEFERRED"), nullable=True)
     pos_in_block = Column(Integer)
 
+    __table_args__ = (Index('ix_transactions_block_pos_in_block', 'block', 'pos_in_block'),)
+
     def __repr__(self):
         return "Transaction(%s)" % (self.txid)
 
@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import timedelta, datetime
 
-from sqlalchemy import Column, String, ForeignKey, Enum, Integer, func
+from sqlalchemy import Column, String, ForeignKey, Enum, Index, Integer, func, exists
 
 from app.enums import PermTypes
-from app.models.db import data_base
+from app.models.db import cross_join, data_base
 
 log = logging.getLogger(__name__)
 
@@ -14,7 +13,8 @@ class Vote(data_base):
     __tablename__ = "votes"
 
     vote_id = Column(Integer, autoincrement=True, primary_key=True)
-    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"))
+    txid = Column(String, ForeignKey('transactions.txid', ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+                  index=True)
     pos_in_tx = Column(Integer)
     from_address = Column(String)
     to_address = Column(String)
@@ -22,6 +22,9 @@ class Vote(data_base):
     end_block = Column(Integer)
     perm_type = Column(Enum(PermTypes))
 
+    # covers the per address aggregates
+    __table_args__ = (Index('ix_votes_from_address_txid', 'from_address', 'txid'),)
+
     def __repr__(self):
         return "Vote(%s, %s, %s, %s)" % (self.txid, self.from_address, self.to_address, self.perm_type)
 
@@ -31,12 +34,16 @@ class Vote(data_base):
         return (
             data_db.
             query(func.max(Block.mining_time).label("last_voted"), Vote.from_address).
-            join(Transaction, Vote).
+            select_from(Vote).
+            join(Transaction, Block).
             group_by(Vote.from_address)
         ).all()
 
     @staticmethod
-    def voted_last_24h(data_db):
+    def voted_since(data_db, height) -> bool:
+        """Check if votes were recorded in blocks above `height`"""
         from app.models import Transaction, Block
-        return data_db.query(func.count(Vote.txid).label("count"), Vote.from_address).join(Transaction, Block).filter(
-            datetime.now() - timedelta(days=1) <= Block.mining_time).group_by(Vote.from_address).all()
\ No newline at end of file
+        return data_db.query(
+            exists().select_from(cross_join(cross_join(Block, Transaction, Block.hash == Transaction.block), Vote,
+                                            Transaction.txid == Vote.txid)).where(Block.height > height)
+        ).scalar()
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from mcrpc.exceptions import RpcError
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, and_, func, or_
+
+from app.models.db import data_base
+from app.signals import coalesced
+
+log = logging.getLogger(__name__)
+
+
+class WalletCheckpoint(data_base):
+    __tablename__ = "wallet_checkpoint"
+    """Progress of the wallet history download (single row)"""
+
+    checkpoint_id = Column(Integer, primary_key=True)
+    # all wallet transactions older than the oldest stored one were downloaded
+    complete = Column(Boolean, nullable=False, default=False)
+    # added to the stored balances: they start from the wallet balance at the first sync, this
+    # turns them into the sums of all confirmed amounts once the whole history is stored
+    balance_offset = Column(Integer, nullable=False, default=0)
+    updated = Column(DateTime)
+
+    def __repr__(self):
+        return "WalletCheckpoint(complete=%s)" % self.complete
+
+    @staticmethod
+    def get(data_db) -> 'WalletCheckpoint':
+        checkpoint = data_db.query(WalletCheckpoint).first()
+        if checkpoint is None:
+            checkpoint = WalletCheckpoint(checkpoint_id=1, complete=False, balance_offset=0)
+            data_db.add(checkpoint)
+        return checkpoint
+
+
+class WalletTransaction(data_base):
+    __tablename__ = "wallet_transactions"
+    """Wallet history entries, one per payment, mining reward, publish, vote or create of a wallet transaction.
+
+    A local copy of listwallettransactions: `sync` stores the transactions
+    that are newer than the stored ones and `backfill` downloads older pages
+    until the first wallet transaction was reached. Unconfirmed transactions
+    are replaced on every sync. Amounts and balances are stored in units of
+    1e-8 coins so they can be summed and sorted exactly in SQL.
+
+    The balance of a confirmed entry is a running sum over the confirmed
+    entries in wallet order, computed once when it is stored. Unconfirmed
+    entries show the newest confirmed balance plus the unconfirmed amounts up
+    to them, only they are recomputed. The balance shown is `balance` plus
+    WalletCheckpoint.balance_offset.
+    """
+
+    PAYMENT = "payment"
+    VOTE = "vote"
+    MINING_REWARD = "mining_reward"
+    PUBLISH = "publish"
+    CREATE = "create"
+    # stored to keep the positions in the wallet countable, never shown
+    INVALID = "invalid"
+
+    SORT_DATE = 'date'
+    SORT_AMOUNT = 'amount'
+    SORT_BALANCE = 'balance'
+
+    UNITS = 10 ** 8
+    PAGE_SIZE = 1000
+    # pages downloaded per backfill call
+    BACKFILL_PAGES = 5
+    # newer pages searched for stored transactions before the history is downloaded again
+    MAX_GAP_PAGES = 10
+    # tolerated shift of the wallet positions (e.g. by dropped unconfirmed transactions)
+    OVERLAP = 50
+
+    # wallet order of the entries, backfilled ones get decreasing (negative) numbers
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    txid = Column(String, nullable=False, index=True)
+    tx_type = Column(String, nullable=False)
+    # block time, time received while unconfirmed
+    time = Column(DateTime, nullable=False)
+    confirmed = Column(Boolean, nullable=False, index=True)
+    pos_in_block = Column(Integer, nullable=False)
+    comment = Column(String, nullable=False)
+    amount = Column(Integer, nullable=False)
+    # running balance after the transaction (without the checkpoint offset)
+    balance = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_wallet_transactions_time', 'time', 'pos_in_block', 'seq'),
+        Index('ix_wallet_transactions_amount', 'amount', 'seq'),
+        Index('ix_wallet_transactions_balance', 'balance', 'seq'),
+    )
+
+    def __repr__(self):
+        return "WalletTransaction(%s, %s, %s, %s)" % (self.seq, self.txid, self.tx_type, self.amount)
+
+    @staticmethod
+    def to_units(amount) -> int:
+        return int((Decimal(amount) * WalletTransaction.UNITS).to_integral_value())
+
+    @staticmethod
+    def to_coins(units) -> Decimal:
+        return Decimal(units) / WalletTransaction.UNITS
+
+    @staticmethod
+    def entries(tx) -> list:
+        """History entries (without seq and balance) of a verbose wallet transaction.
+
+        The amount of the transaction is shown on its first entry only.
+        """
+        confirmed = bool(tx.get("blocktime"))
+        common = dict(
+            txid=tx["txid"],
+            time=datetime.fromtimestamp(tx["blocktime"] if confirmed else tx.get("time", 0)),
+            confirmed=confirmed,
+            pos_in_block=tx.get("blockindex", 0),
+        )
+        if tx.get("valid") is False:
+            return [dict(common, tx_type=WalletTransaction.INVALID, comment='', amount=0)]
+
+        entries = []
+        if tx.get("generated"):
+            entries.append((WalletTransaction.MINING_REWARD, ''))
+        for item in tx["items"]:
+            entries.append((WalletTransaction.PUBLISH,
+                            'Stream:"{}" , Keys: "{}"'.format(item['name'], "-".join(item['keys']))))
+        for perm in tx["permissions"]:
+            entries.append((WalletTransaction.VOTE, ''))
+        if tx.get("create"):
+            entries.append((WalletTransaction.CREATE,
+                            'Type:"' + tx['create']['type'] + '", Name: "' + tx['create']['name'] + '"'))
+        if not entries:
+            comment = ''
+            if tx.get("comment"):
+                comment = tx.get("comment")
+            elif tx.get("data"):
+                for data_item in tx.get("data"):
+                    if "json" in data_item and "comment" in data_item["json"]:
+                        comment = data_item["json"]["comment"]
+            entries.append((WalletTransaction.PAYMENT, comment))
+
+        amount = WalletTransaction.to_units(tx["balance"]["amount"])
+        return [dict(common, tx_type=tx_type, comment=comment, amount=amount if i == 0 else 0)
+                for i, (tx_type, comment) in enumerate(entries)]
+
+    @staticmethod
+    def known(data_db, transactions) -> set:
+        """Txids of `transactions` that are stored"""
+        txids = [tx["txid"] for tx in transactions]
+        if not txids:
+            return set()
+        return {txid for txid, in data_db.query(WalletTransaction.txid).filter(
+            WalletTransaction.txid.in_(txids)).distinct()}
+
+    @staticmethod
+    def newer(data_db, client, newest):
+        """Wallet transactions (oldest first) that are newer than all stored ones.
+
+        Older pages are requested until one contains a stored transaction.
+        Returns None if none was found within MAX_GAP_PAGES.
+        """
+        new, page, skip = [], newest, len(newest)
+        stored = data_db.query(WalletTransaction.seq).first() is not None
+        for _ in range(WalletTransaction.MAX_GAP_PAGES):
+            known = WalletTransaction.known(data_db, page)
+            new[:0] = [tx for tx in page if tx["txid"] not in known]
+            if known or not stored:
+                return new
+            page = client.listwallettransactions(WalletTransaction.PAGE_SIZE, skip, False, True)
+            skip += len(page)
+            if not page:
+                return new
+        return None
+
+    @staticmethod
+    def confirmed_balance(data_db, oldest=False):
+        """(seq, txid, balance) of the newest (or `oldest`) confirmed entry"""
+        order = WalletTransaction.seq if oldest else WalletTransaction.seq.desc()
+        return data_db.query(WalletTransaction.seq, WalletTransaction.txid, WalletTransaction.balance).filter(
+            WalletTransaction.confirmed == True).order_by(order).first()  # noqa: E712
+
+    @staticmethod
+    def append(data_db, transactions, balance):
+        """Store `transactions` (oldest first) after the stored ones.
+
+        Confirmed entries get the running balance of the newest stored
+        confirmed entry plus their amounts (or `balance`, the confirmed wallet
+        balance in units, minus the new amounts if nothing is stored).
+        Unconfirmed entries get the final confirmed balance plus the
+        unconfirmed amounts up to them.
+        """
+        rows = [(tx, WalletTransaction.entries(tx)) for tx in transactions]
+        last_seq = data_db.query(func.max(WalletTransaction.seq)).scalar()
+        seq = 0 if last_seq is None else last_seq + 1
+        newest = WalletTransaction.confirmed_balance(data_db)
+        if newest is not None:
+            balance = newest.balance
+        else:
+            balance -= sum(entries[0]['amount'] for tx, entries in rows if entries[0]['confirmed'])
+
+        unconfirmed = []
+        for tx, entries in rows:
+            if entries[0]['confirmed']:
+                balance += sum(entry['amount'] for entry in entries)
+            else:
+                unconfirmed.append(entries)
+            for entry in entries:
+                entry.update(seq=seq, balance=balance)
+                seq += 1
+        pending = balance
+        for entries in unconfirmed:
+            pending += sum(entry['amount'] for entry in entries)
+            for entry in entries:
+                entry['balance'] = pending
+        if rows:
+            data_db.execute(WalletTransaction.__table__.insert(), [entry for tx, entries in rows for entry in entries])
+
+    @staticmethod
+    def prepend(data_db, transactions):
+        """Store `transactions` (newest first) before the stored ones.
+
+        The running balance is carried backwards from the oldest stored confirmed entry.
+        """
+        oldest_seq = data_db.query(func.min(WalletTransaction.seq)).scalar()
+        oldest = WalletTransaction.confirmed_balance(data_db, oldest=True)
+        balance = 0
+        if oldest is not None:
+            balance = oldest.balance - data_db.query(func.sum(WalletTransaction.amount)).filter(
+                WalletTransaction.txid == oldest.txid).scalar()
+        rows = []
+        seq = oldest_seq - 1
+        for tx in transactions:
+            entries = WalletTransaction.entries(tx)
+            for entry in reversed(entries):
+                entry.update(seq=seq, balance=balance)
+                rows.append(entry)
+                seq -= 1
+            if entries[0]['confirmed']:
+                balance -= sum(entry['amount'] for entry in entries)
+        if rows:
+            data_db.execute(WalletTransaction.__table__.insert(), rows)
+
+    @staticmethod
+    def refresh_unconfirmed(data_db, client):
+        """Check the stored unconfirmed transactions with the wallet.
+
+        Dropped ones are removed. If one was confirmed it and all newer entries
+        are removed, `newer` downloads them again with confirmed balances.
+        """
+        stale = [txid for txid, in data_db.query(WalletTransaction.txid).filter(
+            WalletTransaction.confirmed == False).distinct()]  # noqa: E712
+        if not stale:
+            return
+        dropped, confirmed = [], []
+        for txid, tx in zip(stale, client.batch([('getwallettransaction', txid, False, True) for txid in stale])):
+            if isinstance(tx, RpcError):
+                dropped.append(txid)
+            elif tx.get("blocktime"):
+                confirmed.append(txid)
+        if dropped:
+            log.debug('removing {} dropped unconfirmed wallet transactions'.format(len(dropped)))
+            data_db.query(WalletTransaction).filter(WalletTransaction.txid.in_(dropped)).delete(
+                synchronize_session=False)
+        if confirmed:
+            first = data_db.query(func.min(WalletTransaction.seq)).filter(
+                WalletTransaction.txid.in_(confirmed)).scalar()
+            data_db.query(WalletTransaction).filter(WalletTransaction.seq >= first).delete(
+                synchronize_session=False)
+
+    @staticmethod
+    def sync(data_db, client, newest, balance) -> int:
+        """Store new wallet transactions and replace the unconfirmed ones.
+
+        `newest` are the latest wallet transactions (oldest first) as returned by
+        listwallettransactions(count, 0, False, True), `balance` the confirmed
+        wallet balance. The stored balances of confirmed entries never change,
+        only the unconfirmed entries among (or newer than) `newest` are
+        replaced. Older unconfirmed transactions are looked up one by one, they
+        are removed if they were dropped and stored again with all newer
+        entries if they were confirmed. Returns the number of stored transactions.
+        """
+        checkpoint = WalletCheckpoint.get(data_db)
+        txids = [tx["txid"] for tx in newest] or ['']
+        pending = [tx["txid"] for tx in newest if not tx.get("blocktime")] or ['']
+        # confirmed entries that are unconfirmed again after a reorg, they and all newer ones are stored again
+        reverted = data_db.query(func.min(WalletTransaction.seq)).filter(
+            WalletTransaction.txid.in_(pending), WalletTransaction.confirmed == True).scalar()  # noqa: E712
+        if reverted is not None:
+            data_db.query(WalletTransaction).filter(WalletTransaction.seq >= reverted).delete()
+        # unconfirmed transactions may have been confirmed, replaced or dropped
+        unconfirmed = data_db.query(WalletTransaction).filter(WalletTransaction.confirmed == False)  # noqa: E712
+        first = data_db.query(func.min(WalletTransaction.seq)).filter(WalletTransaction.txid.in_(txids)).scalar()
+        if first is not None:
+            unconfirmed = unconfirmed.filter(WalletTransaction.txid.in_(txids) | (WalletTransaction.seq > first))
+        else:
+            unconfirmed = unconfirmed.filter(WalletTransaction.txid.in_(txids))
+        unconfirmed.delete(synchronize_session=False)
+        # older ones are not in `newest` and not downloaded again by `newer`
+        WalletTransaction.refresh_unconfirmed(data_db, client)
+
+        new = WalletTransaction.newer(data_db, client, newest)
+        if new is None:
+            log.debug('no stored wallet transaction found in the newest pages, downloading the history again')
+            data_db.query(WalletTransaction).delete()
+            new = newest
+        if data_db.query(WalletTransaction.seq).first() is None:
+            checkpoint.complete = False
+            checkpoint.balance_offset = 0
+
+        WalletTransaction.append(data_db, new, WalletTransaction.to_units(balance))
+        checkpoint.updated = datetime.now()
+        coalesced.mark(data_db, 'wallet_transactions_changed')
+        return len(new)
+
+    @staticmethod
+    def backfill(data_db, client, pages=BACKFILL_PAGES):
+        """Download up to `pages` pages of wallet transactions older than the stored ones.
+
+        Returns True when the whole history is stored and None if the stored
+        transactions were dropped because the wallet changed below them (`sync`
+        has to store the newest transactions again). Once the first wallet
+        transaction is stored the balance offset is set so that the balances
+        are the sums of all confirmed amounts.
+        """
+        checkpoint = WalletCheckpoint.get(data_db)
+        for _ in range(pages):
+            if checkpoint.complete:
+                break
+            oldest = data_db.query(WalletTransaction.txid).order_by(WalletTransaction.seq).first()
+            if oldest is None:
+                # nothing to continue from, `sync` stores the newest transactions first
+                break
+            # the stored transactions are the newest of the wallet, the page should end with the oldest one
+            skip = max(0, data_db.query(func.count(WalletTransaction.txid.distinct())).scalar()
+                       - WalletTransaction.OVERLAP)
+            page = client.listwallettransactions(WalletTransaction.PAGE_SIZE, skip, False, True)
+            txids = [tx["txid"] for tx in page]
+            if oldest.txid not in txids:
+                log.warning('wallet transaction {} not found at its position, downloading the history again'.format(
+                    oldest.txid))
+                data_db.query(WalletTransaction).delete()
+                coalesced.mark(data_db, 'wallet_transactions_changed')
+                return None
+            older = page[:txids.index(oldest.txid)]
+            known = WalletTransaction.known(data_db, older)
+            WalletTransaction.prepend(data_db, reversed([tx for tx in older if tx["txid"] not in known]))
+            checkpoint.complete = len(page) < WalletTransaction.PAGE_SIZE
+            checkpoint.updated = datetime.now()
+            log.debug('backfilled {} wallet transactions'.format(len(older)))
+            coalesced.mark(data_db, 'wallet_transactions_changed')
+
+        if checkpoint.complete:
+            first = WalletTransaction.confirmed_balance(data_db, oldest=True)
+            if first is not None:
+                checkpoint.balance_offset = data_db.query(func.sum(WalletTransaction.amount)).filter(
+                    WalletTransaction.txid == first.txid).scalar() - first.balance
+        return checkpoint.complete
+
+    @staticmethod
+    def sort_columns(sort_key) -> tuple:
+        if sort_key == WalletTransaction.SORT_AMOUNT:
+            return WalletTransaction.amount, WalletTransaction.seq
+        if sort_key == WalletTransaction.SORT_BALANCE:
+            return WalletTransaction.balance, WalletTransaction.seq
+        return WalletTransaction.time, WalletTransaction.pos_in_block, WalletTransaction.seq
+
+    @staticmethod
+    def balance_offset(data_db) -> int:
+        return data_db.query(WalletCheckpoint.balance_offset).scalar() or 0
+
+    @staticmethod
+    def count(data_db) -> int:
+        return data_db.query(func.count(WalletTransaction.seq)).filter(
+            WalletTransaction.tx_type != WalletTransaction.INVALID).scalar()
+
+    @staticmethod
+    def sort_values(row, sort_key) -> tuple:
+        """Values of the sort columns of a `get_window` row (the `after` of the next window)"""
+        return tuple(getattr(row, column.key) for column in WalletTransaction.sort_columns(sort_key))
+
+    @staticmethod
+    def get_window(data_db, sort_key=SORT_DATE, descending=True, offset=0, limit=200, after=None) -> list:
+        """Return rows `offset` to `offset + limit` of the history ordered by `sort_key`.
+
+        If `after` (the `sort_values` of the last row of the previous window) is
+        given the window starts after that row and `offset` is ignored, so the
+        query cost does not grow with the position. Every row has the columns
+        tx_type, time, comment, amount, balance, txid, confirmed, pos_in_block and seq.
+        """
+        columns = WalletTransaction.sort_columns(sort_key)
+        query = data_db.query(
+            WalletTransaction.tx_type, WalletTransaction.time, WalletTransaction.comment, WalletTransaction.amount,
+            WalletTransaction.balance, WalletTransaction.txid, WalletTransaction.confirmed,
+            WalletTransaction.pos_in_block, WalletTransaction.seq
+        ).filter(WalletTransaction.tx_type != WalletTransaction.INVALID)
+        if after is not None:
+            # lexicographic comparison, the redundant range lets sqlite seek in the index
+            (column, value), *rest = list(zip(columns, after))
+            condition = None
+            for other, other_value in reversed(rest):
+                beyond = other < other_value if descending else other > other_value
+                condition = beyond if condition is None else or_(beyond, and_(other == other_value, condition))
+            beyond = column < value if descending else column > value
+            query = query.filter(column <= value if descending else column >= value,
+                                 or_(beyond, and_(column == value, condition)))
+            offset = 0
+        return query.order_by(*[column.desc() if descending else column for column in columns]).offset(
+            offset).limit(limit).all()
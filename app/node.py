@@ -6,6 +6,7 @@ import app
 from app.helpers import init_node_data_dir
 from app.models import Profile
 from app.signals import signals
+from app.backend.notifications import notification_listener, notify_command
 from app.backend.rpc import get_active_rpc_client
 
 log = logging.getLogger(__name__)
@@ -76,7 +77,16 @@ class Node(QProcess):
             if initprivkey is not None:
                 launch_args.append('-initprivkey={}'.format(initprivkey))
 
+            try:
+                port = notification_listener.start()
+                launch_args.append('-blocknotify={}'.format(notify_command(port, 'block')))
+                launch_args.append('-walletnotify={}'.format(notify_command(port, 'wallet')))
+            except OSError as e:
+                log.warning('cannot listen for node notifications - falling back to polling: {}'.format(e))
+                port = None
+
             super().start(node_path, launch_args, QIODevice.ReadOnly)
+            notification_listener.active = port is not None
             self.reindex_required = False
         else:
             log.debug('node already started - state: {}'.format(self.state()))
@@ -91,6 +101,7 @@ class Node(QProcess):
         log.debug('node started')
 
     def node_finished(self, code, status):
+        notification_listener.active = False
         if code == self.CrashExit:
             self.start()
         log.debug('node finished code {} status {}'.format(code, status))
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Forward multichaind -blocknotify/-walletnotify events to the running application.
+
+The managed node runs this helper on every new block or wallet transaction.
+It must stay free of application imports so that it starts fast.
+
+Usage: notify.py <port> <block|wallet> <hash>
+"""
+import socket
+import sys
+
+
+def main(argv):
+    if len(argv) != 4:
+        sys.stderr.write(__doc__)
+        return 1
+    port, event, value = argv[1:]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.sendto('{} {}'.format(event, value).encode('ascii'), ('127.0.0.1', int(port)))
+    finally:
+        sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
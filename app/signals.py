@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 """QT Signals that the application provides"""
+import threading
+import time
+
 from PyQt5.QtCore import QObject, pyqtSignal, QProcess
 
 
@@ -20,8 +23,12 @@ class Signals(QObject):
     getblockchaininfo = pyqtSignal(object)
     getruntimeparams = pyqtSignal(object)
 
+    # chain state changes published by the updater (see app.chainstate)
+    new_block = pyqtSignal(object)
+
     # database rpc syncs
-    wallet_transactions_changed = pyqtSignal(list)
+    # wallet history stored (see models.WalletTransaction)
+    wallet_transactions_changed = pyqtSignal()
     permissions_changed = pyqtSignal()
     listblocks = pyqtSignal()
     blockschanged = pyqtSignal(object)
@@ -31,6 +38,8 @@ class Signals(QObject):
     application_start = pyqtSignal()
 
     votes_changed = pyqtSignal()
+    # mining and voting activity per address (see models.AddressStats)
+    community_stats_changed = pyqtSignal()
 
     #: profile changed
     profile_changed = pyqtSignal(object)
@@ -58,9 +67,53 @@ class Signals(QObject):
     # Signals standard output from managed node process
     node_message = pyqtSignal(str)
 
-    # Skip updating certain widgets while doing batch db updates
-    batch_gui_updates_allowed = pyqtSignal(bool)
 
 
+class SignalCoalescer:
+    """Emit argument-less signals (topics) at most once per transaction and interval.
+
+    Database code marks topics dirty on the session with `mark`. They are emitted
+    once after the session commits and dropped on rollback (see models.db).
+    A topic that was emitted less than `min_interval` seconds ago is emitted
+    again when the interval is over. Further requests until then are merged.
+    """
+
+    def __init__(self, signals, min_interval=1.0):
+        self.signals = signals
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_emit = {}
+        self._timers = {}
+
+    def mark(self, session, topic):
+        session.info.setdefault('dirty_topics', set()).add(topic)
+
+    def on_commit(self, session):
+        for topic in session.info.pop('dirty_topics', ()):
+            self.emit(topic)
+
+    def on_rollback(self, session):
+        session.info.pop('dirty_topics', None)
+
+    def emit(self, topic):
+        with self._lock:
+            if topic in self._timers:
+                return
+            delay = self._last_emit.get(topic, float('-inf')) + self.min_interval - time.monotonic()
+            if delay > 0:
+                timer = threading.Timer(delay, self._emit_delayed, (topic,))
+                timer.daemon = True
+                self._timers[topic] = timer
+                timer.start()
+                return
+            self._last_emit[topic] = time.monotonic()
+        getattr(self.signals, topic).emit()
+
+    def _emit_delayed(self, topic):
+        with self._lock:
+            del self._timers[topic]
+        self.emit(topic)
+
 
 signals = Signals()
+coalesced = SignalCoalescer(signals)
@@ -2,17 +2,16 @@
 """Api to local database synchronization by api method"""
 import logging
 from binascii import unhexlify
-from datetime import datetime
+from collections import namedtuple
 
 import ubjson
 from decimal import Decimal
+from sqlalchemy import func
 import app
 from app import enums
 from app.backend.rpc import get_active_rpc_client
-from app.helpers import batchwise
-from app.models import Address, Permission, Transaction, PendingVote, Block, Profile, Alias, MiningReward, \
-    Timestamp, Vote
-from app.models import ISCC
+from app.models import Address, Permission, Transaction, PendingVote, Block, Profile, Alias, Timestamp, Vote
+from app.models import ISCC, snapshots
 from app.models.db import profile_session_scope, data_session_scope
 from app.signals import signals
 from app.tools.address import public_key_to_address
@@ -20,6 +19,11 @@ from app.tools.validators import is_valid_username
 
 log = logging.getLogger(__name__)
 
+#: fork point search - compare at most this many blocks in one listblocks range
+FORK_SCAN_RANGE = 500
+#: fork point search - number of evenly spaced heights probed per listblocks call
+FORK_PROBES = 32
+
 permission_candidates = ['admin', 'mine', 'issue', 'create']
 
 
@@ -62,119 +66,85 @@ def getruntimeparams():
             profile.address = params.handshakelocal
 
 
-def process_blocks():
-    """
-    Find last valid Block, delete every Block above in DB and get all Blocks above from Node.
-    Process through new Blocks:
-    Add them to DB.
-    Process through all transactions in block.
-    """
-    client = get_active_rpc_client()
-
-    ### get last valid block in DB ###
-    last_valid_height = -1
-    last_block_is_valid = False
-    with data_session_scope() as session:
-        while not last_block_is_valid:
-            latest_block = session.query(Block).order_by(Block.height.desc()).first()
-            if not latest_block:
-                break
-            try:
-                block_from_chain = client.getblock('{}'.format(latest_block.height))
-            except Exception as e:
-                log.debug(e)
-                return
-            if latest_block.hash == unhexlify(block_from_chain['hash']):
-                last_block_is_valid = True
-                last_valid_height = latest_block.height
-            else:
-                session.delete(latest_block)
-
-    blockchain_params = client.getblockchainparams()
-    pubkeyhash_version = blockchain_params['address-pubkeyhash-version']
-    checksum_value = blockchain_params['address-checksum-value']
-
-    block_count_node = client.getblockcount()
-
-    with data_session_scope() as session:
-        # height is 0 indexed,
-        for batch in batchwise(range(last_valid_height + 1, block_count_node), 100):
-            try:
-                with data_session_scope() as session:
-                    signals.batch_gui_updates_allowed.emit(False)
-                    new_blocks = client.listblocks(batch)
-
-                    first = True
-                    for block in new_blocks:
-                        # Allow emitting certain GUI update signals for the first block in the batch
-                        # or if we're close to the current node block count
-                        if first or block_count_node - block['height'] < 16:
-                            signals.batch_gui_updates_allowed.emit(True)
-                        block_obj = Block(
-                            hash=unhexlify(block['hash']),
-                            height=block['height'],
-                            mining_time=datetime.fromtimestamp(block['time']),
-                        )
-                        session.add(block_obj)
-                        session.add(MiningReward(
-                            block=unhexlify(block['hash']),
-                            address=block['miner']
-                        ))
-                        Address.create_if_not_exists(session, block['miner'])
-                        if block['txcount'] > 1:
-                            process_transactions(session, block['height'], pubkeyhash_version, checksum_value, client)
-                        signals.database_blocks_updated.emit(block['height'], block_count_node)
-                        signals.blockschanged.emit(session.query(Block).count())
-                        # Skip certain GUI update signals for the remainder of the batch
-                        if first:
-                            signals.batch_gui_updates_allowed.emit(False)
-                            first = False
-            except Exception as e:
-                signals.batch_gui_updates_allowed.emit(True)
-                log.debug('Exception in process_blocks:')
-                log.debug(e)
-                return
-    signals.batch_gui_updates_allowed.emit(True)
-
-    if last_valid_height != block_count_node:
-        # permissions and votes tables are completely refreshed after each new block
-        process_permissions()
-
-
-def process_transactions(data_db, block_height, pubkeyhash_version, checksum_value, client = None):
-    if client == None:
-        client = get_active_rpc_client()
-
-    try:
-        block = client.getblock('{}'.format(block_height), 4)
-    except Exception as e:
-        log.debug(e)
-        return
+def find_fork_height(data_db, client, node_height) -> int:
+    """Return the height of the newest block in the database that is on the node chain (-1 if none).
 
+    Probes exponentially growing distances below the database tip with a single
+    listblocks call, narrows the interval between the newest valid and the oldest
+    invalid probe with evenly spaced probes and finally compares the remaining
+    range at once.
+    """
+    db_height = data_db.query(func.max(Block.height)).scalar()
+    if db_height is None:
+        return -1
+
+    def valid_heights(heights):
+        heights = sorted(set(heights))
+        db_hashes = dict(data_db.query(Block.height, Block.hash).filter(Block.height.in_(heights)))
+        node_heights = [h for h in heights if h <= node_height]
+        node_hashes = {}
+        if node_heights:
+            blocks = client.listblocks(','.join(str(h) for h in node_heights), False)
+            node_hashes = {block['height']: unhexlify(block['hash']) for block in blocks}
+        return {h for h in heights if h in db_hashes and db_hashes[h] == node_hashes.get(h)}
+
+    def narrow(lo, hi, heights):
+        valid = valid_heights(heights)
+        lo = max([h for h in heights if h in valid] + [lo])
+        hi = min([h for h in heights if h not in valid and h > lo] + [hi])
+        return lo, hi
+
+    # lo: newest known valid height, hi: oldest known invalid height
+    probes = [db_height - (2 ** i - 1) for i in range(db_height.bit_length() + 1) if db_height - (2 ** i - 1) >= 0]
+    lo, hi = narrow(-1, db_height + 1, probes + [0])
+    if lo == db_height:
+        return lo
+
+    while hi - lo - 1 > FORK_SCAN_RANGE:
+        step = (hi - lo) / (FORK_PROBES + 1)
+        lo, hi = narrow(lo, hi, [lo + int(step * k) for k in range(1, FORK_PROBES + 1)])
+
+    first, last = lo + 1, min(hi - 1, node_height)
+    if first > last:
+        return lo
+    db_hashes = dict(data_db.query(Block.height, Block.hash).filter(Block.height.between(first, last)))
+    for block in client.listblocks('{}-{}'.format(first, last), False):
+        if db_hashes.get(block['height']) != unhexlify(block['hash']):
+            break
+        lo = block['height']
+    return lo
+
+
+DecodedTransaction = namedtuple('DecodedTransaction', 'transaction addresses items relevant')
+"""Unsaved rows of a relevant transaction.
+
+relevant is False if only ISCC registrations made the transaction relevant.
+Those are dropped again if the ISCC already exists.
+"""
+
+
+def decode_block_transactions(block, pubkeyhash_version, checksum_value) -> list:
+    """Decode the relevant transactions of a verbose block into unsaved model objects."""
+    decoded = []
     for pos_in_block, tx in enumerate(block['tx']):
         try:
-            tx_relevant = process_inputs_and_outputs(data_db, tx, pubkeyhash_version, checksum_value)
-
+            decoded_tx = decode_inputs_and_outputs(tx, pubkeyhash_version, checksum_value)
         except Exception as e:
-            log.debug(e)
-            return
+            log.debug('cannot decode transaction {}: {}'.format(tx.get('txid'), e))
+            continue
+        if decoded_tx is not None:
+            decoded_tx.transaction.pos_in_block = pos_in_block
+            decoded_tx.transaction.block = unhexlify(block['hash'])
+            decoded.append(decoded_tx)
+    return decoded
 
-        # add only relevant TXs to the database.
-        if tx_relevant:
-            Transaction.create_if_not_exists(
-                data_db,
-                Transaction(
-                    txid=tx['txid'],
-                    pos_in_block=pos_in_block,
-                    block=unhexlify(block['hash'])
-                )
-            )
-
-
-def process_inputs_and_outputs(data_db, raw_transaction, pubkeyhash_version,
-                               checksum_value) -> bool:  # todo: better name
+
+def decode_inputs_and_outputs(raw_transaction, pubkeyhash_version, checksum_value):
+    """Return a DecodedTransaction or None if the transaction is not relevant."""
     relevant = False
     txid = raw_transaction["txid"]
+    addresses = set()
+    items = []
     signers = []  # todo: SIGHASH_ALL
     for n, vin in enumerate(raw_transaction["vin"]):
         if 'scriptSig' in vin:
@@ -185,8 +155,7 @@ def process_inputs_and_outputs(data_db, raw_transaction, pubkeyhash_version,
             # stream item
             if item["type"] == "stream":
                 publishers = item["publishers"]
-                for publisher in publishers:
-                    Address.create_if_not_exists(data_db, publisher)
+                addresses.update(publishers)
                 if item["name"] == app.STREAM_TIMESTAMP:
                     relevant = True
                     comment = ''
@@ -194,41 +163,34 @@ def process_inputs_and_outputs(data_db, raw_transaction, pubkeyhash_version,
                         data = ubjson.loadb(unhexlify(item['data']))
                         if 'comment' in data:
                             comment += data.get('comment', '')
-                    data_db.add(Timestamp(
+                    items.append(Timestamp(
                         txid=txid,
                         pos_in_tx=i,
                         hash=item["keys"][0],
                         comment=comment,
                         address=publishers[0]
                     ))
-                    # flush for the primary key
-                    data_db.flush()
                 elif item['name'] == app.STREAM_ALIAS:
                     alias = item["keys"][0]
                     # Sanity checks
                     if item["data"] or not is_valid_username(alias) or len(publishers) != 1:
                         continue
                     relevant = True
-                    data_db.add(Alias(
+                    items.append(Alias(
                         txid=txid,
                         pos_in_tx=i,
                         address=publishers[0],
                         alias=alias
                     ))
-                    # flush for the primary key
-                    data_db.flush()
                 elif item['name'] == app.STREAM_ISCC:
                     iscc = item["keys"]
                     if len(iscc) != 4:
                         continue
                     meta_id, content_id, data_id, instance_id = iscc
-                    if ISCC.already_exists(data_db, meta_id, content_id, data_id, instance_id):
-                        continue
                     data = item['data']
                     if 'json' not in data or 'title' not in data['json']:
                         continue
-                    relevant = True
-                    data_db.add(ISCC(
+                    items.append(ISCC(
                         txid=txid,
                         address=publishers[0],
                         meta_id=meta_id,
@@ -237,17 +199,15 @@ def process_inputs_and_outputs(data_db, raw_transaction, pubkeyhash_version,
                         instance_id=instance_id,
                         title=data['json']['title']
                     ))
-                    # flush for the primary key
-                    data_db.flush()
         # vote
         for perm in vout.get('permissions', []):
             relevant = True
             for perm_type, changed in perm.items():
                 if changed and perm_type in permission_candidates:
                     for address in vout['scriptPubKey']['addresses']:
-                        Address.create_if_not_exists(data_db, address)
-                        Address.create_if_not_exists(data_db, signers[vout['n']])
-                        data_db.add(Vote(
+                        addresses.add(address)
+                        addresses.add(signers[vout['n']])
+                        items.append(Vote(
                             txid=txid,
                             pos_in_tx=i,
                             from_address=signers[vout['n']],
@@ -256,62 +216,116 @@ def process_inputs_and_outputs(data_db, raw_transaction, pubkeyhash_version,
                             end_block=perm['endblock'],
                             perm_type=perm_type
                         ))
-                        # flush for the primary key
-                        data_db.flush()
-    return relevant
+    if not relevant and not items:
+        return None
+    return DecodedTransaction(Transaction(txid=txid), addresses, items, relevant)
+
+
+def write_block_transactions(data_db, decoded_transactions):
+    """Store decoded transactions. ISCCs that are already registered are skipped."""
+    addresses = set()
+    for decoded_tx in decoded_transactions:
+        addresses.update(decoded_tx.addresses)
+    Address.bulk_create_if_not_exists(data_db, addresses)
+
+    # ISCCs accepted in this call are not flushed yet, already_exists does not see them
+    accepted = set()
+    for decoded_tx in decoded_transactions:
+        items = []
+        for item in decoded_tx.items:
+            if isinstance(item, ISCC):
+                components = (item.meta_id, item.content_id, item.data_id, item.instance_id)
+                if components in accepted or ISCC.already_exists(data_db, *components):
+                    continue
+                accepted.add(components)
+            items.append(item)
+        # add only relevant TXs to the database.
+        if not decoded_tx.relevant and not items:
+            continue
+        Transaction.create_if_not_exists(data_db, decoded_tx.transaction)
+        data_db.add_all(items)
 
 
 def process_permissions():
-    # todo: check if we have new perms / votes
-    client = get_active_rpc_client()
-
-    try:
-        perms = client.listpermissions("*", "*", True)
-    except Exception as e:
-        log.debug(e)
-        return
+    """Sync permissions and pending votes with the node.
 
-    with data_session_scope() as session:
-        session.query(Permission).delete()
-        session.query(PendingVote).delete()
-
-    with data_session_scope() as session:
-        for perm in perms:
-            perm_type = perm['type']
-            perm_start = perm['startblock']
-            perm_end = perm['endblock']
-            address = perm['address']
-
-            Address.create_if_not_exists(session, address)
-
-            if perm_type not in [enums.ISSUE, enums.CREATE, enums.MINE, enums.ADMIN]:
+    Only the difference between the node state and the database is written.
+    Permissions are keyed by (address, perm_type) and pending votes by
+    (address_from, address_to, perm_type, start_block, end_block).
+    """
+    client = get_active_rpc_client()
+    perms = client.listpermissions("*", "*", True)
+
+    node_perms = {}
+    node_votes = set()
+    addresses = set()
+    for perm in perms:
+        perm_type = perm['type']
+        address = perm['address']
+        addresses.add(address)
+
+        if perm_type not in [enums.ISSUE, enums.CREATE, enums.MINE, enums.ADMIN]:
+            continue
+
+        node_perms[(address, perm_type)] = (perm['startblock'], perm['endblock'])
+
+        for vote in perm['pending']:
+            start_block = vote['startblock']
+            end_block = vote['endblock']
+            # If candidate has already the permission continue.
+            if start_block == perm['startblock'] and end_block == perm['endblock']:
                 continue
+            for admin in vote['admins']:
+                addresses.add(admin)
+                node_votes.add((admin, address, perm_type, start_block, end_block))
 
-            perm_obj = Permission(
-                address=address,
+    with data_session_scope() as session:
+        Address.bulk_create_if_not_exists(session, addresses)
+
+        db_perms = {(p.address, p.perm_type.name): p for p in session.query(Permission)}
+        perms_changed = False
+        for key, perm_obj in db_perms.items():
+            if key not in node_perms:
+                session.delete(perm_obj)
+                perms_changed = True
+            elif (perm_obj.start_block, perm_obj.end_block) != node_perms[key]:
+                perm_obj.start_block, perm_obj.end_block = node_perms[key]
+                perms_changed = True
+        for key, (start_block, end_block) in node_perms.items():
+            if key not in db_perms:
+                address, perm_type = key
+                session.add(Permission(
+                    address=address,
+                    perm_type=perm_type,
+                    start_block=start_block,
+                    end_block=end_block
+                ))
+                perms_changed = True
+
+        db_votes = {
+            (v.address_from, v.address_to, v.perm_type.name, v.start_block, v.end_block): v
+            for v in session.query(PendingVote)
+        }
+        votes_changed = False
+        for key, vote_obj in db_votes.items():
+            if key not in node_votes:
+                session.delete(vote_obj)
+                votes_changed = True
+        for key in node_votes - db_votes.keys():
+            address_from, address_to, perm_type, start_block, end_block = key
+            session.add(PendingVote(
+                address_from=address_from,
+                address_to=address_to,
                 perm_type=perm_type,
-                start_block=perm_start,
-                end_block=perm_end
-            )
-            session.add(perm_obj)
-
-            for vote in perm['pending']:
-                start_block = vote['startblock']
-                end_block = vote['endblock']
-                # If candidate has already the permission continue.
-                if start_block == perm['startblock'] and end_block == perm['endblock']:
-                    continue
-                for admin in vote['admins']:
-                    Address.create_if_not_exists(session, admin)
-                    vote_obj = PendingVote(
-                        address_from=admin,
-                        address_to=address,
-                        perm_type=perm_type,
-                        start_block=start_block,
-                        end_block=end_block
-                    )
-                    session.add(vote_obj)
-    signals.votes_changed.emit()
+                start_block=start_block,
+                end_block=end_block
+            ))
+            votes_changed = True
+
+    if perms_changed or votes_changed:
+        snapshots.invalidate()
+    if votes_changed:
+        signals.votes_changed.emit()
 
     with profile_session_scope() as profile_db:
         profile = Profile.get_active(profile_db)
@@ -325,7 +339,8 @@ def process_permissions():
                 profile.is_miner = is_miner
                 signals.is_miner_changed.emit(is_miner)
 
-    signals.permissions_changed.emit()
+    if perms_changed:
+        signals.permissions_changed.emit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Staged node to local database block synchronization"""
+import logging
+import time
+from binascii import unhexlify
+from datetime import datetime
+
+from app import sync
+from app.backend.blockfetcher import BlockFetcher
+from app.backend.rpc import get_active_rpc_client
+from app.exceptions import SyncError
+from app.models import (
+    Address, AddressStats, Block, CurrentAlias, MiningReward, Permission, Profile, SyncCheckpoint, Vote, snapshots
+)
+from app.models.db import data_session_scope, profile_session_scope
+from app.signals import coalesced, signals
+
+log = logging.getLogger(__name__)
+
+
+class SyncEngine:
+    """Sync blocks and relevant transactions from the node in explicit stages.
+
+    Stages:
+        headers: validate the stored chain and store blocks and mining rewards
+        bodies: fetch verbose blocks that contain transactions
+        decode: turn stream items and votes into model objects
+        write: store the decoded transactions
+        permissions: sync permissions and pending votes if votes changed
+
+    Progress is kept in the SyncCheckpoint row and committed together with the
+    data. A run continues after the last checkpoint so blocks are neither
+    validated nor downloaded again after a crash or node restart. Rpc calls are
+    retried with exponential backoff. `timings` holds the seconds spent per
+    stage during the last run.
+    """
+
+    STAGES = ('headers', 'bodies', 'decode', 'write', 'permissions')
+    HEADER_BATCH = 500
+    BODY_BATCH = 100
+    RETRIES = 3
+    BACKOFF = 0.5
+
+    def __init__(self, profile=None):
+        self.profile = profile
+        self.timings = dict.fromkeys(self.STAGES, 0.0)
+
+    def run(self) -> bool:
+        """Sync the data db with the node, return False if the sync was aborted"""
+        self.timings = dict.fromkeys(self.STAGES, 0.0)
+        profile = self.profile
+        if profile is None:
+            with profile_session_scope() as session:
+                profile = Profile.get_active(session)
+        client = get_active_rpc_client(profile)
+
+        try:
+            node_height = self.retry('headers', client.getblockcount)
+            blockchain_params = self.retry('headers', client.getblockchainparams)
+            blocks_removed = self.validate(client, node_height)
+            self.sync_headers(client, node_height)
+            self.sync_bodies(profile, node_height, blockchain_params['address-pubkeyhash-version'],
+                             blockchain_params['address-checksum-value'])
+            self.sync_permissions(blocks_removed)
+            return True
+        except Exception as e:
+            log.exception('block sync aborted: {}'.format(e))
+            return False
+        finally:
+            log.debug('block sync stage timings: {}'.format(
+                ', '.join('{} {:.2f}s'.format(stage, self.timings[stage]) for stage in self.STAGES)))
+
+    def timed(self, stage, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[stage] += time.perf_counter() - start
+
+    def retry(self, stage, func, *args):
+        delay = self.BACKOFF
+        for attempt in range(self.RETRIES + 1):
+            try:
+                return self.timed(stage, func, *args)
+            except Exception as e:
+                if attempt == self.RETRIES:
+                    raise SyncError(stage, e) from e
+                log.debug('{} stage failed ({}) - retry in {}s'.format(stage, e, delay))
+                time.sleep(delay)
+                delay *= 2
+
+    def validate(self, client, node_height) -> bool:
+        """Remove blocks that are not on the node chain anymore. Returns True if blocks were removed."""
+        with data_session_scope() as session:
+            checkpoint = SyncCheckpoint.get(session)
+            if checkpoint.headers_height < 0:
+                return False
+            if checkpoint.headers_hash is not None and checkpoint.headers_height <= node_height:
+                blocks = self.retry('headers', client.listblocks, '{}'.format(checkpoint.headers_height))
+                if blocks and unhexlify(blocks[0]['hash']) == checkpoint.headers_hash:
+                    return False
+
+            fork_height = self.retry('headers', sync.find_fork_height, session, client, node_height)
+            AddressStats.revert_above(session, fork_height)
+            # child rows are removed by ON DELETE CASCADE
+            removed = session.query(Block).filter(Block.height > fork_height).delete(synchronize_session=False)
+            SyncCheckpoint.rewind(session, fork_height)
+            if removed:
+                log.debug('removed {} blocks above fork height {}'.format(removed, fork_height))
+                CurrentAlias.rebuild(session)
+                # the ISCCs of the removed blocks are gone
+                coalesced.mark(session, 'iscc_inserted')
+
+        if removed:
+            # the heights may be synced up to the same values again with other blocks
+            snapshots.invalidate()
+            CurrentAlias.publish_changes()
+        return removed > 0
+
+    def sync_headers(self, client, node_height):
+        with data_session_scope() as session:
+            first = SyncCheckpoint.get(session).headers_height + 1
+
+        for batch_first in range(first, node_height + 1, self.HEADER_BATCH):
+            batch_last = min(batch_first + self.HEADER_BATCH - 1, node_height)
+            headers = self.retry('headers', client.listblocks, '{}-{}'.format(batch_first, batch_last))
+            if not headers:
+                break
+
+            start = time.perf_counter()
+            with data_session_scope() as session:
+                session.execute(Block.__table__.insert(), [dict(
+                    hash=unhexlify(header['hash']),
+                    height=header['height'],
+                    mining_time=datetime.fromtimestamp(header['time']),
+                    txcount=header['txcount'],
+                ) for header in headers])
+                session.execute(MiningReward.__table__.insert(), [
+                    dict(block=unhexlify(header['hash']), address=header['miner']) for header in headers
+                ])
+                Address.bulk_create_if_not_exists(session, {header['miner'] for header in headers})
+                AddressStats.record(session, AddressStats.MINED, headers[0]['height'], headers[-1]['height'])
+
+                checkpoint = SyncCheckpoint.get(session)
+                checkpoint.headers_height = headers[-1]['height']
+                checkpoint.headers_hash = unhexlify(headers[-1]['hash'])
+                checkpoint.updated = datetime.now()
+            self.timings['headers'] += time.perf_counter() - start
+
+    def fetch_bodies(self, fetcher, heights):
+        """Yield verbose blocks for `heights` and refetch the remaining blocks after rpc errors"""
+        done = 0
+        delay = self.BACKOFF
+        for attempt in range(self.RETRIES + 1):
+            blocks = fetcher.fetch(heights[done:])
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        block = next(blocks)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.timings['bodies'] += time.perf_counter() - start
+                    done += 1
+                    yield block
+            except Exception as e:
+                if attempt == self.RETRIES:
+                    raise SyncError('bodies', e) from e
+                log.debug('bodies stage failed ({}) - retry in {}s'.format(e, delay))
+                time.sleep(delay)
+                delay *= 2
+            finally:
+                blocks.close()
+
+    def sync_bodies(self, profile, node_height, pubkeyhash_version, checksum_value):
+        with data_session_scope() as session:
+            checkpoint = SyncCheckpoint.get(session)
+            first, last = checkpoint.bodies_height + 1, checkpoint.headers_height
+
+        # Verbose blocks are prefetched in parallel while this thread writes to the database
+        with BlockFetcher(profile, profile.sync_workers, profile.sync_queue_depth) as fetcher:
+            for batch_first in range(first, last + 1, self.BODY_BATCH):
+                batch_last = min(batch_first + self.BODY_BATCH - 1, last)
+                with data_session_scope() as session:
+                    tx_heights = [height for height, in session.query(Block.height).filter(
+                        Block.height.between(batch_first, batch_last), Block.txcount > 1).order_by(Block.height)]
+
+                    for block in self.fetch_bodies(fetcher, tx_heights):
+                        decoded = self.timed('decode', sync.decode_block_transactions, block, pubkeyhash_version,
+                                             checksum_value)
+                        self.timed('write', sync.write_block_transactions, session, decoded)
+
+                    aliases_changed = CurrentAlias.update_since(session, batch_first - 1)
+                    AddressStats.record(session, AddressStats.VOTED, batch_first, batch_last)
+                    checkpoint = SyncCheckpoint.get(session)
+                    checkpoint.bodies_height = batch_last
+                    checkpoint.updated = datetime.now()
+
+                if aliases_changed:
+                    CurrentAlias.publish_changes()
+                signals.database_blocks_updated.emit(batch_last, node_height)
+                signals.blockschanged.emit(batch_last + 1)
+
+    def sync_permissions(self, blocks_removed):
+        # permissions and votes only change through permission transactions
+        with data_session_scope() as session:
+            checkpoint = SyncCheckpoint.get(session)
+            bodies_height = checkpoint.bodies_height
+            permissions_outdated = (
+                blocks_removed or
+                checkpoint.permissions_height < 0 or
+                session.query(Permission).first() is None or
+                Vote.voted_since(session, checkpoint.permissions_height)
+            )
+        if not permissions_outdated:
+            return
+
+        self.retry('permissions', sync.process_permissions)
+        with data_session_scope() as session:
+            SyncCheckpoint.get(session).permissions_height = bodies_height
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Streaming file hashing shared by timestamping and ISCC generation"""
+import io
+import queue
+import threading
+import time
+from binascii import hexlify
+from collections import namedtuple
+from hashlib import sha256
+
+import iscc
+import xxhash
+
+from app.exceptions import HashingCancelled
+
+SHA256 = 'sha256'
+INSTANCE_ID = 'instance_id'
+DATA_ID = 'data_id'
+CONTENT = 'content'
+
+FileDigests = namedtuple('FileDigests', 'sha256 instance_id instance_hash data_id content')
+
+
+class Sha256Hasher:
+
+    def __init__(self):
+        self._hash = sha256()
+
+    def update(self, data):
+        self._hash.update(data)
+
+    def result(self):
+        return self._hash.hexdigest()
+
+
+class ContentCollector:
+    """Keep the file content in memory for the content id (images and text documents).
+
+    The chunks are written to a single BytesIO that is returned rewound, so
+    the content is held once and readers need no further copy.
+    """
+
+    def __init__(self):
+        self._content = io.BytesIO()
+
+    def update(self, data):
+        self._content.write(data)
+
+    def result(self):
+        self._content.seek(0)
+        return self._content
+
+
+class InstanceIdHasher:
+    """Incremental iscc.instance_id (sha256d merkle tree over 64000 byte leaves)"""
+
+    LEAF_SIZE = 64000
+
+    def __init__(self):
+        self.leaves = []
+        self._leaf = None
+        self._leaf_size = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            if self._leaf is None:
+                self._leaf = sha256(b'\x00')
+                self._leaf_size = 0
+            take = min(self.LEAF_SIZE - self._leaf_size, len(view))
+            self._leaf.update(view[:take])
+            self._leaf_size += take
+            view = view[take:]
+            if self._leaf_size == self.LEAF_SIZE:
+                self._finish_leaf()
+
+    def _finish_leaf(self):
+        self.leaves.append(sha256(self._leaf.digest()).digest())
+        self._leaf = None
+
+    def result(self):
+        """Return [code, hex_hash] like iscc.instance_id"""
+        if self._leaf is not None:
+            self._finish_leaf()
+        top_hash_digest = iscc.top_hash(self.leaves)
+        code = iscc.encode(iscc.HEAD_IID + top_hash_digest[:8])
+        return [code, hexlify(top_hash_digest).decode('ascii')]
+
+
+class DataIdHasher:
+    """Incremental iscc.data_id with push based content defined chunking.
+
+    A chunk boundary only depends on the next max_size bytes, so chunks are cut
+    as soon as that much data is buffered and the rest is cut in `result`.
+    """
+
+    GEAR1 = (iscc.GEAR1_NORM, iscc.GEAR1_MIN, iscc.GEAR1_MAX, iscc.GEAR1_MASK1, iscc.GEAR1_MASK2)
+    GEAR2 = (iscc.GEAR2_NORM, iscc.GEAR2_MIN, iscc.GEAR2_MAX, iscc.GEAR2_MASK1, iscc.GEAR2_MASK2)
+
+    def __init__(self):
+        self.features = []
+        self._section = bytearray()
+
+    @property
+    def _gear(self):
+        return self.GEAR1 if len(self.features) < 100 else self.GEAR2
+
+    def update(self, data):
+        self._section += data
+        self._cut(final=False)
+
+    def _cut(self, final):
+        pos = 0
+        with memoryview(self._section) as section:
+            while True:
+                norm_size, min_size, max_size, mask_1, mask_2 = self._gear
+                available = len(section) - pos
+                if available == 0 or (available < max_size and not final):
+                    break
+                window = section[pos:pos + max_size]
+                boundary = iscc.chunk_length(window, norm_size, min_size, max_size, mask_1, mask_2)
+                self.features.append(xxhash.xxh32(window[:boundary]).intdigest())
+                window.release()
+                pos += boundary
+        del self._section[:pos]
+
+    def result(self):
+        """Return the code like iscc.data_id"""
+        self._cut(final=True)
+        minhash = iscc.minimum_hash(self.features, n=64)
+        lsb = "".join([str(x & 1) for x in minhash])
+        digest = int(lsb, 2).to_bytes(8, "big", signed=False)
+        return iscc.encode(iscc.HEAD_DID + digest)
+
+
+HASHERS = {
+    SHA256: Sha256Hasher,
+    INSTANCE_ID: InstanceIdHasher,
+    DATA_ID: DataIdHasher,
+    CONTENT: ContentCollector,
+}
+
+# hashlib releases the GIL, the data id chunker and the collector run in the reading thread
+THREADED = {SHA256, INSTANCE_ID}
+
+
+class HashWorker(threading.Thread):
+    """Feed the chunks from `chunks` to one hasher in order.
+
+    Every chunk is a (memoryview, semaphore) pair. The semaphore is released
+    once the chunk was processed so the reader can reuse the buffer.
+    """
+
+    def __init__(self, hasher):
+        super().__init__(name='file-hasher', daemon=True)
+        self.hasher = hasher
+        self.chunks = queue.Queue()
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                break
+            chunk, done = item
+            try:
+                if self.error is None:
+                    self.hasher.update(chunk)
+            except Exception as e:
+                self.error = e
+            finally:
+                done.release()
+
+
+class FileHasher:
+    """Compute the requested digests with a single read of the file.
+
+    The file is read with `readinto` into a small ring of reusable buffers.
+    With more than one digest every chunk is fanned out to one worker thread
+    per digest, so hashlib (which releases the GIL) runs alongside the pure
+    python data id chunker. `progress` is called with the number of bytes
+    processed at most every PROGRESS_INTERVAL seconds and once at the end.
+    `cancel` may be called from another thread and makes `run` raise
+    HashingCancelled.
+    """
+
+    BUFFER_SIZE = 16 * InstanceIdHasher.LEAF_SIZE
+    BUFFERS = 4
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, file_path, digests=(SHA256,), progress=None, parallel=True):
+        self.file_path = file_path
+        self.digests = digests
+        self.progress = progress
+        self.parallel = parallel
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self) -> FileDigests:
+        hashers = {digest: HASHERS[digest]() for digest in self.digests}
+        if self.parallel and len(hashers) > 1:
+            self._read_parallel([hashers[d] for d in self.digests if d in THREADED],
+                                [hashers[d] for d in self.digests if d not in THREADED])
+        else:
+            self._read(list(hashers.values()))
+
+        results = {digest: hasher.result() for digest, hasher in hashers.items()}
+        instance_id, instance_hash = results.get(INSTANCE_ID, (None, None))
+        return FileDigests(
+            sha256=results.get(SHA256),
+            instance_id=instance_id,
+            instance_hash=instance_hash,
+            data_id=results.get(DATA_ID),
+            content=results.get(CONTENT),
+        )
+
+    def _chunks(self, buffers, before_read=None):
+        """Read the file into `buffers` in turn and yield (index, memoryview)"""
+        views = [memoryview(buffer) for buffer in buffers]
+        processed = 0
+        last_progress = time.monotonic()
+        with open(self.file_path, 'rb') as infile:
+            index = 0
+            while True:
+                if self._cancelled.is_set():
+                    raise HashingCancelled(self.file_path)
+                if before_read is not None:
+                    before_read(index)
+                size = infile.readinto(buffers[index])
+                if not size:
+                    break
+                yield index, views[index][:size]
+                processed += size
+                if self.progress is not None and time.monotonic() - last_progress >= self.PROGRESS_INTERVAL:
+                    self.progress(processed)
+                    last_progress = time.monotonic()
+                index = (index + 1) % len(buffers)
+        if self.progress is not None:
+            self.progress(processed)
+
+    def _read(self, hashers):
+        for _, chunk in self._chunks([bytearray(self.BUFFER_SIZE)]):
+            for hasher in hashers:
+                hasher.update(chunk)
+
+    def _read_parallel(self, threaded, inline):
+        workers = [HashWorker(hasher) for hasher in threaded]
+        for worker in workers:
+            worker.start()
+        buffers = [bytearray(self.BUFFER_SIZE) for _ in range(self.BUFFERS)]
+        # each worker releases a buffer once after processing it, all buffers are free at the start
+        free = [threading.Semaphore(len(workers)) for _ in buffers]
+
+        def wait_free(index):
+            for _ in workers:
+                free[index].acquire()
+
+        try:
+            for index, chunk in self._chunks(buffers, before_read=wait_free):
+                for worker in workers:
+                    if worker.error is not None:
+                        raise worker.error
+                    worker.chunks.put((chunk, free[index]))
+                for hasher in inline:
+                    hasher.update(chunk)
+        finally:
+            for worker in workers:
+                worker.chunks.put(None)
+            for worker in workers:
+                worker.join()
+        for worker in workers:
+            if worker.error is not None:
+                raise worker.error
@@ -5,7 +5,10 @@ import logging
 from PyQt5 import QtCore
 
 from app import sync
+from app.chainstate import ChainState
+from app.syncengine import SyncEngine
 from app.signals import signals
+from app.backend.notifications import notification_listener
 from app.backend.rpc import get_active_rpc_client
 from app.models import Alias
 from app.models import Profile
@@ -17,16 +20,19 @@ log = logging.getLogger(__name__)
 class Updater(QtCore.QThread):
 
     UPDATE_INTERVALL = 3
+    #: max seconds between polls while the managed node notifies us about changes
+    IDLE_INTERVALL = 30
 
     sync_funcs = (
         sync.getruntimeparams,
-        sync.getblockchaininfo,
-        sync.process_blocks,
     )
 
     def __init__(self, parent=None):
         super().__init__(parent)
         log.debug('init updater')
+        #: the only poller of the node, other updaters subscribe to its change signals
+        self.chain_state = ChainState()
+        self.sync_engine = SyncEngine()
     #
     # def __del__(self):
     #     self.wait()
@@ -49,21 +55,18 @@ class Updater(QtCore.QThread):
 
             log.debug('check for new blocks')
             try:
-                # This triggers Network Info widget update that we always want
-                blockchain_info = sync.getblockchaininfo()
-                # The node is downloading blocks if it has more headers than blocks
-                if blockchain_info.blocks != blockchain_info.headers or blockchain_info.reindex:
-                    log.debug('blockchain syncing - skip expensive rpc calls')
-                    self.sleep(self.UPDATE_INTERVALL)
-                    continue
-                node_block_hash = blockchain_info.bestblockhash
+                self.chain_state.poll(self.client)
             except Exception as e:
-                log.exception('cannot get bestblock via rpc: %s' % e)
+                log.exception('cannot poll chain state via rpc: %s' % e)
                 self.sleep(self.UPDATE_INTERVALL)
                 continue
 
-            sync.getinfo()
+            if self.chain_state.syncing:
+                log.debug('blockchain syncing - skip expensive rpc calls')
+                self.sleep(self.UPDATE_INTERVALL)
+                continue
 
+            node_block_hash = self.chain_state.best_block_hash
             if node_block_hash != synced_blockhash:
                 log.debug('starting full sync round')
 
@@ -74,7 +77,21 @@ class Updater(QtCore.QThread):
                     except Exception as e:
                         log.exception(e)
 
-                synced_blockhash = node_block_hash
+                synced = self.sync_engine.run()
+                if synced:
+                    synced_blockhash = node_block_hash
                 signals.sync_cycle_finished.emit()
+                if not synced:
+                    # retry soon instead of waiting for the next notification
+                    self.sleep(self.UPDATE_INTERVALL)
+                    continue
+
+            self.wait_for_changes()
 
+    def wait_for_changes(self):
+        """Wait for a node notification if available, poll at UPDATE_INTERVALL otherwise"""
+        if notification_listener.active:
+            if notification_listener.wait(self.IDLE_INTERVALL):
+                log.debug('woken up by node notification')
+        else:
             self.sleep(self.UPDATE_INTERVALL)
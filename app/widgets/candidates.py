@@ -10,7 +10,7 @@ from PyQt5.QtWidgets import QTableView, QApplication, QAbstractItemView, QHeader
 
 from app import enums
 from app.models import Alias
-from app.models import Profile, PendingVote, Permission
+from app.models import Profile, PendingVote, Permission, snapshots
 from app.models.db import data_session_scope, profile_session_scope
 from app.signals import signals
 from app import ADMIN_CONSENUS_ADMIN, ADMIN_CONSENUS_MINE
@@ -27,10 +27,10 @@ class CandidateModelUpdater(QThread):
 
     def run(self):
         with data_session_scope() as session:
-            self.parent().candidates = PendingVote.get_candidates(session)
+            self.parent().candidates = snapshots.get(session, PendingVote.get_candidates)
             self.parent().aliases = Alias.get_aliases(session)
-            self.parent().already_granted = PendingVote.already_granted(session)
-            self.parent().num_guardians = Permission.num_guardians(session)
+            self.parent().already_granted = snapshots.get(session, PendingVote.already_granted)
+            self.parent().num_guardians = snapshots.get(session, Permission.num_guardians)
 
 
 class CandidateModel(QAbstractTableModel):
@@ -50,7 +50,7 @@ class CandidateModel(QAbstractTableModel):
 
     def update_num_guardians(self):
         with data_session_scope() as session:
-            self.num_guardians = Permission.num_guardians(session)
+            self.num_guardians = snapshots.get(session, Permission.num_guardians)
 
     def flags(self, idx: QModelIndex):
         if idx.column() == 1:
@@ -13,7 +13,7 @@ from PyQt5.QtWidgets import QApplication, QHeaderView, QMessageBox, QWidget, QMe
 
 from app import enums
 from app.backend.rpc import get_active_rpc_client
-from app.models import Alias, MiningReward, Permission, Profile, PendingVote, Vote
+from app.models import AddressStats, Alias, Permission, Profile, PendingVote, snapshots
 from app.models.db import data_session_scope, profile_session_scope
 from app.signals import signals
 
@@ -29,29 +29,25 @@ class PermissionModelUpdater(QThread):
 
     def run(self):
         with data_session_scope() as session:
-            for reward in MiningReward.mined_last_24h(session):
-                self.parent().last_24_h_mine_count[reward.address] = reward.count
-            for reward in MiningReward.last_mined(session):
-                self.parent().last_mined[reward.address] = reward.last_mined
-            for vote in Vote.voted_last_24h(session):
-                self.parent().last_24_h_vote_count[vote.from_address] = vote.count
-            for vote in Vote.last_voted(session):
-                self.parent().last_voted[vote.from_address] = vote.last_voted
-            for pending_vote in PendingVote.num_revokes(
-                    session, self.parent()._perm_type):
+            perm_type = self.parent()._perm_type
+            # the counts also change when the window moves on without new blocks
+            stats = snapshots.get(session, AddressStats.get_stats, AddressStats.window_start())
+            self.parent().last_24_h_mine_count = {address: s.mined for address, s in stats.items() if s.mined}
+            self.parent().last_mined = {address: s.last_mined for address, s in stats.items() if s.last_mined}
+            self.parent().last_24_h_vote_count = {address: s.voted for address, s in stats.items() if s.voted}
+            self.parent().last_voted = {address: s.last_voted for address, s in stats.items() if s.last_voted}
+            for pending_vote in snapshots.get(session, PendingVote.num_revokes, perm_type):
                 self.parent().count_revokes[pending_vote.address_to] = pending_vote.count
 
-            self.parent().num_guardians = Permission.num_guardians(session)
+            self.parent().num_guardians = snapshots.get(session, Permission.num_guardians)
 
-            if self.parent()._perm_type == enums.MINE:
-                self.parent()._data = list(Permission.validators(session))
-            elif self.parent()._perm_type == enums.ADMIN:
-                self.parent()._data = list(Permission.guardians(session))
+            if perm_type == enums.MINE:
+                self.parent()._data = list(snapshots.get(session, Permission.validators))
+            elif perm_type == enums.ADMIN:
+                self.parent()._data = list(snapshots.get(session, Permission.guardians))
             self.parent()._alias_list = Alias.get_aliases(session)
 
-            self.parent().already_revoked = PendingVote.already_revoked(
-                session, self.parent()._perm_type
-            )
+            self.parent().already_revoked = snapshots.get(session, PendingVote.already_revoked, perm_type)
 
 
 class PermissionModel(QAbstractTableModel):
@@ -74,19 +70,15 @@ class PermissionModel(QAbstractTableModel):
         self._data = []
         self._alias_list = []
         self.already_revoked = []
+        self.requires_update = False
         self.update_thread = PermissionModelUpdater(self)
         self.update_thread.finished.connect(self.update_finished)
         self.update_thread.start()
 
-        self.alias_list_changed_update_enabled = True
-
         signals.permissions_changed.connect(self.permissions_changed)
         signals.votes_changed.connect(self.permissions_changed)
+        signals.community_stats_changed.connect(self.permissions_changed)
         signals.alias_list_changed.connect(self.alias_list_changed)
-        signals.batch_gui_updates_allowed.connect(self.batch_gui_updates_allowed_changed)
-
-    def batch_gui_updates_allowed_changed(self, status):
-        self.alias_list_changed_update_enabled = status
 
     def headerData(self, col, orientation, role=Qt.DisplayRole):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
@@ -145,9 +137,6 @@ class PermissionModel(QAbstractTableModel):
         return super().flags(idx)
 
     def alias_list_changed(self):
-        if self.alias_list_changed_update_enabled == False:
-            return
-
         self.beginResetModel()
         with data_session_scope() as session:
             self._alias_list = Alias.get_aliases(session)
@@ -155,6 +144,9 @@ class PermissionModel(QAbstractTableModel):
 
     @pyqtSlot()
     def permissions_changed(self):
+        if self.update_thread.isRunning():
+            self.requires_update = True
+            return
         self.beginResetModel()
         self.update_thread.start()
 
@@ -162,6 +154,9 @@ class PermissionModel(QAbstractTableModel):
     def update_finished(self):
         self.endResetModel()
         self.parent().create_table_buttons(self.parent().balance_is_zero)
+        if self.requires_update:
+            self.requires_update = False
+            self.permissions_changed()
 
 
 class ButtonDelegate(QStyledItemDelegate):
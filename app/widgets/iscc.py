@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import io
 import logging
 import os
 import qrcode
@@ -15,12 +16,13 @@ from PyQt5.QtWidgets import QMessageBox
 
 import app
 from app.backend.rpc import get_active_rpc_client
-from app.models.db import data_session_scope
+from app.models.db import data_session_scope, profile_session_scope
 from app.ui.iscc import Ui_Widget_ISCC
-from app.models import ISCC
+from app.models import FileFingerprint, ISCC, ISCCHash
 from app.widgets.iscc_table import ISCCTableView
 from app.widgets.iscc_conflicts_table import ConflictTableView
 from app.signals import signals
+from app.tools.hashing import FileHasher, CONTENT, SHA256, INSTANCE_ID, DATA_ID
 
 log = logging.getLogger(__name__)
 
@@ -39,6 +41,10 @@ class WidgetISCC(QWidget, Ui_Widget_ISCC):
         self.instance_id = None
         self.instance_hash = None
         self.iscc = None
+        self.hash_thread = None
+        self.conflict_finder = None
+        self.conflicts_outdated = False
+        self.current_file_key = None
         self.conflict_in_meta = False
         self.title_formatted = None
         self.extra_formatted = None
@@ -81,7 +87,7 @@ class WidgetISCC(QWidget, Ui_Widget_ISCC):
         else:
             self.btn_register.setToolTip("")
 
-    def search_iscc(self):  # todo: wenn man einen ganzen iscc sucht findet man nichts...
+    def search_iscc(self):
         search_term = self.edit_search_iscc.text()
         self.table_iscc.model().update_data(search_term)
 
@@ -135,6 +141,21 @@ class WidgetISCC(QWidget, Ui_Widget_ISCC):
         self.current_filepath = file_path
         self.button_dropzone.setText("Processing File...")
         self.button_dropzone.setDisabled(True)
+
+        self.current_file_key = FileFingerprint.key(file_path)
+        with profile_session_scope() as session:
+            cached = FileFingerprint.lookup(session, self.current_file_key)
+            use_cache = cached is not None and cached.has_iscc
+            if use_cache:
+                log.debug('using cached iscc components for %s' % file_path)
+                self.content_id = cached.content_id
+                self.data_id = cached.data_id
+                self.instance_id = cached.instance_id
+                self.instance_hash = cached.instance_hash
+        if use_cache:
+            self.hash_thread_finished()
+            return
+
         self.hash_thread = ISCCGEnerator(file_path, self)
         self.hash_thread.finished.connect(self.hash_thread_finished)
 
@@ -142,6 +163,16 @@ class WidgetISCC(QWidget, Ui_Widget_ISCC):
 
     @pyqtSlot()
     def hash_thread_finished(self):
+        if self.hash_thread is not None and self.hash_thread.result is not None:
+            with profile_session_scope() as session:
+                FileFingerprint.store(
+                    session, self.current_file_key, sha256=self.hash_thread.result.sha256,
+                    content_id=self.content_id, data_id=self.data_id, instance_id=self.instance_id,
+                    instance_hash=self.instance_hash
+                )
+            self.hash_thread = None
+        if self.meta_id and self.content_id:
+            self.show_conflicts()
         self.button_dropzone.setDisabled(False)
         self.button_dropzone.setText(self.current_filepath.split("/")[-1])
 
@@ -210,26 +241,54 @@ class WidgetISCC(QWidget, Ui_Widget_ISCC):
         pixmap = pixmap.scaledToWidth(128)
         pixmap = pixmap.scaledToHeight(128)
         self.label_qr.setPixmap(pixmap)
+        if self.conflict_finder and self.conflict_finder.isRunning():
+            self.conflicts_outdated = True
+            return
+        self.conflicts_outdated = False
+        self.conflict_finder = ConflictFinder(self.meta_id, self.content_id, self.data_id, self.instance_id)
+        self.conflict_finder.finished.connect(self.conflict_finder_finished)
+        self.conflict_finder.start()
+
+    @pyqtSlot()
+    def conflict_finder_finished(self):
+        # Components changed while searching
+        if self.conflicts_outdated:
+            self.show_conflicts()
+            return
+        finder = self.conflict_finder
+        if not self.balance_is_zero:
+            self.btn_register.setDisabled(finder.already_exists)
+        if len(finder.conflicts) > 0:
+            self.label_title_conflicts.setHidden(False)
+            self.table_conflicts.setHidden(False)
+            self.table_conflicts.model().update_data(finder.conflicts, self.iscc)
+            if finder.conflict_in_meta:
+                self.widget_extra.setHidden(False)
+                self.conflict_in_meta = True
+        else:
+            self.label_title_conflicts.setHidden(True)
+            self.table_conflicts.setHidden(True)
+        self.label_title_extra.setHidden(not self.conflict_in_meta)
+
+
+class ConflictFinder(QThread):
+    """Find registered ISCCs that are similar to the generated one"""
+
+    def __init__(self, meta_id, content_id, data_id, instance_id, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.components = (meta_id, content_id, data_id, instance_id)
+        self.already_exists = False
+        self.conflict_in_meta = False
+        self.conflicts = []
+
+    def run(self):
         with data_session_scope() as session:
-            if not self.balance_is_zero:
-                self.btn_register.setDisabled(
-                    ISCC.already_exists(session, self.meta_id, self.content_id, self.data_id, self.instance_id))
-            conflicts = ISCC.get_conflicts(session, self.meta_id, self.content_id, self.data_id, self.instance_id)
-            if len(conflicts) > 0:
-                self.label_title_conflicts.setHidden(False)
-                self.table_conflicts.setHidden(False)
-                self.table_conflicts.model().update_data(conflicts, self.iscc)
-                if ISCC.conflict_in_meta(session, self.meta_id):
-                    self.widget_extra.setHidden(False)
-                    self.conflict_in_meta = True
-            else:
-                self.label_title_conflicts.setHidden(True)
-                self.table_conflicts.setHidden(True)
-            self.label_title_extra.setHidden(not self.conflict_in_meta)
+            self.already_exists = ISCC.already_exists(session, *self.components)
+            self.conflicts = ISCCHash.get_conflicts(session, *self.components)
+            self.conflict_in_meta = ISCC.conflict_in_meta(session, self.components[0])
 
 
 class ISCCGEnerator(QThread):
-    #: emits num bytes processed
 
     def __init__(self, file_path, parent, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -238,17 +297,20 @@ class ISCCGEnerator(QThread):
         self.parent = parent
 
     def run(self):
+        # one read of the file for sha256, instance id, data id and the content id of supported types
         file_ending = self.file_path.split('.')[-1]
+        digests = (SHA256, INSTANCE_ID, DATA_ID)
+        if file_ending in ['jpg', 'png', 'jpeg', 'gif', 'txt', 'docx']:
+            digests += (CONTENT,)
+        self.result = FileHasher(self.file_path, digests).run()
+        content = self.result.content
         if file_ending in ['jpg', 'png', 'jpeg', 'gif']:
-            self.parent.content_id = iscc.content_id_image(self.file_path)
+            self.parent.content_id = iscc.content_id_image(content)
         elif file_ending == 'txt':
-            with open(self.file_path, encoding='utf-8') as infile:
-                self.parent.content_id = iscc.content_id_text(infile.read())
+            self.parent.content_id = iscc.content_id_text(io.TextIOWrapper(content, encoding='utf-8').read())
         elif file_ending == 'docx':
-            self.parent.content_id = iscc.content_id_text(docx2txt.process(self.file_path))
-
-        self.parent.instance_id, self.parent.instance_hash = iscc.instance_id(self.file_path)
-        self.parent.data_id = iscc.data_id(self.file_path)
+            self.parent.content_id = iscc.content_id_text(docx2txt.process(content))
 
-        if self.parent.meta_id:
-            self.parent.show_conflicts()
+        self.parent.instance_id = self.result.instance_id
+        self.parent.instance_hash = self.result.instance_hash
+        self.parent.data_id = self.result.data_id
@@ -39,13 +39,14 @@ class ConflictModel(QAbstractTableModel):
         return len(self.headers)
 
     def data(self, idx: QModelIndex, role=None):
-        row = idx.row()
-        col = idx.column()
-        conflict = self.conflicts[row]
-
         if not idx.isValid():
             return None
 
+        row = idx.row()
+        col = idx.column()
+        conflict = self.conflicts[row].iscc
+        distances = self.conflicts[row].distances
+
         if role == Qt.DisplayRole:
             if col == 0:
                 return conflict.meta_id
@@ -60,15 +61,15 @@ class ConflictModel(QAbstractTableModel):
             elif col == 5:
                 return self.aliases[conflict.address] if conflict.address in self.aliases else conflict.address
 
-        elif role == Qt.ForegroundRole:
-            if col == 0 and conflict.meta_id == self.iscc[0]:
-                return QVariant(QColor(Qt.red))
-            if col == 1 and conflict.content_id == self.iscc[1]:
-                return QVariant(QColor(Qt.red))
-            if col == 2 and conflict.data_id == self.iscc[2]:
-                return QVariant(QColor(Qt.red))
-            if col == 3 and conflict.instance_id == self.iscc[3]:
+        elif role == Qt.ForegroundRole and col in [0, 1, 2, 3]:
+            # identical components red, similar ones orange
+            if distances[col] == 0:
                 return QVariant(QColor(Qt.red))
+            if distances[col] is not None:
+                return QVariant(QColor(255, 140, 0))
+
+        elif role == Qt.ToolTipRole and col in [0, 1, 2] and distances[col] is not None:
+            return 'Hamming distance: {} bits'.format(distances[col])
 
         elif role == Qt.FontRole and col in [0, 1, 2, 3]:
             font = QFont("Roboto Mono Light", 8)
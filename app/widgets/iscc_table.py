@@ -5,72 +5,126 @@ from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QThread
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import QAbstractItemView, QApplication, QHeaderView, QMenu, QTableView
 
-from app.models import Alias, ISCC
+from app.models import Alias, ISCC, snapshots
 from app.models.db import data_session_scope
 from app.signals import signals
 
 log = logging.getLogger(__name__)
 
 class ISCCModelUpdater(QThread):
-    def __init__(self, search_term, *args, **kwargs):
+    """Load `limit` rows of the ISCC table. `after` is None to load from the start."""
+
+    def __init__(self, search_term, sort_key, descending, after, limit, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.aliases = []
+        self.aliases = {}
         self.isccs = []
         self.search_term = search_term
+        self.sort_key = sort_key
+        self.descending = descending
+        self.after = after
+        self.limit = limit
 
     def run(self):
         with data_session_scope() as session:
             self.aliases = Alias.get_aliases(session)
-            if self.search_term:
-                self.isccs = ISCC.filter_iscc(session, self.search_term, page = 0, page_size = 1000)
-            else:
-                self.isccs = ISCC.get_all_iscc_paged(session, page = 0, page_size = 1000)
+            self.isccs = snapshots.get(session, ISCC.get_page, self.search_term, self.sort_key, self.descending,
+                                       self.after, self.limit)
 
 
 class ISCCModel(QAbstractTableModel):
+    """Lazily fetched ISCC registry.
+
+    Rows are loaded page by page through canFetchMore/fetchMore while the view
+    scrolls. Searching and sorting reload the first page from the database.
+    Data changes reload all rows loaded so far, an insert or removal can land
+    on any page.
+    """
+
+    PAGE_SIZE = 200
+    SORT_KEYS = (ISCC.SORT_ISCC, ISCC.SORT_TITLE, ISCC.SORT_DATE, ISCC.SORT_PUBLISHER)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.isccs = []
-        self.aliases = []
+        self.aliases = {}
         self.updateWorker = None
         self.requires_update = False
+        # rows to load on the next reload
+        self.reload_limit = self.PAGE_SIZE
+        self.at_end = False
         self.search_term = None
+        # None: best matches first while searching, newest first otherwise
+        self.sort_key = None
+        self.descending = True
         self.headers = ('ISCC', 'Title', 'Date', 'Publisher')
-        self.update_data_update_enabled = True
         self.update_data()
 
-        signals.iscc_inserted.connect(self.update_data)
-        signals.batch_gui_updates_allowed.connect(self.batch_gui_updates_allowed_changed)
-
-    def batch_gui_updates_allowed_changed(self, status):
-        self.update_data_update_enabled = status
+        signals.iscc_inserted.connect(self.refresh)
 
     def update_data(self, search_term=None):
-        if self.update_data_update_enabled == False:
-            return
-
         self.search_term = search_term
+        self.reload()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_key = self.SORT_KEYS[column] if column >= 0 else None
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def reload(self):
+        """Start over with the first page"""
+        self.reload_limit = self.PAGE_SIZE
+        self.requires_update = True
+        self.start_update()
+
+    def refresh(self):
+        """Reload the rows that are loaded after the data changed"""
+        self.reload_limit = max(self.reload_limit, len(self.isccs), self.PAGE_SIZE)
+        self.requires_update = True
+        self.start_update()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not self.at_end and not self.requires_update
+
+    def fetchMore(self, parent=QModelIndex()):
+        self.start_update()
+
+    def start_update(self):
         if self.updateWorker and self.updateWorker.isRunning():
-            self.requires_update = True
+            # updater_finished starts the next update
+            return
+        if self.requires_update:
+            after, limit = None, self.reload_limit
+        elif self.isccs and not self.at_end:
+            after, limit = (self.isccs[-1].sort_value, self.isccs[-1].iscc_id), self.PAGE_SIZE
         else:
-            self.updateWorker = ISCCModelUpdater(self.search_term)
-            self.updateWorker.finished.connect(self.updater_finished)
-            self.requires_update = False
-            self.updateWorker.start()
+            return
+        self.requires_update = False
+        self.reload_limit = self.PAGE_SIZE
+        self.updateWorker = ISCCModelUpdater(self.search_term, self.sort_key, self.descending, after, limit)
+        self.updateWorker.finished.connect(self.updater_finished)
+        self.updateWorker.start()
 
     def updater_finished(self):
-        # Update Model
-        if self.aliases != self.updateWorker.aliases or self.isccs != self.updateWorker.isccs:
-            self.beginResetModel()
-            self.aliases = self.updateWorker.aliases
-            self.isccs = self.updateWorker.isccs
-            self.endResetModel()
+        worker = self.updateWorker
+        page = worker.isccs
+        if worker.after is None:
+            # the reload covers every loaded row, only reset if any of them changed
+            if self.aliases != worker.aliases or self.isccs != page:
+                self.beginResetModel()
+                self.aliases = worker.aliases
+                self.isccs = page
+                self.endResetModel()
+            self.at_end = len(page) < worker.limit
+        elif not self.requires_update:
+            if page:
+                self.beginInsertRows(QModelIndex(), len(self.isccs), len(self.isccs) + len(page) - 1)
+                self.isccs.extend(page)
+                self.endInsertRows()
+            self.at_end = len(page) < worker.limit
 
         # Data has been modified in the meantime.. Update again
         if self.requires_update:
-            self.requires_update = False
-            self.updateWorker = ISCCModelUpdater(self.search_term)
-            self.updateWorker.start()
+            self.start_update()
 
     def flags(self, idx: QModelIndex):
         if idx.column() == 0:
@@ -88,12 +142,12 @@ class ISCCModel(QAbstractTableModel):
         return len(self.headers)
 
     def data(self, idx: QModelIndex, role=None):
+        if not idx.isValid():
+            return None
         row = idx.row()
         col = idx.column()
         iscc = self.isccs[row]
-        iscc_code = iscc.ISCC.meta_id + '-' + iscc.ISCC.content_id + '-' + iscc.ISCC.data_id + '-' + iscc.ISCC.instance_id
-        if not idx.isValid():
-            return None
+        iscc_code = iscc.meta_id + '-' + iscc.content_id + '-' + iscc.data_id + '-' + iscc.instance_id
 
         if role == Qt.EditRole and col == 0:
             return iscc_code
@@ -102,11 +156,11 @@ class ISCCModel(QAbstractTableModel):
             if col == 0:
                 return iscc_code
             elif col == 1:
-                return iscc.ISCC.title
+                return iscc.title
             elif idx.column() == 2:
                 return "{}".format(iscc.mining_time)
             elif idx.column() == 3:
-                address = iscc.ISCC.address
+                address = iscc.address
                 return self.aliases[address] if address in self.aliases else "{}".format(address)
 
 
@@ -141,8 +195,9 @@ class ISCCTableView(QTableView):
         self.setSelectionMode(QAbstractItemView.SingleSelection)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.setShowGrid(False)
-        # TODO implement iscc tables sorting
-        self.setSortingEnabled(False)
+        # sorting is done by the model in sql, no column selected means default order
+        header.setSortIndicator(-1, Qt.DescendingOrder)
+        self.setSortingEnabled(True)
         self.setCornerButtonEnabled(True)
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.openCustomMenu)
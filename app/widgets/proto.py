@@ -9,7 +9,7 @@ from PyQt5.QtWidgets import QApplication
 import app
 from app import enums
 from app import helpers
-from app.models import Profile, Permission, PendingVote
+from app.models import Profile, Permission, PendingVote, snapshots
 from app.models.db import profile_session_scope, data_session_scope
 from app.responses import Getblockchaininfo, Getinfo
 from app.signals import signals
@@ -272,13 +272,13 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
     @pyqtSlot()
     def permissions_changed(self):
         with data_session_scope() as session:
-            num_validators = Permission.num_validators(session)
+            num_validators = snapshots.get(session, Permission.num_validators)
             self.lbl_num_validators.setText(str(num_validators))
 
-            num_guardians = Permission.num_guardians(session)
+            num_guardians = snapshots.get(session, Permission.num_guardians)
             self.lbl_num_guardians.setText(str(num_guardians))
 
-            num_candidates = PendingVote.num_candidates(session)
+            num_candidates = snapshots.get(session, PendingVote.num_candidates)
             self.lbl_num_candidates.setText(str(num_candidates))
 
 
@@ -1,18 +1,18 @@
 # -*- coding: utf-8 -*-
 import logging
 import os
-from hashlib import sha256
 
 from PyQt5.QtCore import QMimeData, QUrl, pyqtSlot, QObject, QEvent, pyqtSignal, QThread, QDir, QAbstractTableModel, \
     QModelIndex, Qt
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QDragLeaveEvent, QFont
 from PyQt5.QtWidgets import QWidget, QFileDialog, QTableWidgetItem, QHeaderView, QMessageBox
 
-from app.models import Profile, profile_session_scope
+from app.models import FileFingerprint, Profile, profile_session_scope
 from app.api import put_timestamp
-from app.exceptions import RpcResponseError
+from app.exceptions import HashingCancelled, RpcResponseError
 from app.models.timestamp import Timestamp
 from app.signals import signals
+from app.tools.hashing import FileHasher, SHA256
 from app.ui.timestamp import Ui_WidgetTimestamping
 
 log = logging.getLogger(__name__)
@@ -27,20 +27,16 @@ class Hasher(QThread):
         super().__init__(*args, **kwargs)
         self.file_path = file_path
         self.result = None
+        self.file_hasher = FileHasher(file_path, (SHA256,), progress=self.hashing_progress.emit)
 
     def run(self):
-        hasher = sha256()
-        progress = 0
-        with open(self.file_path, 'rb') as f:
-            while True:
-                chunk = f.read(1024)
-                if not chunk:
-                    break
-                else:
-                    hasher.update(chunk)
-                    progress += len(chunk)
-                    self.hashing_progress.emit(progress)
-        self.result = hasher.hexdigest()
+        try:
+            self.result = self.file_hasher.run().sha256
+        except HashingCancelled:
+            log.debug('hashing of %s cancelled' % self.file_path)
+
+    def cancel(self):
+        self.file_hasher.cancel()
 
 
 class WidgetTimestamping(QWidget, Ui_WidgetTimestamping):
@@ -51,10 +47,11 @@ class WidgetTimestamping(QWidget, Ui_WidgetTimestamping):
         self.balance_is_zero = True
 
         self.setupUi(self)
-        self.reset()
         self.hash_thread = None
+        self.reset()
         self.current_fingerprint = None
         self.current_filepath = None
+        self.current_file_key = None
         self.current_comment = None
 
         font = QFont()
@@ -105,20 +102,34 @@ class WidgetTimestamping(QWidget, Ui_WidgetTimestamping):
         self.progress_bar.setValue(0)
         self.progress_bar.show()
         self.label_processing_status.setText('Calculating fingerprint ...')
-        self.hash_thread = Hasher(file_path)
-        self.hash_thread.hashing_progress.connect(self.progress_bar.setValue)
-        self.hash_thread.finished.connect(self.hash_thread_finished)
 
         # Disable dropzone
         self.gbox_dropzone.setDisabled(True)
         self.button_dropzone.setDisabled(True)
 
+        self.current_file_key = FileFingerprint.key(file_path)
+        with profile_session_scope() as session:
+            cached = FileFingerprint.lookup(session, self.current_file_key)
+            cached_sha256 = cached.sha256 if cached else None
+        if cached_sha256:
+            log.debug('using cached fingerprint for %s' % file_path)
+            self.current_fingerprint = cached_sha256
+            self.get_timestamps()
+            return
+
+        self.hash_thread = Hasher(file_path)
+        self.hash_thread.hashing_progress.connect(self.progress_bar.setValue)
+        self.hash_thread.finished.connect(self.hash_thread_finished)
         self.hash_thread.start()
 
     @pyqtSlot()
     def hash_thread_finished(self):
         log.debug('hash thread finished with: %s' % self.hash_thread.result)
+        if self.hash_thread.result is None:
+            return
         self.current_fingerprint = self.hash_thread.result
+        with profile_session_scope() as session:
+            FileFingerprint.store(session, self.current_file_key, sha256=self.current_fingerprint)
         self.get_timestamps()
 
     def get_timestamps(self):
@@ -246,6 +257,8 @@ class WidgetTimestamping(QWidget, Ui_WidgetTimestamping):
 
     @pyqtSlot()
     def reset(self):
+        if self.hash_thread is not None and self.hash_thread.isRunning():
+            self.hash_thread.cancel()
         self.current_fingerprint = None
         self.current_filepath = None
 
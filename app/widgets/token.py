@@ -12,6 +12,7 @@ from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QCompleter
 from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtWidgets import QStyledItemDelegate
+from mcrpc.exceptions import RpcError
 
 from app.backend.rpc import get_active_rpc_client
 from app.models import Address
@@ -33,13 +34,11 @@ class WidgetToken(QWidget, Ui_WidgetToken):
 
         self.licenses = []
         self.info ={}
-        self.edit_completer_update_enabled = True
 
         # Connect signals
         signals.wallet_tokens_changed.connect(self.tokens_changed)
         signals.alias_list_changed.connect(self.edit_completer)
         signals.new_address.connect(self.edit_completer)
-        signals.batch_gui_updates_allowed.connect(self.batch_gui_updates_allowed_changed)
 
         self.edit_resale_to.setValidator(AddressValidator())
         self.edit_resale_to.textChanged.connect(self.on_address_edit)
@@ -49,9 +48,6 @@ class WidgetToken(QWidget, Ui_WidgetToken):
 
         self.edit_completer()
 
-    def batch_gui_updates_allowed_changed(self, status):
-        self.edit_completer_update_enabled = status
-
     def tokens_changed(self, tokens):
         new_licenses = []
         new_info = {}
@@ -89,9 +85,6 @@ class WidgetToken(QWidget, Ui_WidgetToken):
         sender.setStyleSheet('QLineEdit { background-color: %s }' % color)
 
     def edit_completer(self):
-        if self.edit_completer_update_enabled == False:
-            return
-
         address_list = []
         with data_session_scope() as session:
             for address, alias in Alias.get_aliases(session).items():
@@ -147,8 +140,7 @@ class WidgetToken(QWidget, Ui_WidgetToken):
 
 
 class TokensUpdater(QThread):
-    UPDATE_INTERVALL = 3
-    STARTUP_DELAY = 5
+    """One-shot update of wallet tokens, started on chain state changes"""
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -160,47 +152,36 @@ class TokensUpdater(QThread):
         return get_active_rpc_client()
 
     def run(self):
-        client = get_active_rpc_client()
-        log.debug('sleeping %i seconds before starting to sync token updates' % self.STARTUP_DELAY)
-        self.sleep(self.STARTUP_DELAY)
-        while True:
-
-            log.debug('check for new local token updates')
-            try:
-                # This triggers Network Info widget update that we always want
-                blockchain_info = client.getblockchaininfo()
-                # The node is downloading blocks if it has more headers than blocks
-                if blockchain_info.blocks != blockchain_info.headers:
-                    log.debug('blockchain syncing - skip expensive rpc calls')
-                    self.sleep(self.UPDATE_INTERVALL)
-                    continue
-                wallet_tokens = client.getmultibalances()
-            except Exception as e:
-                log.exception('cannot get blocks via rpc: %s' % e)
-                self.sleep(self.UPDATE_INTERVALL)
+        client = self.client
+        log.debug('check for new local token updates')
+        try:
+            wallet_tokens = client.getmultibalances()
+        except Exception as e:
+            log.exception('cannot get token balances via rpc: %s' % e)
+            return
+        wallet_tokens = [token for token in wallet_tokens['total'] if 'name' in token]
+        try:
+            token_infos = client.batch([('listassets', token['name'], True) for token in wallet_tokens])
+        except Exception as e:
+            log.exception('cannot get token details via rpc: %s' % e)
+            return
+        tokens = []
+        for token, token_info in zip(wallet_tokens, token_infos):
+            if isinstance(token_info, RpcError) or not token_info:
+                log.debug(token_info)
                 continue
-            tokens = []
-            for token in wallet_tokens['total']:
-                if 'name' not in token:
-                    continue
-                try:
-                    token_info = client.listassets(token['name'], True)[0]
-                except Exception as e:
-                    log.debug(e)
-                    continue
-                if 'type' in token_info['details'] and token_info['details']['type'] == 'smart-license':
-                    tokens.append([
-                        token_info['details']['info'] if 'info' in token_info['details'] else '',
-                        token['qty'],
-                        token_info['issueqty'],
-                        'No' if token_info['open'] else 'Yes',
-                        token['name'] if 'name' in token else '',
-                        token['assetref'] if 'assetref' in token else None
-                    ])
-
-            signals.wallet_tokens_changed.emit(tokens)
-
-            self.sleep(self.UPDATE_INTERVALL)
+            token_info = token_info[0]
+            if 'type' in token_info['details'] and token_info['details']['type'] == 'smart-license':
+                tokens.append([
+                    token_info['details']['info'] if 'info' in token_info['details'] else '',
+                    token['qty'],
+                    token_info['issueqty'],
+                    'No' if token_info['open'] else 'Yes',
+                    token['name'] if 'name' in token else '',
+                    token['assetref'] if 'assetref' in token else None
+                ])
+
+        signals.wallet_tokens_changed.emit(tokens)
 
 
 class TokenTableView(QTableView):
@@ -235,7 +216,22 @@ class TokenTableView(QTableView):
         self.clicked.connect(self.info_clicked)
 
         self.updater = TokensUpdater(self)
-        self.updater.start()
+        self.updater.finished.connect(self.updater_finished)
+        self.requires_update = False
+        # Token balances change with our wallet, issued quantities with new blocks
+        signals.new_block.connect(self.update_tokens)
+        signals.wallet_transactions_changed.connect(self.update_tokens)
+
+    def update_tokens(self, *args):
+        if self.updater.isRunning():
+            self.requires_update = True
+        else:
+            self.updater.start()
+
+    def updater_finished(self):
+        if self.requires_update:
+            self.requires_update = False
+            self.updater.start()
 
     def info_clicked(self, index):
         if index.column() == self.table_model.NAME:
@@ -1,13 +1,14 @@
 import logging
 import webbrowser
-from datetime import datetime
+from collections import OrderedDict
 from decimal import Decimal, ROUND_DOWN
 
-from PyQt5.QtCore import QAbstractTableModel, QVariant, Qt, pyqtSignal, QThread, QModelIndex
+from PyQt5.QtCore import QAbstractTableModel, QVariant, Qt, pyqtSignal
 from PyQt5.QtGui import QColor, QIcon, QPixmap, QFont, QCursor
 from PyQt5.QtWidgets import QAbstractItemView, QHeaderView, QWidget, QTableView
 
-from app.backend.rpc import get_active_rpc_client
+from app.models import WalletTransaction
+from app.models.db import data_session_scope
 from app.signals import signals
 from app.ui.wallet_history import Ui_widget_wallet_history
 
@@ -23,71 +24,6 @@ class WalletHistory(QWidget, Ui_widget_wallet_history):
         self.layout_box_wallet_history.insertWidget(0, table)
 
 
-class WalletTransactionsUpdater(QThread):
-    UPDATE_INTERVALL = 3
-    STARTUP_DELAY = 5
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        log.debug('init wallet transaction updater')
-
-    @property
-    def client(self):
-        """Always use the rpc connection for the current profile"""
-        return get_active_rpc_client()
-
-    def run(self):
-        synced_wallet_tx = ''
-        synced_confirmed_wallet_tx = ''
-        log.debug('sleeping %i seconds before starting to sync wallet updates' % self.STARTUP_DELAY)
-        self.sleep(self.STARTUP_DELAY)
-        while True:
-
-            log.debug('check for new local wallet updates')
-            try:
-                # This triggers Network Info widget update that we always want
-                blockchain_info = self.client.getblockchaininfo()
-                # The node is downloading blocks if it has more headers than blocks
-                if blockchain_info.blocks != blockchain_info.headers:
-                    log.debug('blockchain syncing - skip expensive rpc calls')
-                    self.sleep(self.UPDATE_INTERVALL)
-                    continue
-                wallet_transactions = self.client.listwallettransactions(100)
-                latest_tx_hash = ''
-                if len(wallet_transactions) > 0:
-                    latest_tx_hash = wallet_transactions[-1]["txid"]
-                latest_confirmed_wallet_tx = ''
-                for tx in reversed(wallet_transactions):
-                    if tx.get("blocktime"):
-                        latest_confirmed_wallet_tx = tx["txid"]
-                        break
-            except Exception as e:
-                log.exception('cannot get blocks via rpc: %s' % e)
-                self.sleep(self.UPDATE_INTERVALL)
-                continue
-
-            if latest_tx_hash != synced_wallet_tx or latest_confirmed_wallet_tx != synced_confirmed_wallet_tx:
-                log.debug('syncing new wallet transactions')
-
-                try:
-                    balance_before = self.client.getbalance()
-                    wallet_transactions = self.client.listwallettransactions(100, 0, False, True)
-                    balance_after = self.client.getbalance()
-                    if balance_before != balance_after:
-                        log.debug("Balance changed while updating")
-                        continue
-                    signals.balance_changed.emit(balance_before)
-                    signals.wallet_transactions_changed.emit(wallet_transactions)
-
-                except Exception as e:
-                    log.exception(e)
-
-                synced_wallet_tx = latest_tx_hash
-                synced_confirmed_wallet_tx = latest_confirmed_wallet_tx
-
-            self.sleep(self.UPDATE_INTERVALL)
-
-
 class TransactionTableView(QTableView):
     def __init__(self, *args, **kwargs):
         QTableView.__init__(self, *args, **kwargs)
@@ -109,6 +45,10 @@ class TransactionTableView(QTableView):
         header.setSectionResizeMode(5, QHeaderView.ResizeToContents)
         header.setFont(font)
         header.on_enter.connect(self.reset_cursor)
+        # a replaced header is not clickable by default
+        header.setSectionsClickable(True)
+        header.setSortIndicator(TransactionHistoryTableModel.DATETIME, Qt.DescendingOrder)
+        header.sortIndicatorChanged.connect(self.sort_indicator_changed)
 
         # Row height
         self.verticalHeader().setVisible(False)
@@ -121,13 +61,20 @@ class TransactionTableView(QTableView):
         self.setSelectionMode(QAbstractItemView.SingleSelection)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.setShowGrid(False)
-        self.setSortingEnabled(False)
+        self.setSortingEnabled(True)
         self.setCornerButtonEnabled(True)
         self.clicked.connect(self.info_clicked)
 
         self.cursor_column = None
-        self.updater = WalletTransactionsUpdater(self)
-        self.updater.start()
+
+    def sort_indicator_changed(self, column, order):
+        # the type, comment and info columns are not sortable, keep showing the applied sort
+        model = self.table_model
+        if column not in model.column_to_sort_key:
+            header = self.horizontalHeader()
+            header.blockSignals(True)
+            header.setSortIndicator(model.sort_column, Qt.DescendingOrder if model.descending else Qt.AscendingOrder)
+            header.blockSignals(False)
 
     def mouseMoveEvent(self, e):
         super().mouseMoveEvent(e)
@@ -144,15 +91,20 @@ class TransactionTableView(QTableView):
         self.setCursor(QCursor(Qt.ArrowCursor))
 
     def info_clicked(self, index):
-        if index.column() == 5:
-            db = self.table_model.txs
-            txid = db[index.row()][self.table_model.INFO]
+        tx = self.table_model.row(index.row())
+        if index.column() == 5 and tx is not None:
+            txid = tx[self.table_model.INFO]
             link = 'https://explorer.coblo.net/tx/'
             link += txid
             webbrowser.open(link)
 
 
 class TransactionHistoryTableModel(QAbstractTableModel):
+    """Wallet history read from the local wallet transaction table.
+
+    Only windows of WINDOW_SIZE rows around the visible rows are loaded (and
+    at most MAX_WINDOWS of them kept), sorting is done by the database.
+    """
 
     TXTYPE = 0
     DATETIME = 1
@@ -160,13 +112,22 @@ class TransactionHistoryTableModel(QAbstractTableModel):
     AMOUNT = 3
     BALANCE = 4
     INFO = 5
-    POS_IN_BLOCK = 6
+    CONFIRMED = 6
+
+    PAYMENT = WalletTransaction.PAYMENT
+    VOTE = WalletTransaction.VOTE
+    MINING_REWARD = WalletTransaction.MINING_REWARD
+    PUBLISH = WalletTransaction.PUBLISH
+    CREATE = WalletTransaction.CREATE
 
-    PAYMENT = "payment"
-    VOTE = "vote"
-    MINING_REWARD = "mining_reward"
-    PUBLISH = "publish"
-    CREATE = "create"
+    WINDOW_SIZE = 200
+    MAX_WINDOWS = 5
+
+    column_to_sort_key = {
+        DATETIME: WalletTransaction.SORT_DATE,
+        AMOUNT: WalletTransaction.SORT_AMOUNT,
+        BALANCE: WalletTransaction.SORT_BALANCE,
+    }
 
     transaction_type_to_text = {
         PAYMENT: "Payment",
@@ -195,25 +156,18 @@ class TransactionHistoryTableModel(QAbstractTableModel):
         self.info_icon = QIcon()
         self.info_icon.addPixmap(QPixmap(":/images/resources/info_circle.svg"), QIcon.Normal, QIcon.Off)
 
-        self.wallet_transactions_left = True
-
-        self.num_unconfirmed_raw = 0
-        self.num_unconfirmed_processed = 0
-
-        self.balance = 0
-        self.raw_txs = []
-        self.txs = []
-        self.sort_index = self.DATETIME
-        self.sort_order = Qt.AscendingOrder
+        self.num_rows = 0
+        self.balance_offset = 0
+        self.windows = OrderedDict()
+        self.sort_key = WalletTransaction.SORT_DATE
+        self.sort_column = self.DATETIME
+        self.descending = True
         signals.wallet_transactions_changed.connect(self.wallet_transactions_changed)
-        signals.balance_changed.connect(self.balance_changed)
         signals.profile_changed.connect(self.profile_changed)
-
-    def insert_db_data(self, data):
-        self.txs = self.txs + [data]
+        self.wallet_transactions_changed()
 
     def rowCount(self, parent=None, *args, **kwargs):
-        return len(self.txs)
+        return self.num_rows
 
     def columnCount(self, parent=None, *args, **kwargs):
         return len(self.header)
@@ -223,22 +177,44 @@ class TransactionHistoryTableModel(QAbstractTableModel):
             return self.header[col]
         return None
 
+    def row(self, row):
+        """(tx_type, time, comment, amount, balance, txid, confirmed, ...) of `row` in the current sort order"""
+        start = row - row % self.WINDOW_SIZE
+        window = self.windows.get(start)
+        if window is None:
+            # continue after the previous window while scrolling down instead of counting rows from the top
+            previous = self.windows.get(start - self.WINDOW_SIZE)
+            after = None
+            if previous and len(previous) == self.WINDOW_SIZE:
+                after = WalletTransaction.sort_values(previous[-1], self.sort_key)
+            with data_session_scope() as session:
+                window = WalletTransaction.get_window(
+                    session, self.sort_key, self.descending, start, self.WINDOW_SIZE, after)
+            self.windows[start] = window
+            if len(self.windows) > self.MAX_WINDOWS:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(start)
+        if row - start >= len(window):
+            # the table changed, a refresh is pending
+            return None
+        return window[row - start]
+
     def data(self, index, role=Qt.DisplayRole):
         row, col = index.row(), index.column()
-        tx = self.txs[row]
+        tx = self.row(row)
+        if tx is None:
+            return None
         if role == Qt.DisplayRole:
             if col == self.DATETIME:
-                return 'unconfirmed' if tx[col] is None else "{}".format(tx[col])
+                return "{}".format(tx[col]) if tx[self.CONFIRMED] else 'unconfirmed'
             if col == self.AMOUNT:
-                amount = tx[col]
-                if amount == 0:
-                    amount = 0
+                amount = WalletTransaction.to_coins(tx[col])
                 display = "{0:.8f}".format(amount)
                 return '+' + display if amount > 0 else display
             if col == self.BALANCE:
-                if tx[col] is None:
-                    return '-'
-                normalized = tx[col].quantize(Decimal('.01'), rounding=ROUND_DOWN)
+                balance = WalletTransaction.to_coins(tx[col] + self.balance_offset)
+                normalized = balance.quantize(Decimal('.01'), rounding=ROUND_DOWN)
                 display = "{0:n}".format(normalized)
                 return display
             if col == self.TXTYPE:
@@ -254,7 +230,7 @@ class TransactionHistoryTableModel(QAbstractTableModel):
                 return self.info_icon
         if role == Qt.ToolTipRole:
             if col == self.BALANCE:
-                return '_' if tx[col] is None else "{0:n}".format(tx[col])
+                return "{0:n}".format(WalletTransaction.to_coins(tx[col] + self.balance_offset))
             elif col == self.TXTYPE and tx[col] in self.transaction_type_to_text:
                 return self.transaction_type_to_text[tx[col]]
             elif col == self.COMMENT:
@@ -273,181 +249,28 @@ class TransactionHistoryTableModel(QAbstractTableModel):
             return QVariant(font)
         return None
 
-    def canFetchMore(self, index):
-        return len(self.raw_txs) >= 100 and self.wallet_transactions_left
-
-    def fetchMore(self, index):
-        self.fetch_next_wallet_transactions()
-
     def sort(self, p_int, order=None):
-        self.sort_index = p_int
-        self.sort_order = order
+        if p_int not in self.column_to_sort_key:
+            return
         self.layoutAboutToBeChanged.emit()
-        if p_int == self.DATETIME:
-            self.txs.sort(key=lambda x: (datetime.now() if x[p_int] is None else x[p_int], 0-x[self.POS_IN_BLOCK]), reverse=(order != Qt.DescendingOrder))
-        else:
-            self.txs.sort(key=lambda x: x[p_int], reverse=(order != Qt.DescendingOrder))
+        self.sort_key = self.column_to_sort_key[p_int]
+        self.sort_column = p_int
+        self.descending = order == Qt.DescendingOrder
+        self.windows.clear()
         self.layoutChanged.emit()
 
-    def wallet_transactions_changed(self, transactions):
-        if len(self.raw_txs) == 0:
-            self.beginResetModel()
-            self.raw_txs = transactions
-            self.num_unconfirmed_processed = 0
-            self.num_unconfirmed_raw = 0
-            self.txs = self.process_wallet_transactions(transactions)
-            self.endResetModel()
-            self.sort(self.sort_index, self.sort_order)
-        else:
-            # handle unconfirmed
-            if self.num_unconfirmed_raw > 0:
-                self.beginRemoveRows(QModelIndex(), 0, self.num_unconfirmed_processed)
-                self.raw_txs = self.raw_txs[:len(self.raw_txs)-self.num_unconfirmed_raw]
-                self.txs = self.txs[self.num_unconfirmed_processed:]
-                self.endRemoveRows()
-            # insert new transactions
-            latest_tx_id = ''
-            if len(self.raw_txs) > 0:
-                latest_tx_id = self.raw_txs[-1]["txid"]
-            new_txs = []
-            for tx in reversed(transactions):
-                if tx["txid"] != latest_tx_id:
-                    new_txs = [tx] + new_txs
-                else:
-                    break
-
-            self.num_unconfirmed_processed = 0
-            self.num_unconfirmed_raw = 0
-            processed_txs = self.process_wallet_transactions(new_txs)
-            self.beginInsertRows(QModelIndex(), 0, len(new_txs))
-            self.raw_txs += new_txs
-            self.txs = processed_txs + self.txs
-            self.endInsertRows()
-
-    def balance_changed(self, balance):
-        self.balance = Decimal(balance).quantize(Decimal("0.00000001"), rounding=ROUND_DOWN)
-
-    def fetch_next_wallet_transactions(self):
-        client = get_active_rpc_client()
-        new_txs = []
-        try:
-            new_txs = client.listwallettransactions(100, len(self.raw_txs), False, True)
-            if len(new_txs) < 100:
-                self.wallet_transactions_left = False
-        except Exception as e:
-            log.debug(e)
-        last_balance = self.txs[-1][self.BALANCE] if len(self.txs)>0 else self.balance
-        processed_transactions = self.process_wallet_transactions(new_txs, last_balance)
-        self.beginInsertRows(QModelIndex(), len(self.txs), len(self.txs)+len(processed_transactions))
-        self.raw_txs = new_txs + self.raw_txs
-        self.txs += processed_transactions
-        self.endInsertRows()
+    def wallet_transactions_changed(self):
+        with data_session_scope() as session:
+            num_rows = WalletTransaction.count(session)
+            balance_offset = WalletTransaction.balance_offset(session)
+        self.beginResetModel()
+        self.num_rows = num_rows
+        self.balance_offset = balance_offset
+        self.windows.clear()
+        self.endResetModel()
 
     def profile_changed(self, profile):
-        if profile.balance != self.balance:
-            self.balance_changed(profile.balance)
-            self.beginResetModel()
-            self.num_unconfirmed_processed = 0
-            self.num_unconfirmed_raw = 0
-            self.txs = self.process_wallet_transactions(self.raw_txs)
-            self.endResetModel()
-            self.sort(self.sort_index, self.sort_order)
-
-    def process_wallet_transactions(self, transactions, total_balance=None):
-        processed_transactions = []
-        sum_transaction_above = 0
-        if total_balance is None:
-            total_balance = self.balance
-        for tx in reversed(transactions):
-            if tx.get("valid") is False:
-                continue
-            txid = tx["txid"]
-            amount = tx["balance"]["amount"]
-            is_payment = True
-            balance = Decimal(total_balance) - Decimal(sum_transaction_above)
-            sum_transaction_above += amount
-            unconfirmed = not tx.get("blocktime")
-            if unconfirmed:
-                self.num_unconfirmed_raw += 1
-            timestamp = datetime.fromtimestamp(tx["blocktime"]) if tx.get("blocktime") else None
-            pos_in_block = tx.get('blockindex', 0)
-            if tx.get("generated"):
-                processed_transactions.append((
-                    self.MINING_REWARD,
-                    timestamp,
-                    '',
-                    amount,
-                    balance,
-                    txid,
-                    pos_in_block
-                ))
-                amount = 0
-                is_payment = False
-                if unconfirmed:
-                    self.num_unconfirmed_processed += 1
-            for item in tx["items"]:
-                processed_transactions.append((
-                    self.PUBLISH,
-                    timestamp,
-                    'Stream:"{}" , Keys: "{}"'.format(item['name'], "-".join(item['keys'])),
-                    amount,
-                    balance,
-                    txid,
-                    pos_in_block
-                ))
-                amount = 0
-                is_payment = False
-                if unconfirmed:
-                    self.num_unconfirmed_processed += 1
-            for perm in tx["permissions"]:
-                processed_transactions.append((
-                    self.VOTE,
-                    timestamp,
-                    '',
-                    amount,
-                    balance,
-                    txid,
-                    pos_in_block
-                ))
-                amount = 0
-                is_payment = False
-                if unconfirmed:
-                    self.num_unconfirmed_processed += 1
-            if tx.get("create"):
-                processed_transactions.append((
-                    "Create",
-                    timestamp,
-                    'Type:"' + tx['create']['type'] + '", Name: "' + tx['create']['name'] + '"',
-                    amount,
-                    balance,
-                    txid,
-                    pos_in_block
-                ))
-                amount = 0
-                is_payment = False
-                if unconfirmed:
-                    self.num_unconfirmed_processed += 1
-            if is_payment:
-                comment = ''
-                if tx.get("comment"):
-                    comment = tx.get("comment")
-                elif tx.get("data"):
-                    for data_item in tx.get("data"):
-                        if "json" in data_item and "comment" in data_item["json"]:
-                            comment = data_item["json"]["comment"]
-                processed_transactions.append((
-                    self.PAYMENT,
-                    timestamp,
-                    comment,
-                    amount,
-                    balance,
-                    txid,
-                    pos_in_block
-                ))
-                if unconfirmed:
-                    self.num_unconfirmed_processed += 1
-
-        return processed_transactions
+        self.wallet_transactions_changed()
 
 
 class WalletHistoryHeader(QHeaderView):
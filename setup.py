@@ -68,6 +68,18 @@ executables = [
         shortcutName='Content Blockchain 2',
         shortcutDir='DesktopFolder',
         copyright='Copyright (C) 2018 The Content Blockchain Project',
+    ),
+    # Helper that the managed node runs on -blocknotify/-walletnotify
+    Executable(
+        'app/notify.py',
+        base=base,
+        targetName='coblo2-notify.exe',
+    ),
+    # Command line tools (batch timestamping)
+    Executable(
+        'app/cli.py',
+        base=None,
+        targetName='coblo2-cli.exe',
     )
 ]
 